@@ -2,6 +2,7 @@ import datetime
 from functools import partial
 
 from manageiq_client.api import APIException
+from sqlalchemy import func, select
 from widgetastic.widget import View, Text
 from widgetastic_patternfly import Input, Button
 
@@ -52,10 +53,57 @@ def all_types():
     return all_types
 
 
+def ems_count(table_name, **filters):
+    """Returns a :py:attr:`BaseProvider.DB_COUNTS` entry counting the rows of a table that belong
+    to the provider through their ``ems_id`` column.
+
+    Args:
+        table_name: Name of the table; e.g. 'vms' or 'hosts'
+        **filters: Column values the counted rows must have; e.g. ``template=True``
+    """
+    def count(db, ems):
+        table = db[table_name]
+        query = select([func.count()]).select_from(table.__table__).where(table.ems_id == ems.id)
+        for column, value in filters.items():
+            query = query.where(getattr(table, column) == value)
+        return query
+    return count
+
+
+def inventory_counts(appliance, providers, *stats):
+    """Counts the inventory of the providers, with a single query per provider class.
+
+    Args:
+        appliance: The appliance whose database is queried.
+        providers: Providers to count the inventory of.
+        *stats: Names of the counts, see :py:attr:`BaseProvider.DB_COUNTS`, all of them by default.
+
+    Returns:
+        :py:class:`dict` of provider name to a :py:class:`dict` of stat name to count.
+    """
+    db = appliance.db
+    ems = db['ext_management_systems']
+    by_class = {}
+    for provider in providers:
+        by_class.setdefault(type(provider), []).append(provider.name)
+    counts = {}
+    for provider_class, names in by_class.items():
+        class_stats = stats or sorted(provider_class.DB_COUNTS)
+        columns = [
+            provider_class.DB_COUNTS[stat](db, ems).as_scalar().label(stat)
+            for stat in class_stats]
+        for row in db.session.query(ems.name, *columns).filter(ems.name.in_(names)):
+            counts[row[0]] = {stat: int(count) for stat, count in zip(class_stats, row[1:])}
+    return counts
+
+
 class BaseProvider(Taggable, Updateable, SummaryMixin, Navigatable):
     # List of constants that every non-abstract subclass must have defined
     _param_name = ParamClassName('name')
     STATS_TO_MATCH = []
+    # Stats counted in the database: function(db, ext_management_systems table) returning
+    # the count of the provider's items correlated to the provider's row, see ems_count
+    DB_COUNTS = {}
     string_name = ""
     page_name = ""
     edit_page_suffix = ""
@@ -459,12 +507,41 @@ class BaseProvider(Taggable, Updateable, SummaryMixin, Navigatable):
         Args:
             table_str: Name of the table; e.g. 'vms' or 'hosts'
         """
-        res = self.appliance.db.engine.execute(
-            "SELECT count(*) "
-            "FROM ext_management_systems, {0} "
-            "WHERE {0}.ems_id=ext_management_systems.id "
-            "AND ext_management_systems.name='{1}'".format(table_str, self.name))
-        return int(res.first()[0])
+        db = self.appliance.db
+        ems = db['ext_management_systems']
+        table = db[table_str]
+        return (db.session.query(func.count(table.id))
+                .join(ems, table.ems_id == ems.id)
+                .filter(ems.name == self.name).scalar())
+
+    def inventory_counts(self, *stats):
+        """ Counts the provider's inventory in the database with a single query
+
+        Args:
+            *stats: Names of the counts, see :py:attr:`DB_COUNTS`, all of them by default.
+
+        Returns:
+            :py:class:`dict` of stat name to count.
+        """
+        return inventory_counts(self.appliance, [self], *stats).get(
+            self.name, {stat: 0 for stat in stats or self.DB_COUNTS})
+
+    def _db_count(self, stat):
+        return self.inventory_counts(stat)[stat]
+
+    def _default_db_stats(self, stats):
+        """ The stats whose default variant counts in the database, they are counted at once"""
+        result = []
+        for stat in stats:
+            if stat not in self.DB_COUNTS:
+                continue
+            for cls in type(self).__mro__:
+                if stat in vars(cls):
+                    attr = vars(cls)[stat]
+                    if isinstance(attr, variable) and attr.is_default('db'):
+                        result.append(stat)
+                    break
+        return result
 
     def _do_stats_match(self, client, stats_to_match=None, refresh_timer=None, ui=False):
         """ A private function to match a set of statistics, with a Provider.
@@ -494,9 +571,15 @@ class BaseProvider(Taggable, Updateable, SummaryMixin, Navigatable):
                 self.refresh_provider_relationships()
                 refresh_timer.reset()
 
+        # The stats read from the database are all counted by one query
+        db_stats = [] if ui else self._default_db_stats(stats_to_match)
+        db_counts = self.inventory_counts(*db_stats) if db_stats else {}
         for stat in stats_to_match:
             try:
-                cfme_stat = getattr(self, stat)(method=method)
+                if stat in db_counts:
+                    cfme_stat = db_counts[stat]
+                else:
+                    cfme_stat = getattr(self, stat)(method=method)
                 success, value = tol_check(host_stats[stat],
                                            cfme_stat,
                                            min_error=0.05,
@@ -661,6 +744,10 @@ def get_paginator_value():
 
 
 class CloudInfraProvider(BaseProvider, PolicyProfileAssignable):
+    DB_COUNTS = {
+        'num_template': ems_count('vms', template=True),
+        'num_vm': ems_count('vms', template=False),
+    }
     vm_name = ""
     template_name = ""
     detail_page_suffix = 'provider'
@@ -724,13 +811,7 @@ class CloudInfraProvider(BaseProvider, PolicyProfileAssignable):
     @variable(alias="db")
     def num_template(self):
         """ Returns the providers number of templates, as shown on the Details page."""
-        ext_management_systems = self.appliance.db["ext_management_systems"]
-        vms = self.appliance.db["vms"]
-        temlist = list(self.appliance.db.session.query(vms.name)
-                       .join(ext_management_systems, vms.ems_id == ext_management_systems.id)
-                       .filter(ext_management_systems.name == self.name)
-                       .filter(vms.template == True))  # NOQA
-        return len(temlist)
+        return self._db_count('num_template')
 
     @num_template.variant('ui')
     def num_template_ui(self):
@@ -739,13 +820,7 @@ class CloudInfraProvider(BaseProvider, PolicyProfileAssignable):
     @variable(alias="db")
     def num_vm(self):
         """ Returns the providers number of instances, as shown on the Details page."""
-        ext_management_systems = self.appliance.db["ext_management_systems"]
-        vms = self.appliance.db["vms"]
-        vmlist = list(self.appliance.db.session.query(vms.name)
-                      .join(ext_management_systems, vms.ems_id == ext_management_systems.id)
-                      .filter(ext_management_systems.name == self.name)
-                      .filter(vms.template == False))  # NOQA
-        return len(vmlist)
+        return self._db_count('num_vm')
 
     @num_vm.variant('ui')
     def num_vm_ui(self):
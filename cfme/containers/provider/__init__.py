@@ -5,8 +5,9 @@ import json
 
 import fauxfactory
 from navmazing import NavigateToSibling, NavigateToAttribute
+from sqlalchemy import func, select
 
-from cfme.common.provider import BaseProvider
+from cfme.common.provider import BaseProvider, ems_count
 from cfme import exceptions
 from cfme.fixtures import pytest_selenium as sel
 from cfme.web_ui import (
@@ -28,6 +29,20 @@ cfg_btn = partial(tb.select, 'Configuration')
 mon_btn = partial(tb.select, 'Monitoring')
 pol_btn = partial(tb.select, 'Policy')
 
+
+def _container_count(db, ems):
+    # Containers are linked to providers through container definitions and then through pods
+    containers = db['containers']
+    definitions = db['container_definitions']
+    groups = db['container_groups']
+    return (select([func.count()])
+            .select_from(containers.__table__
+                         .join(definitions.__table__,
+                               containers.container_definition_id == definitions.id)
+                         .join(groups.__table__, definitions.container_group_id == groups.id))
+            .where(groups.ems_id == ems.id))
+
+
 details_page = Region(infoblock_type='detail')
 
 
@@ -105,6 +120,17 @@ class ContainersProvider(BaseProvider, Pretty):
         'num_image_registry',
         'num_container']
     # TODO add 'num_volume'
+    DB_COUNTS = {
+        'num_project': ems_count('container_projects'),
+        'num_service': ems_count('container_services'),
+        'num_replication_controller': ems_count('container_replicators'),
+        'num_container_group': ems_count('container_groups'),
+        'num_pod': ems_count('container_groups'),
+        'num_node': ems_count('container_nodes'),
+        'num_container': _container_count,
+        'num_image': ems_count('container_images'),
+        'num_image_registry': ems_count('container_image_registries'),
+    }
     string_name = "Containers"
     page_name = "containers"
     detail_page_suffix = 'provider_detail'
@@ -174,7 +200,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_project(self):
-        return self._num_db_generic('container_projects')
+        return self._db_count('num_project')
 
     @num_project.variant('ui')
     def num_project_ui(self):
@@ -182,7 +208,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_service(self):
-        return self._num_db_generic('container_services')
+        return self._db_count('num_service')
 
     @num_service.variant('ui')
     def num_service_ui(self):
@@ -194,7 +220,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_replication_controller(self):
-        return self._num_db_generic('container_replicators')
+        return self._db_count('num_replication_controller')
 
     @num_replication_controller.variant('ui')
     def num_replication_controller_ui(self):
@@ -202,7 +228,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_container_group(self):
-        return self._num_db_generic('container_groups')
+        return self._db_count('num_container_group')
 
     @num_container_group.variant('ui')
     def num_container_group_ui(self):
@@ -220,7 +246,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_node(self):
-        return self._num_db_generic('container_nodes')
+        return self._db_count('num_node')
 
     @num_node.variant('ui')
     def num_node_ui(self):
@@ -228,15 +254,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_container(self):
-        # Containers are linked to providers through container definitions and then through pods
-        res = self.appliance.db.engine.execute(
-            "SELECT count(*) "
-            "FROM ext_management_systems, container_groups, container_definitions, containers "
-            "WHERE containers.container_definition_id=container_definitions.id "
-            "AND container_definitions.container_group_id=container_groups.id "
-            "AND container_groups.ems_id=ext_management_systems.id "
-            "AND ext_management_systems.name='{}'".format(self.name))
-        return int(res.first()[0])
+        return self._db_count('num_container')
 
     @num_container.variant('ui')
     def num_container_ui(self):
@@ -244,7 +262,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_image(self):
-        return self._num_db_generic('container_images')
+        return self._db_count('num_image')
 
     @num_image.variant('ui')
     def num_image_ui(self):
@@ -256,7 +274,7 @@ class ContainersProvider(BaseProvider, Pretty):
 
     @variable(alias='db')
     def num_image_registry(self):
-        return self._num_db_generic('container_image_registries')
+        return self._db_count('num_image_registry')
 
     @num_image_registry.variant('ui')
     def num_image_registry_ui(self):
@@ -1,5 +1,6 @@
 from cached_property import cached_property
 
+from cfme.common.provider import ems_count
 from . import ContainersProvider
 from utils.varmeth import variable
 from utils.path import data_path
@@ -19,6 +20,10 @@ class CustomAttribute(object):
 class OpenshiftProvider(ContainersProvider):
     num_route = ['num_route']
     STATS_TO_MATCH = ContainersProvider.STATS_TO_MATCH + num_route
+    DB_COUNTS = dict(
+        ContainersProvider.DB_COUNTS,
+        num_route=ems_count('container_routes'),
+        num_template=ems_count('container_templates'))
     type_name = "openshift"
     mgmt_class = Openshift
     db_types = ["Openshift::ContainerManager"]
@@ -80,7 +85,7 @@ class OpenshiftProvider(ContainersProvider):
 
     @variable(alias='db')
     def num_route(self):
-        return self._num_db_generic('container_routes')
+        return self._db_count('num_route')
 
     @num_route.variant('ui')
     def num_route_ui(self):
@@ -88,7 +93,7 @@ class OpenshiftProvider(ContainersProvider):
 
     @variable(alias='db')
     def num_template(self):
-        return self._num_db_generic('container_templates')
+        return self._db_count('num_template')
 
     @num_template.variant('ui')
     def num_template_ui(self):
@@ -68,7 +68,7 @@ def vporizer(appliance):
     )
     for table, resource_type in tables_2_names:
         ids = []
-        for resource in db.session.query(table).all():
+        for resource in db.stream(db.session.query(table.id)):
             def get_resource_vpor_data():
                 return vpor.__table__.select().where(
                     (vpor.resource_id == resource.id) &
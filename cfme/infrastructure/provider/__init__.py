@@ -6,9 +6,10 @@ from widgetastic.utils import Fillable
 
 from cached_property import cached_property
 from navmazing import NavigateToSibling, NavigateToObject
+from sqlalchemy import distinct, func, select
 
 from cfme.base.ui import Server
-from cfme.common.provider import CloudInfraProvider, DefaultEndpoint
+from cfme.common.provider import CloudInfraProvider, DefaultEndpoint, ems_count
 from cfme.common.provider_views import (ProviderAddView,
                                         ProviderEditView,
                                         ProviderDetailsView,
@@ -34,6 +35,15 @@ from utils.wait import wait_for
 match_page = partial(match_location, controller='ems_infra', title='Infrastructure Providers')
 
 
+def _datastore_count(db, ems):
+    hosts, storages, host_storages = db['hosts'], db['storages'], db['host_storages']
+    return (select([func.count(distinct(storages.name))])
+            .select_from(hosts.__table__
+                         .join(host_storages.__table__, hosts.id == host_storages.host_id)
+                         .join(storages.__table__, storages.id == host_storages.storage_id))
+            .where(hosts.ems_id == ems.id))
+
+
 class InfraProvider(Pretty, CloudInfraProvider, Fillable):
     """
     Abstract model of an infrastructure provider in cfme. See VMwareProvider or RHEVMProvider.
@@ -59,6 +69,11 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
     category = "infra"
     pretty_attrs = ['name', 'key', 'zone']
     STATS_TO_MATCH = ['num_template', 'num_vm', 'num_datastore', 'num_host', 'num_cluster']
+    DB_COUNTS = dict(
+        CloudInfraProvider.DB_COUNTS,
+        num_datastore=_datastore_count,
+        num_host=ems_count('hosts'),
+        num_cluster=ems_count('ems_clusters'))
     string_name = "Infrastructure"
     page_name = "infrastructure"
     templates_destination_name = "Templates"
@@ -138,14 +153,7 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
     @variable(alias='db')
     def num_datastore(self):
         """ Returns the providers number of templates, as shown on the Details page."""
-        results = list(self.appliance.db.engine.execute(
-            'SELECT DISTINCT storages.name, hosts.ems_id '
-            'FROM ext_management_systems ems, hosts, storages st, host_storages hst'
-            'WHERE hosts.id=hst.host_id AND '
-            'st.id=hst.storage_id AND '
-            'hosts.ems_id=ems.id AND '
-            'ems.name=\'{}\''.format(self.name)))
-        return len(results)
+        return self._db_count('num_datastore')
 
     @num_datastore.variant('ui')
     def num_datastore_ui(self):
@@ -162,12 +170,7 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
 
     @num_host.variant('db')
     def num_host_db(self):
-        ext_management_systems = self.appliance.db["ext_management_systems"]
-        hosts = self.appliance.db["hosts"]
-        hostlist = list(self.appliance.db.session.query(hosts.name)
-                        .join(ext_management_systems, hosts.ems_id == ext_management_systems.id)
-                        .filter(ext_management_systems.name == self.name))
-        return len(hostlist)
+        return self._db_count('num_host')
 
     @num_host.variant('ui')
     def num_host_ui(self):
@@ -196,13 +199,7 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
     @num_cluster.variant('db')
     def num_cluster_db(self):
         """ Returns the providers number of templates, as shown on the Details page."""
-        ext_management_systems = self.appliance.db["ext_management_systems"]
-        clusters = self.appliance.db["ems_clusters"]
-        clulist = list(self.appliance.db.session.query(clusters.name)
-                       .join(ext_management_systems,
-                             clusters.ems_id == ext_management_systems.id)
-                       .filter(ext_management_systems.name == self.name))
-        return len(clulist)
+        return self._db_count('num_cluster')
 
     @num_cluster.variant('ui')
     def num_cluster_ui(self):
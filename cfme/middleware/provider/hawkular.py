@@ -1,6 +1,9 @@
 import re
 
+from sqlalchemy import func, select
+
 from cfme.common import TopologyMixin, TimelinesMixin
+from cfme.common.provider import ems_count
 from . import MiddlewareProvider
 from utils.appliance import Navigatable
 from utils.varmeth import variable
@@ -10,6 +13,15 @@ from utils.appliance.implementations.ui import navigate_to
 from wrapanapi.hawkular import Hawkular
 
 
+def _server_group_count(db, ems):
+    domains = db['middleware_domains']
+    server_groups = db['middleware_server_groups']
+    return (select([func.count()])
+            .select_from(server_groups.__table__
+                         .join(domains.__table__, domains.id == server_groups.domain_id))
+            .where(domains.ems_id == ems.id))
+
+
 class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, MiddlewareProvider):
     """
     HawkularProvider class holds provider data. Used to perform actions on hawkular provider page
@@ -33,6 +45,14 @@ class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, Middleware
     """
     STATS_TO_MATCH = MiddlewareProvider.STATS_TO_MATCH +\
         ['num_server', 'num_domain', 'num_deployment', 'num_datasource', 'num_messaging']
+    DB_COUNTS = {
+        'num_deployment': ems_count('middleware_deployments'),
+        'num_server': ems_count('middleware_servers'),
+        'num_server_group': _server_group_count,
+        'num_datasource': ems_count('middleware_datasources'),
+        'num_domain': ems_count('middleware_domains'),
+        'num_messaging': ems_count('middleware_messagings'),
+    }
     property_tuples = MiddlewareProvider.property_tuples +\
         [('name', 'Name'), ('hostname', 'Host Name'), ('port', 'Port'), ('provider_type', 'Type')]
     type_name = "hawkular"
@@ -62,7 +82,7 @@ class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, Middleware
 
     @variable(alias='db')
     def num_deployment(self):
-        return self._num_db_generic('middleware_deployments')
+        return self._db_count('num_deployment')
 
     @num_deployment.variant('ui')
     def num_deployment_ui(self, reload_data=True):
@@ -71,7 +91,7 @@ class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, Middleware
 
     @variable(alias='db')
     def num_server(self):
-        return self._num_db_generic('middleware_servers')
+        return self._db_count('num_server')
 
     @num_server.variant('ui')
     def num_server_ui(self, reload_data=True):
@@ -80,17 +100,11 @@ class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, Middleware
 
     @variable(alias='db')
     def num_server_group(self):
-        res = self.appliance.db.engine.execute(
-            "SELECT count(*) "
-            "FROM ext_management_systems, middleware_domains, middleware_server_groups "
-            "WHERE middleware_domains.ems_id=ext_management_systems.id "
-            "AND middleware_domains.id=middleware_server_groups.domain_id "
-            "AND ext_management_systems.name='{0}'".format(self.name))
-        return int(res.first()[0])
+        return self._db_count('num_server_group')
 
     @variable(alias='db')
     def num_datasource(self):
-        return self._num_db_generic('middleware_datasources')
+        return self._db_count('num_datasource')
 
     @num_datasource.variant('ui')
     def num_datasource_ui(self, reload_data=True):
@@ -99,7 +113,7 @@ class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, Middleware
 
     @variable(alias='db')
     def num_domain(self):
-        return self._num_db_generic('middleware_domains')
+        return self._db_count('num_domain')
 
     @num_domain.variant('ui')
     def num_domain_ui(self, reload_data=True):
@@ -108,7 +122,7 @@ class HawkularProvider(MiddlewareBase, TopologyMixin, TimelinesMixin, Middleware
 
     @variable(alias='db')
     def num_messaging(self):
-        return self._num_db_generic('middleware_messagings')
+        return self._db_count('num_messaging')
 
     @num_messaging.variant('ui')
     def num_messaging_ui(self, reload_data=True):
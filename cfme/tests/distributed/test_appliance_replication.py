@@ -13,6 +13,7 @@ import cfme.fixtures.pytest_selenium as sel
 
 from utils import version
 from utils.appliance import provision_appliance, current_appliance
+from utils.appliance.group import ApplianceGroup
 from utils.appliance.implementations.ui import navigate_to
 from utils.conf import credentials
 from utils.log import logger
@@ -70,11 +71,13 @@ def get_replication_appliances():
     ver_to_prov = str(version.current_version())
     appl1 = provision_appliance(ver_to_prov, 'long-test_repl_A')
     appl2 = provision_appliance(ver_to_prov, 'long-test_repl_B')
-    appl1.configure(region=1)
-    appl1.ipapp.wait_for_web_ui()
     update_appliance_uuid(appl2.address)
-    appl2.configure(region=2, key_address=appl1.address)
-    appl2.ipapp.wait_for_web_ui()
+    # appl2 fetches the key from appl1, the web UIs come up concurrently
+    group = ApplianceGroup([appl1, appl2], requires={appl2: [appl1]})
+    group.configure(appliance_kwargs={
+        appl1: {'region': 1},
+        appl2: {'region': 2, 'key_address': appl1.address}})
+    group.wait_for_web_ui(requires={})
     return (appl1, appl2)
 
 
@@ -85,11 +88,10 @@ def get_distributed_appliances():
     ver_to_prov = str(version.current_version())
     appl1 = provision_appliance(ver_to_prov, 'long-test_childDB_A')
     appl2 = provision_appliance(ver_to_prov, 'long-test_childDB_B')
-    appl1.configure(region=1, patch_ajax_wait=False)
-    appl1.ipapp.wait_for_web_ui()
-    appl2.configure(region=1, patch_ajax_wait=False, key_address=appl1.address,
-                    db_address=appl1.address)
-    appl2.ipapp.wait_for_web_ui()
+    group = ApplianceGroup([appl1, appl2], requires={appl2: [appl1]})
+    group.configure(region=1, patch_ajax_wait=False, appliance_kwargs={
+        appl2: {'key_address': appl1.address, 'db_address': appl1.address}})
+    group.wait_for_web_ui(requires={})
     return (appl1, appl2)
 
 
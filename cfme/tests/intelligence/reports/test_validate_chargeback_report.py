@@ -21,7 +21,6 @@ from fixtures.provider import setup_or_skip
 from utils import testgen
 from utils.blockers import BZ
 from utils.log import logger
-from utils.wait import wait_for
 
 
 pytestmark = [
@@ -156,24 +155,20 @@ def assign_custom_rate(new_compute_rate, provider):
     enterprise.storageassign()
 
 
-def verify_records_rollups_table(appliance, provider):
-    # Verify that rollups are present in the metric_rollups table.
+def rollups_with_cpu_usage(appliance, provider):
+    # Query of the hourly rollups with CPU usage in the metric_rollups table.
     vm_name = provider.data['cap_and_util']['chargeback_vm']
     ems = appliance.db['ext_management_systems']
     rollups = appliance.db['metric_rollups']
 
-    with appliance.db.transaction:
-        result = (
-            appliance.db.session.query(rollups.id)
-            .join(ems, rollups.parent_ems_id == ems.id)
-            .filter(rollups.capture_interval_name == 'hourly', rollups.resource_name == vm_name,
-            ems.name == provider.name, rollups.timestamp >= date.today())
-        )
-
-    for record in appliance.db.session.query(rollups).filter(rollups.id.in_(result.subquery())):
-        if record.cpu_usagemhz_rate_average:
-            return True
-    return False
+    return (
+        appliance.db.session.query(rollups.id)
+        .join(ems, rollups.parent_ems_id == ems.id)
+        .filter(rollups.capture_interval_name == 'hourly', rollups.resource_name == vm_name,
+        ems.name == provider.name, rollups.timestamp >= date.today(),
+        rollups.cpu_usagemhz_rate_average != 0)
+        .limit(1)
+    )
 
 
 @pytest.fixture(scope="module")
@@ -216,8 +211,8 @@ def resource_usage(vm_ownership, appliance, provider):
     command = ('Metric::Targets.perf_capture_always = {:storage=>false, :host_and_cluster=>false};')
     appliance.ssh_client.run_rails_command(command, timeout=None)
 
-    wait_for(verify_records_rollups_table, [appliance, provider], timeout=360, fail_condition=False,
-        message='Waiting for hourly rollups')
+    appliance.db_poller.wait_for(rollups_with_cpu_usage(appliance, provider), num_sec=360,
+        message='wait for the hourly rollups')
 
     # Since we are collecting C&U data for > 1 hour, there will be multiple hourly records per VM
     # in the metric_rollups DB table.The values from these hourly records are summed up.
@@ -230,14 +225,17 @@ def resource_usage(vm_ownership, appliance, provider):
             ems.name == provider.name, rollups.timestamp >= date.today())
         )
 
-    for record in appliance.db.session.query(rollups).filter(rollups.id.in_(result.subquery())):
+    # Only the summed up columns are streamed, in a single pass over the records
+    records = appliance.db.session.query(
+        rollups.cpu_usagemhz_rate_average, rollups.derived_memory_used,
+        rollups.net_usage_rate_average, rollups.disk_usage_rate_average,
+        rollups.derived_vm_used_disk_storage).filter(rollups.id.in_(result.subquery()))
+    for record in appliance.db.stream(records):
         if record.cpu_usagemhz_rate_average:
             average_cpu_used_in_mhz = average_cpu_used_in_mhz + record.cpu_usagemhz_rate_average
             average_memory_used_in_mb = average_memory_used_in_mb + record.derived_memory_used
             average_network_io = average_network_io + record.net_usage_rate_average
             average_disk_io = average_disk_io + record.disk_usage_rate_average
-
-    for record in appliance.db.session.query(rollups).filter(rollups.id.in_(result.subquery())):
         if record.derived_vm_used_disk_storage:
             average_storage_used = average_storage_used + record.derived_vm_used_disk_storage
 
@@ -62,6 +62,7 @@ pytest_plugins = (
     'fixtures.qa_contact',
     'fixtures.randomness',
     'fixtures.rbac',
+    'fixtures.resource_sampler',
     'fixtures.screenshots',
     'fixtures.soft_assert',
     'fixtures.ssh_client',
@@ -0,0 +1,98 @@
+# Evaluates Ruby code sent by the integration tests in the Rails environment of the appliance.
+#
+# Requests and responses are JSON objects:
+#   request:  {"code": "Ruby code", "args": {...}, "token": "..."}, the code gets ``args``
+#   response: {"rc": 0 or 1, "output": "printed output and errors", "value": <last value>}
+#
+# bin/rails runner rails_runner.rb PORT
+#   Serves the requests (one per connection) on 127.0.0.1:PORT. Rails is booted only once, every
+#   request is evaluated in a forked child, so it can not break the server or the other requests.
+#   The port is open to every local user, so only the requests carrying the token the server
+#   wrote to TOKEN_FILE (readable by root only) are evaluated, the others get "denied": true.
+# bin/rails runner rails_runner.rb --once REQUEST_FILE
+#   Evaluates a single request read from the file, the response is printed after RESPONSE_MARKER.
+require 'json'
+require 'securerandom'
+require 'socket'
+require 'stringio'
+
+RESPONSE_MARKER = 'RAILS_RUNNER_RESPONSE:'.freeze
+TOKEN_FILE = '/root/rails_runner/token'.freeze
+
+def sandbox(args)
+  binding
+end
+
+def evaluate(request)
+  output = StringIO.new
+  $stdout = output
+  begin
+    value = sandbox(request['args'] || {}).eval(request['code'])
+    value = begin
+      value.as_json
+    rescue StandardError
+      value.inspect
+    end
+    {'rc' => 0, 'output' => output.string, 'value' => value}
+  rescue Exception => e
+    output.puts("#{e.class}: #{e.message}", *e.backtrace)
+    {'rc' => 1, 'output' => output.string, 'value' => nil}
+  ensure
+    $stdout = STDOUT
+  end
+end
+
+def write_token
+  token = SecureRandom.hex(32)
+  File.unlink(TOKEN_FILE) if File.exist?(TOKEN_FILE)
+  File.open(TOKEN_FILE, File::WRONLY | File::CREAT | File::EXCL, 0o600) { |f| f.write(token) }
+  token
+end
+
+def authorized?(request, token)
+  given = request['token'].to_s
+  given.bytesize == token.bytesize && ActiveSupport::SecurityUtils.secure_compare(given, token)
+end
+
+def handle(client, token)
+  response = begin
+    request = JSON.parse(client.gets)
+    if authorized?(request, token)
+      # The child gets its own database connection and fresh settings, the server keeps none
+      ActiveRecord::Base.establish_connection
+      Vmdb::Settings.reload! if defined?(Vmdb::Settings) && Vmdb::Settings.respond_to?(:reload!)
+      evaluate(request)
+    else
+      {'rc' => 1, 'output' => 'Invalid rails runner token', 'value' => nil, 'denied' => true}
+    end
+  rescue Exception => e
+    {'rc' => 1, 'output' => "#{e.class}: #{e.message}", 'value' => nil}
+  end
+  client.write(JSON.generate(response))
+ensure
+  client.close
+end
+
+def serve(port)
+  token = write_token
+  server = TCPServer.new('127.0.0.1', port)
+  ActiveRecord::Base.connection_pool.disconnect!
+  loop do
+    client = server.accept
+    pid = fork do
+      server.close
+      handle(client, token)
+      # Skip the at_exit handlers of the server process
+      exit!(0)
+    end
+    client.close
+    Process.detach(pid)
+  end
+end
+
+if ARGV[0] == '--once'
+  response = evaluate(JSON.parse(File.read(ARGV[1])))
+  STDOUT.puts(RESPONSE_MARKER + JSON.generate(response))
+else
+  serve(Integer(ARGV[0] || 8193))
+end
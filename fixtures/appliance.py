@@ -8,10 +8,15 @@ For tests where all you need is a single preconfigured appliance to run a databa
 example, you will want to use the :py:func:`temp_appliance_preconfig` fixture.
 
 For tests that require multiple unconfigured appliances (e.g. replication testing), there is
-:py:func:`temp_appliances_unconfig`.
+:py:func:`temp_appliances_unconfig`. Configure them concurrently with
+:py:class:`utils.appliance.group.ApplianceGroup`.
+
+Destructive test modules that only change the database can use :py:func:`appliance_db_snapshot`
+instead, it restores the database of the appliance once the module is done.
 """
 from contextlib import contextmanager
 
+import fauxfactory
 import pytest
 
 from cfme.test_framework.sprout.client import SproutClient
@@ -110,3 +115,16 @@ def temp_appliances_unconfig_clsscope():
 def temp_appliances_unconfig_funcscope():
     with temp_appliances(count=2, preconfigured=False) as appliances:
         yield appliances
+
+
+@pytest.yield_fixture(scope="module")
+def appliance_db_snapshot(appliance):
+    """Snapshots the database before the module and restores it after, yields the snapshot name
+
+    See :py:meth:`utils.appliance.IPAppliance.snapshot_database`.
+    """
+    name = 'module_{}'.format(fauxfactory.gen_alphanumeric(8).lower())
+    appliance.snapshot_database(name)
+    yield name
+    appliance.restore_database_snapshot(name)
+    appliance.delete_database_snapshot(name)
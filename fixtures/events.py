@@ -42,10 +42,20 @@ certain object's id.
 
 Default match algorithm is ==. Event also accepts match function in order to change default
 match type.
+
+The listener polls the database for the new events. It can wait for the database notifications
+instead, which installs a trigger on event_streams for as long as some listener runs:
+
+Yaml example:
+    .. code-block:: yaml
+
+        event_listener:
+            notify: True
 """
 import logging
 import pytest
 
+from utils.conf import env
 from utils.log import setup_logger
 from utils.wait import wait_for, TimedOutError
 
@@ -100,7 +110,9 @@ def register_event(request, uses_event_listener, soft_assert, appliance):
             register_event(target_type = 'VmOrTemplate', target_name = vm.name,
                 event_type = 'vm_create')
     """
-    event_listener = appliance.event_listener()
+    # The listener falls back to polling if the notification trigger can not be installed
+    event_listener = appliance.event_listener(
+        notify=env.get('event_listener', {}).get('notify', False))
     event_listener.reset_events()
     event_listener.start()
     event_listener.set_last_record()
@@ -8,5 +8,6 @@ def middleware_evm_log_no_error():
                             skip_patterns=['.*ERROR.*API.*MIQ(Api::ApiController.api_error).*'],
                             failure_patterns=['.*ERROR.*'])
     evm_tail.fix_before_start()
+    evm_tail.start_background_validation()
     yield
     evm_tail.validate_logs()
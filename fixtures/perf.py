@@ -1,6 +1,7 @@
 """Fixtures specifically for performance tests."""
 from utils.perf import set_rails_loglevel
 from utils.perf import get_worker_pid
+from utils.perf import PerfTelemetryCollector
 import pytest
 
 
@@ -14,3 +15,11 @@ def cfme_log_level_rails_debug():
 @pytest.yield_fixture(scope='module')
 def ui_worker_pid():
     yield get_worker_pid('MiqUiWorker')
+
+
+@pytest.yield_fixture(scope='module')
+def perf_telemetry():
+    collector = PerfTelemetryCollector()
+    collector.start()
+    yield collector
+    collector.stop()
@@ -0,0 +1,66 @@
+""" Samples the appliance resources during the tests and attaches them to the test reports
+
+Every test gets the samples taken while it ran as a CSV artifact, see
+:py:class:`utils.resource_sampler.ResourceSampler`.
+
+Yaml example:
+    .. code-block:: yaml
+
+        logging:
+           resource_sampler:
+               enabled: True
+               interval: 15
+               # psql opens a new database connection for every sample
+               sample_queue: True
+"""
+import time
+
+import pytest
+
+from fixtures.artifactor_plugin import fire_art_test_hook
+from fixtures.pytest_store import store
+from utils.conf import env
+from utils.resource_sampler import ResourceSampler
+
+sampler_options = env.get('logging', {}).get('resource_sampler', {})
+sampler = None
+
+
+def current_sampler():
+    """Returns the sampler of the current appliance, starting it if needed"""
+    global sampler
+    appliance = store.current_appliance
+    if sampler is None or sampler.appliance != appliance:
+        stop_sampling()
+        sampler = ResourceSampler(
+            appliance, interval=sampler_options.get('interval', 15),
+            sample_queue=sampler_options.get('sample_queue', True))
+        sampler.start()
+    return sampler
+
+
+def stop_sampling():
+    global sampler
+    if sampler is not None:
+        sampler.stop()
+        sampler = None
+
+
+@pytest.mark.hookwrapper
+def pytest_runtest_protocol(item):
+    if not sampler_options.get('enabled'):
+        yield
+        return
+    start = time.time()
+    item_sampler = current_sampler()
+    yield
+    samples = item_sampler.samples_between(start, time.time())
+    if samples:
+        fire_art_test_hook(
+            item, 'filedump', description="Appliance resources",
+            contents=ResourceSampler.to_csv(samples), file_type="appliance_resources",
+            group_id="appliance-resources", slaveid=store.slaveid)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    stop_sampling()
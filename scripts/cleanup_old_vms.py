@@ -16,7 +16,7 @@ from utils.log import logger
 from utils.conf import cfme_data
 from utils.conf import credentials
 from utils.path import log_path
-from utils.ssh import SSHClient
+from utils.ssh import SSHFanout
 from utils.providers import list_provider_keys, get_mgmt
 
 lock = Lock()
@@ -55,31 +55,51 @@ def match(matchers, vm_name):
         return False
 
 
-def get_vm_config_modified_time(name, vm_name, datastore_url, provider_key):
-    try:
-        providers_data = cfme_data.get("management_systems", {})
-        hosts = providers_data[provider_key]['hosts']
-        host_creds = providers_data[provider_key].get('host_credentials', 'host_default')
+def get_vm_config_modified_times(vms, provider_key):
+    """Returns the modified times of the VMs' config files by the VM name
+
+    ``vms`` maps the VM names to (host name, datastore url). The hosts are asked concurrently and
+    all the VMs of a host in one command batch. The VMs whose time could not be found are missing.
+    """
+    providers_data = cfme_data.get("management_systems", {})
+    hosts = providers_data[provider_key]['hosts']
+    host_creds = providers_data[provider_key].get('host_credentials', 'host_default')
+    vms_by_host = defaultdict(list)
+    for vm_name, (name, datastore_url) in vms.items():
         hostname = [host['name'] for host in hosts if name in host['name']]
         if not hostname:
             hostname = re.findall(r'[0-9]+(?:\.[0-9]+){3}', name)
-        connect_kwargs = {
-            'username': credentials[host_creds]['username'],
-            'password': credentials[host_creds]['password'],
-            'hostname': hostname[0]
-        }
+        if not hostname:
+            logger.error('Could not find the host %s of %s', name, vm_name)
+            continue
         datastore_path = re.findall(r'([^ds:`/*].*)', str(datastore_url))
-        ssh_client = SSHClient(**connect_kwargs)
-        command = 'find ~/{}/{} -name {} | xargs  date -r'.format(
-            datastore_path[0], str(vm_name), str(vm_name) + '.vmx')
-        exit_status, output = ssh_client.run_command(command)
-        ssh_client.close()
-        modified_time = parser.parse(output.rstrip())
-        modified_time = modified_time.astimezone(pytz.timezone(str(get_localzone())))
-        return modified_time.replace(tzinfo=None)
-    except Exception as e:
-        logger.error(e)
-        return False
+        vms_by_host[hostname[0]].append((vm_name, datastore_path[0]))
+
+    def get_times(client):
+        host_vms = vms_by_host[client._connect_kwargs['hostname']]
+        results = client.run_commands([
+            'find ~/{}/{} -name {} | xargs  date -r'.format(
+                datastore_path, str(vm_name), str(vm_name) + '.vmx')
+            for vm_name, datastore_path in host_vms])
+        return zip([vm_name for vm_name, _ in host_vms], results)
+
+    fanout = SSHFanout(
+        list(vms_by_host), username=credentials[host_creds]['username'],
+        password=credentials[host_creds]['password'])
+    modified_times = {}
+    for host_result in fanout.map(get_times):
+        if host_result.error is not None:
+            logger.error('Could not get the VM times from %s: %s', host_result.host,
+                host_result.error)
+            continue
+        for vm_name, result in host_result.result:
+            try:
+                modified_time = parser.parse(result.output.rstrip())
+                modified_time = modified_time.astimezone(pytz.timezone(str(get_localzone())))
+                modified_times[vm_name] = modified_time.replace(tzinfo=None)
+            except Exception as e:
+                logger.error(e)
+    return modified_times
 
 
 def list_provider_vms(provider_key):
@@ -111,6 +131,14 @@ def process_provider_vms(provider_key, provider_type, matchers,
         if list_vms:
             list_provider_vms(provider_key)
 
+        def check_vm(vm_name, vm_creation_time):
+            if vm_creation_time + delta < now:
+                vm_delta = now - vm_creation_time
+                with lock:
+                    vms_to_delete[provider_key].add((vm_name, vm_delta))
+
+        # {vm_name: (host name, datastore url)}, their hosts are asked for the times together
+        powered_off_vms = {}
         for vm_name in vm_list:
             try:
                 if not match(matchers, vm_name):
@@ -120,21 +148,28 @@ def process_provider_vms(provider_key, provider_type, matchers,
                     hostname = provider.get_vm_host_name(vm_name)
                     vm_config_datastore = provider.get_vm_config_files_path(vm_name)
                     datastore_url = provider.get_vm_datastore_path(vm_name, vm_config_datastore)
-                    vm_creation_time = get_vm_config_modified_time(hostname, vm_name,
-                                                                   datastore_url, provider_key)
+                    powered_off_vms[vm_name] = (hostname, datastore_url)
                 else:
-                    vm_creation_time = provider.vm_creation_time(vm_name)
-
-                if vm_creation_time + delta < now:
-                    vm_delta = now - vm_creation_time
-                    with lock:
-                        vms_to_delete[provider_key].add((vm_name, vm_delta))
+                    check_vm(vm_name, provider.vm_creation_time(vm_name))
             except Exception as e:
                 logger.error(e)
                 logger.error('Failed to get creation/boot time for {} on {}'.format(
                     vm_name, provider_key))
                 continue
 
+        if powered_off_vms:
+            try:
+                modified_times = get_vm_config_modified_times(powered_off_vms, provider_key)
+            except Exception as e:
+                logger.error(e)
+                modified_times = {}
+            for vm_name in powered_off_vms:
+                if vm_name in modified_times:
+                    check_vm(vm_name, modified_times[vm_name])
+                else:
+                    logger.error('Failed to get creation/boot time for {} on {}'.format(
+                        vm_name, provider_key))
+
         with lock:
             print('{} finished'.format(provider_key))
     except Exception as ex:
@@ -31,7 +31,7 @@ import socket
 import sys
 
 from utils.conf import credentials
-from utils.ssh import SSHClient
+from utils.ssh import SSHClient, SSHFanout
 from utils.wait import wait_for
 
 
@@ -113,15 +113,18 @@ def main():
         with SSHClient(hostname=address, **ssh_creds) as client:
             client.put_file(local_key_name, '/var/www/miq/vmdb/certs/v2_key')
 
-    def restart_appliance(address):
-        print('Restarting evmserverd on {}'.format(address))
-        with SSHClient(hostname=address, **ssh_creds) as client:
-            status, out = client.run_command('systemctl restart evmserverd')
-            if status != 0:
-                print("Restarting evmserverd failed on {}".format(address))
-                sys.exit(1)
+    def restart_appliances(addresses):
+        print('Restarting evmserverd on {}'.format(', '.join(addresses)))
+        failed = False
+        fanout = SSHFanout(addresses, **ssh_creds)
+        for host_result in fanout.run_command('systemctl restart evmserverd'):
+            if host_result.success:
+                print("Restarting succeeded on {}".format(host_result.host))
             else:
-                print("Restarting succeeded on {}".format(address))
+                print("Restarting evmserverd failed on {}".format(host_result.host))
+                failed = True
+        if failed:
+            sys.exit(1)
 
     # make sure ssh is ready on each appliance
     wait_for(func=is_ssh_running, func_args=[args.appliance], delay=10, num_sec=600)
@@ -138,10 +141,7 @@ def main():
             update_db_yaml(child)
 
     # restart master appliance (and children, if provided)
-    restart_appliance(args.appliance)
-    if args.children:
-        for child in args.children:
-            restart_appliance(child)
+    restart_appliances([args.appliance] + (args.children or []))
     print("Appliance(s) restarted with new key in place.")
 
     # update encrypted passwords in each database-owning appliance.
@@ -152,10 +152,7 @@ def main():
             update_password(child)
 
     # Restart again!
-    restart_appliance(args.appliance)
-    if args.children:
-        for child in args.children:
-            restart_appliance(child)
+    restart_appliances([args.appliance] + (args.children or []))
 
     print("Done!")
 
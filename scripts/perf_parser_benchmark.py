@@ -0,0 +1,181 @@
+#!/usr/bin/env python2
+"""Benchmark the appliance log parsers on synthetic logs.
+
+Generates evm.log, top_output.log and production.log of the requested size (unless they already
+exist in the directory) and runs each parser in its own process, reporting the throughput and the
+peak memory usage so the regressions of the perf report processing are easy to spot.
+
+The throughputs can be saved as a baseline, later runs fail (exit 1) if a parser got slower than
+the baseline by more than the tolerance or took longer than ``--max-seconds``.
+
+Example:
+    scripts/perf_parser_benchmark.py --size 100 --dir /tmp/perf_bench --save-baseline base.json
+    scripts/perf_parser_benchmark.py --size 100 --dir /tmp/perf_bench --baseline base.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+from multiprocessing import Process, Queue
+from time import time
+
+from tabulate import tabulate
+
+from utils.log_generator import ApplianceLogGenerator
+
+LOG_FILES = {
+    'evm': 'evm.log',
+    'top': 'top_output.log',
+    'production': 'production.log',
+}
+
+
+def bench_evm_to_messages(files):
+    from utils.perf_message_stats import evm_to_messages, msg_filters
+    evm_to_messages(files['evm'], msg_filters)
+    return 'evm'
+
+
+def bench_evm_to_workers(files):
+    from utils.perf_message_stats import evm_to_workers
+    evm_to_workers(files['evm'])
+    return 'evm'
+
+
+def bench_top_to_appliance(files):
+    from utils.perf_message_stats import top_to_appliance
+    top_to_appliance(files['top'])
+    return 'top'
+
+
+def bench_top_to_workers(files):
+    from utils.perf_message_stats import evm_to_workers, top_to_workers
+    # The workers are an input of the top parser, getting them is not a part of the measurement
+    workers = evm_to_workers(files['evm'])[0]
+    start = time()
+    top_to_workers(workers, files['top'])
+    return 'top', start
+
+
+def bench_log_validator(files):
+    from utils.log_validator import LogValidator
+    validator = LogValidator('/var/www/miq/vmdb/log/production.log', hostname='localhost',
+        skip_patterns=['.*Started GET "/api".*'],
+        failure_patterns=['.*FATAL.*', '.*Completed 500.*'],
+        matched_patterns=['.*Completed 200 OK.*'])
+    with open(files['production']) as f:
+        validator.validate_lines(line.rstrip() for line in f)
+    return 'production'
+
+
+PARSERS = {
+    'evm_to_messages': bench_evm_to_messages,
+    'evm_to_workers': bench_evm_to_workers,
+    'top_to_appliance': bench_top_to_appliance,
+    'top_to_workers': bench_top_to_workers,
+    'log_validator': bench_log_validator,
+}
+
+
+def _run_parser(function, files, queue):
+    try:
+        start = time()
+        result = function(files)
+        if isinstance(result, tuple):
+            log, start = result
+        else:
+            log = result
+        elapsed = time() - start
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        queue.put((log, elapsed, peak, None))
+    except Exception as e:
+        queue.put((None, None, None, '{}: {}'.format(type(e).__name__, e)))
+
+
+def run_parser(name, files):
+    """Runs the parser in a fresh process, so the peak memory is not shared among the parsers."""
+    queue = Queue()
+    proc = Process(target=_run_parser, args=(PARSERS[name], files, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def generate_logs(directory, size, seed):
+    generator = ApplianceLogGenerator(seed=seed)
+    files = {}
+    for log, filename in LOG_FILES.items():
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            print('Generating {} ({} MiB)'.format(path, size))
+            getattr(generator, '{}_log'.format(
+                'top_output' if log == 'top' else log))(path, size * 1024 * 1024)
+        files[log] = path
+    return files
+
+
+def count_lines(filename):
+    with open(filename) as f:
+        return sum(1 for line in f)
+
+
+def main():
+    parser = argparse.ArgumentParser(epilog=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=50, help='size of each generated log in MiB')
+    parser.add_argument('--dir', default='log/perf_parser_benchmark',
+        help='directory of the (generated) logs, existing logs are reused')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the log generator')
+    parser.add_argument('--parser', action='append', choices=sorted(PARSERS),
+        help='parser to benchmark, can be repeated, all parsers by default')
+    parser.add_argument('--max-seconds', type=float,
+        help='fail if any parser takes longer than this')
+    parser.add_argument('--baseline', help='JSON file with the MiB/s of the parsers to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='fail if a parser is slower than the baseline by more than this ratio (default 0.2)')
+    parser.add_argument('--save-baseline', help='save the MiB/s of the parsers to this JSON file')
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if not os.path.isdir(args.dir):
+        os.makedirs(args.dir)
+    files = generate_logs(args.dir, args.size, args.seed)
+    sizes = {log: os.path.getsize(path) for log, path in files.items()}
+    lines = {log: count_lines(path) for log, path in files.items()}
+
+    rows = []
+    throughputs = {}
+    failed = False
+    for name in args.parser or sorted(PARSERS):
+        print('Running {}'.format(name))
+        log, elapsed, peak, error = run_parser(name, files)
+        if error:
+            failed = True
+            rows.append([name, 'failed: {}'.format(error), '', '', '', '', ''])
+            continue
+        throughputs[name] = sizes[log] / 1024.0 / 1024.0 / elapsed
+        regressions = []
+        if args.max_seconds is not None and elapsed > args.max_seconds:
+            regressions.append('over {}s'.format(args.max_seconds))
+        if name in baseline and throughputs[name] < baseline[name] * (1 - args.tolerance):
+            regressions.append('{:.0%} of the baseline'.format(throughputs[name] / baseline[name]))
+        failed = failed or bool(regressions)
+        rows.append([name, LOG_FILES[log], round(elapsed, 2), round(throughputs[name], 2),
+            int(lines[log] / elapsed), round(peak, 1), ', '.join(regressions) or 'ok'])
+    print(tabulate(rows,
+        headers=['Parser', 'Log', 'Time (s)', 'MiB/s', 'Lines/s', 'Peak memory (MiB)',
+                 'Regression']))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(throughputs, f, indent=2, sort_keys=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,13 @@
+import json
 import logging
+from binascii import hexlify
 import os
 import re
 import socket
+import time
 import traceback
 from copy import copy
-from tempfile import NamedTemporaryFile
+from functools import partial
 from textwrap import dedent
 from time import sleep
 from urlparse import ParseResult, urlparse
@@ -22,15 +25,17 @@ from fixtures import ui_coverage
 from fixtures.pytest_store import store
 from utils import clear_property_cache
 from utils import conf, datafile, db, ssh, ports
-from utils.datafile import load_data_file
+from utils.db_poller import DbPoller
 from utils.events import EventListener
 from utils.log import logger, create_sublogger, logger_wrap
 from utils.net import net_check, resolve_hostname
 from utils.path import data_path, patches_path, scripts_path, conf_path
+from utils.timeutil import parsetime
 from utils.version import Version, get_stream, pick, LATEST
-from utils.wait import wait_for
+from utils.wait import TimedOutError, wait_for
 from .implementations.ui import ViaUI
 from .implementations.ssui import ViaSSUI
+from .pipeline import ConfigurationPipeline
 
 from .services import SystemdService
 
@@ -197,6 +202,7 @@ class IPAppliance(object):
             [self.browser, self.ssui])
         self._server = None
         self.is_pod = False
+        self.configure_timings = None
 
     def get(self, cls, *args, **kwargs):
         """A generic getter for instantiation of Collection classes
@@ -341,7 +347,9 @@ class IPAppliance(object):
     def configure(self, log_callback=None, **kwargs):
         """Configures appliance - database setup, rename, ntp sync
 
-        Utility method to make things easier.
+        Utility method to make things easier. The independent steps run concurrently, see
+        :py:class:`utils.appliance.pipeline.ConfigurationPipeline`, the time taken by each of them
+        is kept in :py:attr:`configure_timings`.
 
         Note:
             db_address, name_to_set are not used currently.
@@ -355,6 +363,8 @@ class IPAppliance(object):
             loosen_pgssl: Loosens postgres connections if ``True`` (default ``True``)
             key_address: Fetch encryption key from this address if set, generate a new key if
                          ``None`` (default ``None``)
+            rails_runner: Deploys the rails runner daemon if ``True`` (default is the
+                          ``rails_runner`` key of env.yaml, ``False`` if not set)
 
         """
 
@@ -363,30 +373,57 @@ class IPAppliance(object):
         fix_ntp_clock = kwargs.pop('fix_ntp_clock', True)
         region = kwargs.pop('region', 0)
         key_address = kwargs.pop('key_address', None)
-        with self as ipapp:
-            ipapp.wait_for_ssh()
-            self.deploy_merkyl(start=True, log_callback=log_callback)
-            if fix_ntp_clock:
-                self.fix_ntp_clock(log_callback=log_callback)
-                # TODO: Handle external DB setup. Also in setup_database
-            self.setup_database(
-                region=region,
-                key_address=key_address,
-                log_callback=log_callback)
-            self.wait_for_evm_service(timeout=1200, log_callback=log_callback)
-
-            # Some conditionally ran items require the evm service be
-            # restarted:
-            restart_evm = False
-            if loosen_pgssl:
-                self.loosen_pgssl(log_callback=log_callback)
-                restart_evm = True
-            if self.version >= '5.8':
-                self.configure_vm_console_cert(log_callback=log_callback)
-                restart_evm = True
-            if restart_evm:
-                self.restart_evm_service(log_callback=log_callback)
-            self.wait_for_web_ui(timeout=1800, log_callback=log_callback)
+        rails_runner = kwargs.pop('rails_runner', conf.env.get('rails_runner', False))
+        # The steps run in their own threads, each of them has its own appliance stack
+        pipeline = ConfigurationPipeline(log_callback=log_callback, context=self)
+        pipeline.add('ssh', self.wait_for_ssh)
+        # Steps relying on the correct time
+        clock_requires = ['ssh']
+        pipeline.add(
+            'merkyl', partial(self.deploy_merkyl, start=True, log_callback=log_callback),
+            requires=['ssh'])
+        if fix_ntp_clock:
+            pipeline.add(
+                'ntp', partial(self.fix_ntp_clock, log_callback=log_callback), requires=['ssh'])
+            clock_requires.append('ntp')
+        # TODO: Handle external DB setup. Also in setup_database
+        pipeline.add(
+            'database',
+            partial(self.setup_database, region=region, key_address=key_address,
+                    log_callback=log_callback),
+            requires=clock_requires)
+        pipeline.add(
+            'evm_service', partial(self.wait_for_evm_service, timeout=1200,
+                                   log_callback=log_callback),
+            requires=['database'])
+        # Some conditionally ran items require the evm service be restarted, once is enough
+        if loosen_pgssl:
+            pipeline.add(
+                'loosen_pgssl', partial(self.loosen_pgssl, log_callback=log_callback),
+                requires=['evm_service'], restart=True)
+
+        def vm_console_cert():
+            # The version is known only once SSH is up
+            if self.version < '5.8':
+                return False
+            self.configure_vm_console_cert(log_callback=log_callback)
+        # After the clock is fixed, the validity of the certificate starts at the generation time
+        pipeline.add(
+            'vm_console_cert', vm_console_cert, requires=clock_requires + ['evm_service'],
+            restart=True)
+        pipeline.add_restart(
+            'evm_restart', partial(self.restart_evm_service, log_callback=log_callback),
+            requires=['evm_service'])
+        if rails_runner:
+            pipeline.add(
+                'rails_runner',
+                partial(self.deploy_rails_runner, start=True, log_callback=log_callback),
+                requires=['evm_restart'])
+        pipeline.add(
+            'web_ui', partial(self.wait_for_web_ui, timeout=1800, log_callback=log_callback),
+            requires=['evm_restart'])
+        with self:
+            self.configure_timings = pipeline.run()
 
     # TODO: this method eventually needs to be moved to provider class..
     @logger_wrap("Configure GCE IPAppliance: {}")
@@ -405,7 +442,8 @@ class IPAppliance(object):
 
     @property
     def db_partition_extended(self):
-        return self.ssh_client.run_command("ls /var/www/miq/vmdb/.db_partition_extended") == 0
+        return self.ssh_client.run_command(
+            "ls /var/www/miq/vmdb/.db_partition_extended").rc == 0
 
     @logger_wrap("Extend DB partition")
     def extend_db_partition(self, log_callback=None):
@@ -727,31 +765,137 @@ class IPAppliance(object):
     def url(self):
         return "{}://{}/".format(self.scheme, self.address)
 
+    # Fact name: command, all of them are run in a single SSH call by ``ssh_facts``
+    SSH_FACT_COMMANDS = {
+        'version': 'cat /var/www/miq/vmdb/VERSION',
+        'is_downstream': 'stat /var/www/miq/vmdb/BUILD',
+        'build': 'cat /var/www/miq/vmdb/BUILD',
+        # Currently parses the os version out of redhat release file to allow for
+        # rhel and centos appliances
+        'os_version': r"cat /etc/redhat-release | sed 's/.* release \(.*\) (.*/\1/' #)",
+        'guid': 'cat /var/www/miq/vmdb/GUID',
+        'build_datetime': 'stat --printf=%Y /var/www/miq/vmdb/VERSION',
+    }
+    # Facts failing on a ready appliance too (upstream builds have no BUILD file), the others
+    # have to succeed for the facts to be cached on disk
+    SSH_FACTS_MAY_FAIL = ('is_downstream', 'build')
+    # Seconds the facts cached on disk are used for, by all the processes on this machine
+    SSH_FACTS_TTL = 3600
+    # Cached properties derived from the facts, dropped along with them
+    SSH_FACT_PROPERTIES = (
+        'version', 'build', 'os_version', 'build_datetime', 'is_downstream', 'guid', 'evm_id')
+
+    @cached_property
+    def ssh_facts(self):
+        """Results of the :py:attr:`SSH_FACT_COMMANDS`, fetched in one SSH round trip.
+
+        The first access to any of the facts (``version``, ``build``, ...) prefetches all of them.
+        The facts are cached on disk for :py:attr:`SSH_FACTS_TTL` seconds, so the other
+        processes and :py:class:`IPAppliance` instances of the same appliance do not fetch them
+        again. They are cached only if all of them (but :py:attr:`SSH_FACTS_MAY_FAIL`) were
+        fetched, the appliance may not be configured yet otherwise. The cache is keyed by the
+        SSH host key too, so an appliance redeployed on the same address does not get them.
+        Call :py:meth:`invalidate_ssh_facts` when the appliance changes.
+
+        Returns: A dictionary of fact name: :py:class:`utils.ssh.SSHResult`.
+        """
+        facts = self._load_ssh_facts()
+        if facts is None:
+            names = sorted(self.SSH_FACT_COMMANDS)
+            results = self.ssh_client.run_commands(
+                [self.SSH_FACT_COMMANDS[name] for name in names])
+            facts = dict(zip(names, results))
+            if all(result.rc == 0 for name, result in facts.items()
+                   if name not in self.SSH_FACTS_MAY_FAIL):
+                self._save_ssh_facts(facts)
+        return facts
+
+    @property
+    def _ssh_host_key(self):
+        """Fingerprint of the SSH host key, a new one is generated when the appliance is deployed"""
+        return hexlify(self.ssh_client.get_transport().get_remote_server_key().get_fingerprint())
+
+    @property
+    def _ssh_facts_cache_file(self):
+        if store.config is None:
+            return None
+        try:
+            host_key = self._ssh_host_key
+        except Exception as e:
+            self.log.debug('Not caching the facts, could not get the SSH host key: %s', e)
+            return None
+        name = self.address if not self.container else '{}-{}'.format(
+            self.address, self.container)
+        return store.config.cache.makedir('appliance_facts').join(
+            '{}-{}.json'.format(re.sub(r'[^\w.-]', '_', name), host_key))
+
+    def _load_ssh_facts(self):
+        cache_file = self._ssh_facts_cache_file
+        if cache_file is None or not cache_file.check():
+            return None
+        try:
+            with cache_file.open('r') as f:
+                cached = json.load(f)
+        except Exception as e:
+            self.log.warning('Could not load the cached facts %s: %s', cache_file, e)
+            return None
+        if time.time() - cached['time'] > self.SSH_FACTS_TTL:
+            return None
+        if set(cached['facts']) != set(self.SSH_FACT_COMMANDS):
+            return None
+        return {name: ssh.SSHResult(*result) for name, result in cached['facts'].items()}
+
+    def _save_ssh_facts(self, facts):
+        cache_file = self._ssh_facts_cache_file
+        if cache_file is None:
+            return
+        # Written aside and renamed, so the other processes never read a partial file
+        temp_file = cache_file.new(basename='{}.{}'.format(cache_file.basename, os.getpid()))
+        try:
+            with temp_file.open('w') as f:
+                json.dump({'time': time.time(), 'facts': facts}, f)
+            temp_file.rename(cache_file)
+        except Exception as e:
+            self.log.warning('Could not save the cached facts %s: %s', cache_file, e)
+
+    def invalidate_ssh_facts(self):
+        """Drops the facts cached in this object and on disk
+
+        Called after the appliance was updated, rebooted or had its database restored.
+        """
+        clear_property_cache(self, 'ssh_facts', *self.SSH_FACT_PROPERTIES)
+        cache_file = self._ssh_facts_cache_file
+        if cache_file is not None:
+            try:
+                cache_file.remove()
+            except EnvironmentError:
+                # Not cached, or removed by another process already
+                pass
+
+    def _ssh_fact(self, name, error=None):
+        res = self.ssh_facts[name]
+        if res.rc != 0 and error:
+            # Do not keep the failure cached, the appliance may not be ready yet
+            self.invalidate_ssh_facts()
+            raise RuntimeError(error)
+        return res
+
     @cached_property
     def version(self):
-        res = self.ssh_client.run_command('cat /var/www/miq/vmdb/VERSION')
-        if res.rc != 0:
-            raise RuntimeError('Unable to retrieve appliance VMDB version')
+        res = self._ssh_fact('version', 'Unable to retrieve appliance VMDB version')
         return Version(res.output)
 
     @cached_property
     def build(self):
-        if self.ssh_client.is_appliance_downstream():
-            res = self.ssh_client.run_command('cat /var/www/miq/vmdb/BUILD')
-            if res.rc != 0:
-                raise RuntimeError('Unable to retrieve appliance VMDB version')
+        if self.is_downstream:
+            res = self._ssh_fact('build', 'Unable to retrieve appliance VMDB version')
             return res.output.strip("\n")
         else:
             return "master"
 
     @cached_property
     def os_version(self):
-        # Currently parses the os version out of redhat release file to allow for
-        # rhel and centos appliances
-        res = self.ssh_client.run_command(
-            r"cat /etc/redhat-release | sed 's/.* release \(.*\) (.*/\1/' #)")
-        if res.rc != 0:
-            raise RuntimeError('Unable to retrieve appliance OS version')
+        res = self._ssh_fact('os_version', 'Unable to retrieve appliance OS version')
         return Version(res.output)
 
     @cached_property
@@ -854,9 +998,20 @@ class IPAppliance(object):
             value = None
         return value
 
-    def event_listener(self):
-        """Returns an instance of the event listening class pointed to this appliance."""
-        return EventListener(self)
+    def event_listener(self, notify=False):
+        """Returns an instance of the event listening class pointed to this appliance.
+
+        Args:
+            notify: Wait for the database notifications instead of polling for the new events,
+                see :py:class:`utils.events.EventListener`.
+        """
+        return EventListener(self, notify=notify)
+
+    @cached_property
+    def db_poller(self):
+        """The :py:class:`utils.db_poller.DbPoller` shared by the waiters for this appliance's
+        database state"""
+        return DbPoller(self)
 
     def diagnose_evm_failure(self):
         """Go through various EVM processes, trying to figure out what fails
@@ -1072,12 +1227,128 @@ class IPAppliance(object):
         log_callback('Restoring database')
         status, output = self.ssh_client.run_rake_command(
             'evm:db:restore:local --trace -- --local-file "{}"'.format(database_path))
+        self.invalidate_ssh_facts()
         if status != 0:
             msg = 'Failed to restore database on appl {}, output is {}'.format(self.address,
                 output)
             log_callback(msg)
             raise ApplianceException(msg)
 
+    # Databases cloned by snapshot_database are named with this prefix
+    DB_SNAPSHOT_PREFIX = 'vmdb_snapshot_'
+
+    def _db_snapshot_name(self, name):
+        if not re.match(r'^[a-z0-9_]+$', name):
+            raise ValueError('Snapshot names can only have lowercase letters, digits and _')
+        return self.DB_SNAPSHOT_PREFIX + name
+
+    def _clone_database(self, source, target, log_callback):
+        """Replaces the ``target`` database with a copy of ``source`` made by PostgreSQL itself
+
+        No one can be connected to the source database, so the connections are terminated first.
+        The copy gets the owner of the source database. It is made aside and renamed to
+        ``target``, so ``target`` is left as it was if the copy fails.
+
+        Raises:
+            :py:class:`ApplianceException` if the copy fails for other reasons than somebody
+            connecting to the databases in the meantime (which is retried).
+        """
+        script = dedent("""\
+            SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                WHERE datname = '{source}' AND pid <> pg_backend_pid();
+            SELECT pg_get_userbyid(datdba) AS owner FROM pg_database WHERE datname = '{source}'
+            \\gset
+            DROP DATABASE IF EXISTS {temp};
+            CREATE DATABASE {temp} OWNER :"owner" TEMPLATE {source};
+            SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                WHERE datname = '{target}' AND pid <> pg_backend_pid();
+            DROP DATABASE IF EXISTS {target};
+            ALTER DATABASE {temp} RENAME TO {target};
+            """).format(source=source, target=target, temp='clone_tmp_{}'.format(target))
+        # Dispose of our own connections, the pool would hand out the terminated ones
+        db.dispose_engines(self.db_address)
+
+        def _cloned():
+            result = self.db_ssh_client.run_command(
+                "psql -U postgres -v ON_ERROR_STOP=1 postgres <<'EOF'\n{}EOF".format(script),
+                timeout=600)
+            if result.rc == 0:
+                return True
+            if 'is being accessed by other users' not in result.output:
+                raise ApplianceException('Cloning {} to {} failed: {}'.format(
+                    source, target, result.output))
+            # Somebody connected in the meantime, try again
+            log_callback('Cloning {} failed, retrying: {}'.format(source, result.output))
+            return False
+        wait_for(_cloned, delay=5, num_sec=900, message='clone {} to {}'.format(source, target))
+
+    @logger_wrap("Snapshot database: {}")
+    def snapshot_database(self, name='clean', log_callback=None):
+        """Saves the VMDB database as a named snapshot in the database server
+
+        The snapshot is a copy of the database made by ``CREATE DATABASE ... TEMPLATE``, which
+        copies the files of the database and takes seconds, unlike :py:meth:`backup_database`.
+        The EVM service is stopped meanwhile (and started again if it was running).
+
+        Args:
+            name: Name of the snapshot (lowercase letters, digits and ``_``), an existing snapshot
+                of the same name is replaced.
+        """
+        snapshot = self._db_snapshot_name(name)
+        log_callback('Snapshotting database as {}'.format(snapshot))
+        was_running = self.evmserverd.running
+        if was_running:
+            self.evmserverd.stop()
+        try:
+            self._clone_database('vmdb_production', snapshot, log_callback)
+            # Nobody can connect to the snapshot, so it is always ready to be cloned
+            result = self.db_ssh_client.run_command(
+                'psql -U postgres -c "ALTER DATABASE {} ALLOW_CONNECTIONS false" postgres'.format(
+                    snapshot))
+            if result.rc != 0:
+                raise ApplianceException('Could not disallow connections to {}: {}'.format(
+                    snapshot, result.output))
+        finally:
+            if was_running:
+                self.evmserverd.start()
+
+    @logger_wrap("Restore database snapshot: {}")
+    def restore_database_snapshot(self, name='clean', wait_for_web_ui=True, log_callback=None):
+        """Replaces the VMDB database with the snapshot saved by :py:meth:`snapshot_database`
+
+        Args:
+            name: Name of the snapshot.
+            wait_for_web_ui: Waits for the web UI after the EVM service is started again.
+        """
+        snapshot = self._db_snapshot_name(name)
+        if snapshot not in self.database_snapshots.values():
+            raise ApplianceException('There is no database snapshot {}'.format(name))
+        log_callback('Restoring database from {}'.format(snapshot))
+        self.evmserverd.stop()
+        try:
+            self._clone_database(snapshot, 'vmdb_production', log_callback)
+        finally:
+            # With the old database if the restore failed
+            self.invalidate_ssh_facts()
+            self.evmserverd.start()
+        if wait_for_web_ui:
+            self.wait_for_web_ui()
+
+    def delete_database_snapshot(self, name='clean'):
+        """Deletes the snapshot saved by :py:meth:`snapshot_database`"""
+        self.db_ssh_client.run_command('psql -U postgres -c "DROP DATABASE IF EXISTS {}" postgres'
+            .format(self._db_snapshot_name(name)))
+
+    @property
+    def database_snapshots(self):
+        """Dictionary of the snapshot name: snapshot database name of the saved snapshots"""
+        result = self.db_ssh_client.run_command(
+            'psql -U postgres -t -A -c "SELECT datname FROM pg_database '
+            'WHERE datname LIKE \'{}%\'" postgres'.format(self.DB_SNAPSHOT_PREFIX))
+        return {
+            datname[len(self.DB_SNAPSHOT_PREFIX):]: datname
+            for datname in result.output.split() if datname.startswith(self.DB_SNAPSHOT_PREFIX)}
+
     @logger_wrap("Database setup: {}")
     def setup_database(self, log_callback=None, **kwargs):
         """Configure database
@@ -1177,6 +1448,30 @@ class IPAppliance(object):
             log_callback("Setting it to start after reboot")
             client.run_command("chkconfig merkyl on")
 
+    @logger_wrap("Deploying the rails runner: {}")
+    def deploy_rails_runner(self, start=False, log_callback=None):
+        """Deploys the daemon evaluating :py:meth:`utils.ssh.SSHClient.run_ruby` code to the
+        appliance
+
+        It boots Rails once and listens on the local port :py:data:`utils.ssh.RAILS_RUNNER_PORT`,
+        systemd restarts it if it crashes. It only evaluates the requests carrying the token it
+        writes to :py:data:`utils.ssh.RAILS_RUNNER_TOKEN_FILE`, readable by root only.
+        """
+        client = self.ssh_client
+        client.run_command('mkdir -p /root/rails_runner')
+        log_callback('Sending rails_runner.rb to appliance')
+        client.put_file(data_path.join('bundles', 'rails_runner', 'rails_runner.rb').strpath,
+            '/root/rails_runner/rails_runner.rb')
+        client.put_file(data_path.join('bundles', 'rails_runner', 'rails_runner.service').strpath,
+            '/etc/systemd/system/rails_runner.service')
+        client.run_command('systemctl daemon-reload')
+
+        if start:
+            log_callback("Starting ...")
+            client.run_command('systemctl restart rails_runner')
+            log_callback("Setting it to start after reboot")
+            client.run_command('systemctl enable rails_runner')
+
     def get_repofile_list(self):
         """Returns list of repofiles present at the appliance.
 
@@ -1339,6 +1634,7 @@ class IPAppliance(object):
             raise KeyboardInterrupt(msg)
 
         self.log.error(result.output)
+        self.invalidate_ssh_facts()
         if result.rc != 0:
             self.log.error('appliance update failed')
             msg = 'Appliance {} failed to update RHEL, error in logs'.format(self.address)
@@ -1535,10 +1831,15 @@ class IPAppliance(object):
                 self.postgres_version))
         return return_code == 0
 
-    def _check_appliance_ui_wait_fn(self):
+    # Seconds between the web UI probes while evmserverd is up
+    WEB_UI_PROBE_INTERVAL = 2
+    # Lines of evm.log after which the web UI is probed right away
+    WEB_UI_LOG_MARKERS = r'MIQ\(MiqServer#(start|stop|shutdown)|MIQ\(MiqUiWorker.*(started|stopp)'
+
+    def _check_appliance_ui_wait_fn(self, session=None):
         # Get the URL, don't verify ssl cert
         try:
-            response = requests.get(self.url, timeout=15, verify=False)
+            response = (session or requests).get(self.url, timeout=15, verify=False)
             if response.status_code == 200:
                 self.log.info("Appliance online")
                 return True
@@ -1629,9 +1930,7 @@ class IPAppliance(object):
             timeout: Number of seconds to wait until timeout (default ``900``)
         """
         log_callback('Waiting for evmserverd to be running')
-        result, wait = wait_for(self.is_evm_service_running, num_sec=timeout,
-                                fail_condition=False, delay=10)
-        return result
+        return self.evmserverd.wait_for_running(timeout=timeout)
 
     @logger_wrap("Rebooting Appliance: {}")
     def reboot(self, wait_for_web_ui=True, log_callback=None):
@@ -1643,6 +1942,7 @@ class IPAppliance(object):
 
         wait_for(lambda: client.uptime() < old_uptime, handle_exception=True,
             num_sec=600, message='appliance to reboot', delay=10)
+        self.invalidate_ssh_facts()
 
         if wait_for_web_ui:
             self.wait_for_web_ui()
@@ -1651,6 +1951,10 @@ class IPAppliance(object):
     def wait_for_web_ui(self, timeout=900, running=True, log_callback=None):
         """Waits for the web UI to be running / to not be running
 
+        evmserverd and evm.log are watched over one SSH channel, the web UI is probed on a
+        keep-alive connection every :py:attr:`WEB_UI_PROBE_INTERVAL` seconds while the service is
+        up and right away when the service or the UI workers change.
+
         Args:
             timeout: Number of seconds to wait until timeout (default ``600``)
             running: Specifies if we wait for web UI to start or stop (default ``True``)
@@ -1658,9 +1962,34 @@ class IPAppliance(object):
         """
         prefix = "" if running else "dis"
         (log_callback or self.log.info)('Waiting for web UI to ' + prefix + 'appear')
-        result, wait = wait_for(self._check_appliance_ui_wait_fn, num_sec=timeout,
-            fail_condition=not running, delay=10)
-        return result
+        if self.container:
+            result, wait = wait_for(self._check_appliance_ui_wait_fn, num_sec=timeout,
+                fail_condition=not running, delay=10)
+            return result
+        # The web UI is probed often only while evmserverd is up (or its state is not known yet),
+        # the watcher wakes the probing up as soon as the service or the UI workers change
+        session = requests.Session()
+        start = time.time()
+        try:
+            with self.evmserverd.watch(
+                    log_file='/var/www/miq/vmdb/log/evm.log',
+                    log_markers=self.WEB_UI_LOG_MARKERS) as watcher:
+                while True:
+                    changes = watcher.changes
+                    service_up = watcher.state in {'active', None}
+                    if service_up or not running:
+                        result = self._check_appliance_ui_wait_fn(session=session)
+                        if result == running:
+                            return result
+                    remaining = start + timeout - time.time()
+                    if remaining <= 0:
+                        raise TimedOutError(
+                            'Could not do wait for web UI to {}appear in time, waited {:.0f} '
+                            'seconds'.format(prefix, time.time() - start))
+                    delay = self.WEB_UI_PROBE_INTERVAL if watcher.state == 'active' else 10
+                    watcher.wait_for_change(changes, min(delay, remaining))
+        finally:
+            session.close()
 
     @logger_wrap("Install VDDK: {}")
     def install_vddk(self, reboot=True, force=False, vddk_url=None, log_callback=None,
@@ -1969,44 +2298,44 @@ class IPAppliance(object):
 
     @cached_property
     def build_datetime(self):
-        datetime = self.ssh_client.get_build_datetime()
-        return datetime
+        return parsetime.fromtimestamp(int(self._ssh_fact('build_datetime').output.strip()))
 
     @cached_property
     def build_date(self):
-        date = self.ssh_client.get_build_date()
-        return date
+        return self.build_datetime.date()
 
     @cached_property
     def is_downstream(self):
-        return self.ssh_client.is_appliance_downstream()
+        return self._ssh_fact('is_downstream').rc == 0
 
     def has_netapp(self):
         return self.ssh_client.appliance_has_netapp()
 
     @cached_property
     def guid(self):
-        result = self.ssh_client.run_command('cat /var/www/miq/vmdb/GUID')
-        return result.output
+        return self._ssh_fact('guid').output
 
     @cached_property
     def evm_id(self):
         miq_servers = self.db['miq_servers']
         return self.db.session.query(miq_servers.id).filter(miq_servers.guid == self.guid)[0][0]
 
-    @property
-    def server_roles(self):
-        """Return a dictionary of server roles from database"""
+    def _active_server_roles_query(self):
+        """Query of the names of all active server roles assigned to this server"""
         asr = self.db['assigned_server_roles']
         sr = self.db['server_roles']
-        all_role_names = {row[0] for row in self.db.session.query(sr.name)}
-        # Query all active server roles assigned to this server
-        query = self.db.session\
+        return self.db.session\
             .query(sr.name)\
             .join(asr, asr.server_role_id == sr.id)\
             .filter(asr.miq_server_id == self.evm_id)\
             .filter(asr.active == True)  # noqa
-        active_roles = {row[0] for row in query}
+
+    @property
+    def server_roles(self):
+        """Return a dictionary of server roles from database"""
+        sr = self.db['server_roles']
+        all_role_names = {row[0] for row in self.db.session.query(sr.name)}
+        active_roles = {row[0] for row in self._active_server_roles_query()}
         roles = {role_name: role_name in active_roles for role_name in all_role_names}
         dead_keys = ['database_owner', 'vdi_inventory']
         for key in roles:
@@ -2031,7 +2360,11 @@ class IPAppliance(object):
         yaml = self.get_yaml_config()
         yaml['server']['role'] = ','.join([role for role, boolean in roles.iteritems() if boolean])
         self.set_yaml_config(yaml)
-        wait_for(lambda: self.server_roles == roles, num_sec=300, delay=15)
+        active_roles = {role for role, boolean in roles.iteritems() if boolean}
+        self.db_poller.wait_for(
+            self._active_server_roles_query(),
+            predicate=lambda rows: {row[0] for row in rows if row[0] in roles} == active_roles,
+            num_sec=300, message='set the server roles')
 
     @cached_property
     def configuration_details(self):
@@ -2155,42 +2488,21 @@ class IPAppliance(object):
         return 'storage' in self.get_yaml_config().get('product', {})
 
     def get_yaml_config(self):
-        writeout = self.ssh_client.run_rails_command(
-            '"File.open(\'/tmp/yam_dump.yaml\', \'w\') '
-            '{|f| f.write(Settings.to_hash.deep_stringify_keys.to_yaml) }"'
-        )
-        if writeout.rc:
-            logger.error("Config couldn't be found")
-            logger.error(writeout.output)
-            raise Exception('Error obtaining config')
-        base_data = self.ssh_client.run_command('cat /tmp/yam_dump.yaml')
-        if base_data.rc:
+        result = self.ssh_client.run_ruby('Settings.to_hash.deep_stringify_keys.to_yaml')
+        if not result:
             logger.error("Config couldn't be found")
-            logger.error(base_data.output)
+            logger.error(result.output)
             raise Exception('Error obtaining config')
         try:
-            return yaml.load(base_data.output)
+            return yaml.load(result.value)
         except:
-            logger.debug(base_data.output)
+            logger.debug(result.value)
             raise
 
     def set_yaml_config(self, data_dict):
-        temp_yaml = NamedTemporaryFile()
-        dest_yaml = '/tmp/conf.yaml'
-        yaml.dump(data_dict, temp_yaml, default_flow_style=False)
-        self.ssh_client.put_file(temp_yaml.name, dest_yaml)
-        # Build and send ruby script
-        dest_ruby = '/tmp/set_conf.rb'
-
-        ruby_template = data_path.join('utils', 'cfmedb_set_config.rbt')
-        ruby_replacements = {
-            'config_file': dest_yaml
-        }
-        temp_ruby = load_data_file(ruby_template.strpath, ruby_replacements)
-        self.ssh_client.put_file(temp_ruby.name, dest_ruby)
-
-        # Run it
-        result = self.ssh_client.run_rails_command(dest_ruby)
+        result = self.ssh_client.run_ruby(
+            data_path.join('utils', 'cfmedb_set_config.rbt').read(),
+            args={'config': yaml.dump(data_dict, default_flow_style=False)})
         if result:
             self.server_details_changed()
         else:
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""Operations run concurrently across a set of appliances.
+
+Multi-appliance setups (replication, HA, multi-region) configure, update, restart and wait on
+their appliances one by one, although most of the time is spent waiting on each appliance alone.
+:py:class:`ApplianceGroup` runs an operation on all of them at once, an appliance starts as soon
+as the appliances it requires (f.e. the database primary of a replica) finished the operation.
+The messages logged by the operation and its outcome are collected per appliance.
+"""
+import time
+from collections import OrderedDict
+
+import attr
+from concurrent import futures
+
+from utils.log import logger
+
+
+class ApplianceGroupException(Exception):
+    """Raised by :py:class:`ApplianceGroup` operations that failed on some of the appliances
+
+    The :py:class:`ApplianceResult` s of all the appliances are in ``results``.
+    """
+    def __init__(self, operation, results):
+        self.operation = operation
+        self.results = results
+        super(ApplianceGroupException, self).__init__('{} failed on {}'.format(
+            operation,
+            ', '.join('{} ({}: {})'.format(r.appliance.address, type(r.error).__name__, r.error)
+                      for r in results.values() if not r.success)))
+
+
+class ApplianceSkipped(Exception):
+    """Error of the appliances not worked on because the appliances they require failed"""
+    pass
+
+
+@attr.s
+class ApplianceResult(object):
+    """Outcome of an :py:class:`ApplianceGroup` operation on one appliance
+
+    ``result`` is the return value of the operation, ``error`` the exception it raised (``None``
+    if it did not), ``elapsed`` the seconds it took and ``log`` the messages it logged.
+    """
+    appliance = attr.ib()
+    result = attr.ib(default=None)
+    error = attr.ib(default=None)
+    elapsed = attr.ib(default=0.0)
+    log = attr.ib(default=attr.Factory(list))
+
+    @property
+    def success(self):
+        return self.error is None
+
+
+class ApplianceGroup(object):
+    """A set of appliances worked on together
+
+    Args:
+        appliances: The appliances.
+        requires: Ordering constraints, maps an appliance to the appliances which have to finish
+            an operation before it starts the same one. Appliances not in the group are ignored.
+        max_workers: Number of appliances worked on at a time, all of them by default.
+
+    Usage:
+        .. code-block:: python
+
+          group = ApplianceGroup([primary, replica1, replica2],
+                                 requires={replica1: [primary], replica2: [primary]})
+          # The replicas fetch the key from the primary, so they start once it is configured
+          group.configure(appliance_kwargs={
+              replica1: {'key_address': primary.address},
+              replica2: {'key_address': primary.address}})
+          # No ordering needed to just wait
+          group.wait_for_web_ui(requires={})
+    """
+    def __init__(self, appliances, requires=None, max_workers=None):
+        self.appliances = list(appliances)
+        self.requires = requires or {}
+        self.max_workers = max_workers or max(len(self.appliances), 1)
+
+    def __iter__(self):
+        return iter(self.appliances)
+
+    def __len__(self):
+        return len(self.appliances)
+
+    def _requirements(self, requires):
+        return OrderedDict(
+            (appliance, {a for a in requires.get(appliance, ()) if a in self.appliances})
+            for appliance in self.appliances)
+
+    def _call(self, func, appliance, result):
+        def log_callback(msg):
+            result.log.append(msg)
+            logger.info('[%s] %s', appliance.address, msg)
+        start = time.time()
+        try:
+            result.result = func(appliance, log_callback)
+        except Exception as e:
+            logger.exception('Operation on %s failed', appliance.address)
+            result.error = e
+        result.elapsed = time.time() - start
+        return result
+
+    def map(self, func, requires=None, raise_on_error=True, name=None):
+        """Calls ``func(appliance, log_callback)`` for each appliance
+
+        An appliance whose required appliances failed is not worked on, its error is
+        :py:class:`ApplianceSkipped`.
+
+        Args:
+            func: Called with the appliance and a log callback collecting the messages.
+            requires: Overrides the ordering constraints of the group for this operation.
+            raise_on_error: Raise :py:class:`ApplianceGroupException` if any appliance failed.
+            name: Name of the operation used in the messages.
+
+        Returns: :py:class:`collections.OrderedDict` of :py:class:`ApplianceResult` s by the
+            appliance, in the order of the group.
+        """
+        name = name or getattr(func, '__name__', 'operation')
+        pending = self._requirements(self.requires if requires is None else requires)
+        results = OrderedDict((a, ApplianceResult(a)) for a in self.appliances)
+        finished, failed = set(), set()
+        running = {}
+        start = time.time()
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                skipped = True
+                while skipped:
+                    # Skipping an appliance skips the ones requiring it as well
+                    skipped = False
+                    for appliance, required in list(pending.items()):
+                        if required & failed:
+                            del pending[appliance]
+                            failed.add(appliance)
+                            results[appliance].error = ApplianceSkipped(
+                                'Skipped, {} failed'.format(', '.join(
+                                    a.address for a in self.appliances
+                                    if a in required & failed)))
+                            skipped = True
+                for appliance, required in list(pending.items()):
+                    if required <= finished:
+                        del pending[appliance]
+                        future = executor.submit(self._call, func, appliance, results[appliance])
+                        running[future] = appliance
+                if not running:
+                    if pending:
+                        raise ValueError(
+                            'Appliances {} can never start, check the ordering constraints'.format(
+                                ', '.join(a.address for a in pending)))
+                    break
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    appliance = running.pop(future)
+                    if results[appliance].success:
+                        finished.add(appliance)
+                    else:
+                        failed.add(appliance)
+        finally:
+            executor.shutdown(wait=True)
+        logger.info('%s on %d appliances finished in %.1f seconds: %s', name,
+                    len(self.appliances), time.time() - start, ', '.join(
+                        '{} {}'.format(r.appliance.address,
+                                       '{:.1f}s'.format(r.elapsed) if r.success else 'failed')
+                        for r in results.values()))
+        if failed and raise_on_error:
+            raise ApplianceGroupException(name, results)
+        return results
+
+    def run(self, method, *args, **kwargs):
+        """Calls the appliance ``method`` on each appliance, passing it ``log_callback``
+
+        The method has to accept ``log_callback``, like the appliance methods decorated with
+        :py:class:`utils.log.logger_wrap` do.
+
+        Args:
+            method: Name of the method.
+            *args: Positional arguments of the method.
+            appliance_kwargs: Maps an appliance to the keyword arguments only passed to it.
+            requires, raise_on_error: See :py:meth:`map`.
+            **kwargs: Keyword arguments of the method, common for all appliances.
+        """
+        appliance_kwargs = kwargs.pop('appliance_kwargs', None) or {}
+        map_kwargs = {key: kwargs.pop(key) for key in ('requires', 'raise_on_error')
+                      if key in kwargs}
+
+        def call(appliance, log_callback):
+            call_kwargs = dict(kwargs, log_callback=log_callback)
+            call_kwargs.update(appliance_kwargs.get(appliance, {}))
+            return getattr(appliance, method)(*args, **call_kwargs)
+        return self.map(call, name=method, **map_kwargs)
+
+    def configure(self, **kwargs):
+        return self.run('configure', **kwargs)
+
+    def update_rhel(self, *urls, **kwargs):
+        return self.run('update_rhel', *urls, **kwargs)
+
+    def restart_evm_service(self, **kwargs):
+        return self.run('restart_evm_service', **kwargs)
+
+    def reboot(self, **kwargs):
+        return self.run('reboot', **kwargs)
+
+    def wait_for_evm_service(self, **kwargs):
+        return self.run('wait_for_evm_service', **kwargs)
+
+    def wait_for_web_ui(self, **kwargs):
+        return self.run('wait_for_web_ui', **kwargs)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Steps of the appliance configuration, run as a dependency graph.
+
+A step starts as soon as the steps it requires finished, so independent steps run concurrently.
+Steps marked with ``restart`` need the EVM service restarted afterwards, a single restart step
+(:py:meth:`ConfigurationPipeline.add_restart`) runs once after all of them and only if any of
+them changed something.
+"""
+import time
+from collections import OrderedDict
+
+import attr
+from concurrent import futures
+
+from utils.log import logger
+
+
+class PipelineException(Exception):
+    pass
+
+
+@attr.s
+class ConfigurationStep(object):
+    name = attr.ib()
+    func = attr.ib()
+    requires = attr.ib(default=attr.Factory(tuple))
+    restart = attr.ib(default=False)
+
+
+class ConfigurationPipeline(object):
+    """A set of configuration steps of one appliance
+
+    Args:
+        log_callback: Called with the progress messages.
+        max_workers: Maximum number of steps running at once.
+        context: Context manager entered around every step in the thread running it, f.e. the
+            appliance, so it is the current appliance for the step as well.
+
+    Usage:
+        .. code-block:: python
+
+          pipeline = ConfigurationPipeline(log_callback, context=appliance)
+          pipeline.add('ssh', appliance.wait_for_ssh)
+          pipeline.add('cert', appliance.configure_vm_console_cert, requires=['ssh'],
+                       restart=True)
+          pipeline.add_restart('restart', appliance.restart_evm_service)
+          pipeline.add('web_ui', appliance.wait_for_web_ui, requires=['restart'])
+          pipeline.run()
+          pipeline.timings  # {'ssh': 2.1, 'cert': 10.4, 'restart': 30.2, 'web_ui': 120.7}
+    """
+    def __init__(self, log_callback=None, max_workers=4, context=None):
+        self.log_callback = log_callback or logger.info
+        self.max_workers = max_workers
+        self.context = context
+        self.steps = OrderedDict()
+        self.timings = OrderedDict()
+        self._restart_step = None
+        self._restart_needed = False
+
+    def add(self, name, func, requires=(), restart=False):
+        """Adds a step, the required steps have to be added before the pipeline runs
+
+        Args:
+            name: Name of the step, referred to by ``requires`` of the other steps.
+            func: Called with no arguments.
+            requires: Names of the steps that have to finish before this one starts.
+            restart: The EVM service needs to be restarted after this step, unless ``func``
+                returned ``False`` (nothing was changed).
+        """
+        if name in self.steps:
+            raise PipelineException('Step {} was already added'.format(name))
+        self.steps[name] = ConfigurationStep(name, func, tuple(requires), restart)
+
+    def add_restart(self, name, func, requires=()):
+        """Adds the step restarting the EVM service
+
+        It runs after all the steps added with ``restart`` (and after ``requires``), but only if
+        any of them changed something.
+        """
+        self._restart_step = name
+        self.add(name, func, requires)
+
+    def _requirements(self, step):
+        unknown = [name for name in step.requires if name not in self.steps]
+        if unknown:
+            raise PipelineException('Step {} requires unknown steps {}'.format(
+                step.name, ', '.join(unknown)))
+        requires = set(step.requires)
+        if step.name == self._restart_step:
+            requires.update(s.name for s in self.steps.values() if s.restart)
+        return requires
+
+    def _call(self, step):
+        if self.context is None:
+            return step.func()
+        with self.context:
+            return step.func()
+
+    def _run_step(self, step):
+        """Returns the seconds the step took and whether it needs the restart"""
+        if step.name == self._restart_step and not self._restart_needed:
+            self.log_callback('Skipping {}, no step needs it'.format(step.name))
+            return 0.0, False
+        self.log_callback('Starting {}'.format(step.name))
+        start = time.time()
+        try:
+            result = self._call(step)
+        except Exception:
+            logger.exception('Configuration step %s failed', step.name)
+            raise
+        duration = time.time() - start
+        self.log_callback('Finished {} in {:.1f} seconds'.format(step.name, duration))
+        return duration, step.restart and result is not False
+
+    def run(self):
+        """Runs the steps, re-raises the exception of the first step that failed
+
+        The steps already running when a step fails are let finish, no new ones are started.
+
+        Returns: :py:attr:`timings`, seconds taken by each step that ran, in the order they
+            finished.
+        """
+        pending = OrderedDict(
+            (name, self._requirements(step)) for name, step in self.steps.items())
+        finished = set()
+        running = {}
+        error = None
+        start = time.time()
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                if error is None:
+                    for name, requires in list(pending.items()):
+                        if requires <= finished:
+                            del pending[name]
+                            step = self.steps[name]
+                            running[executor.submit(self._run_step, step)] = step
+                if not running:
+                    if error is None:
+                        raise PipelineException('Steps {} can never start, check their '
+                                                'requirements'.format(', '.join(pending)))
+                    break
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        self.timings[step.name], restart = future.result()
+                    except Exception as e:
+                        error = error or e
+                    else:
+                        finished.add(step.name)
+                        self._restart_needed = self._restart_needed or restart
+        finally:
+            executor.shutdown(wait=True)
+        if error is not None:
+            raise error
+        self.log_callback('Configuration finished in {:.1f} seconds: {}'.format(
+            time.time() - start,
+            ', '.join('{} {:.1f}s'.format(name, t) for name, t in self.timings.items())))
+        return self.timings
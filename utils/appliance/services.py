@@ -1,14 +1,171 @@
 # -*- coding: utf-8 -*-
+import time
+from threading import Condition, Event as ThreadEvent, Lock, Thread
+
 import attr
+from utils.log import logger
 from utils.quote import quote
-from utils.wait import wait_for
+from utils.wait import TimedOutError, wait_for
 from .plugin import AppliancePlugin, AppliancePluginException
 
+WATCH_STATE_MARKER = 'systemd_state|'
+WATCH_LOG_MARKER = 'log_marker|'
+
+# Prints the state of the unit whenever it changes and the matching lines of the log as they come
+WATCH_SCRIPT = (
+    "{tail}last=; while :; do state=$(systemctl is-active {unit}); "
+    "if [ \"$state\" != \"$last\" ]; then echo \"{state_marker}$state\"; last=$state; fi; "
+    "sleep {interval}; done")
+WATCH_TAIL_SCRIPT = (
+    "tail -n 0 -F {log_file} 2>/dev/null | grep --line-buffered -E {pattern} | "
+    "sed -u 's/^/{log_marker}/' & ")
+
 
 class SystemdException(AppliancePluginException):
     pass
 
 
+class SystemdWatcher(Thread):
+    """Follows the state of a systemd unit and the marker lines of a log over one SSH channel
+
+    The appliance checks the state every ``interval`` seconds by itself and only the changes are
+    sent, so waiting costs neither a session per check nor the coarse delays between them. If the
+    channel breaks (f.e. the appliance reboots), the state is unknown (``None``) until it is
+    watched again.
+
+    Args:
+        appliance: The appliance the unit runs on.
+        unit_name: Name of the systemd unit.
+        log_file: Log file to watch for ``log_markers``.
+        log_markers: Extended regular expression matching the interesting lines of ``log_file``.
+        interval: Seconds between the checks of the state on the appliance.
+
+    Usage:
+        .. code-block:: python
+
+          with appliance.evmserverd.watch() as watcher:
+              watcher.wait_for_state('active', timeout=600)
+    """
+    def __init__(self, appliance, unit_name, log_file=None, log_markers=None, interval=1):
+        super(SystemdWatcher, self).__init__()
+        self.daemon = True
+        self.appliance = appliance
+        self.unit_name = unit_name
+        self.log_file = log_file
+        self.log_markers = log_markers
+        self.interval = interval
+        #: The last known state of the unit (as in ``systemctl is-active``)
+        self.state = None
+        #: The marker lines seen so far
+        self.markers = []
+        #: Number of the state changes and the marker lines seen so far
+        self.changes = 0
+        self._condition = Condition()
+        self._stop_event = ThreadEvent()
+        self._channel_lock = Lock()
+        self._channel = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def stop(self, timeout=30):
+        self._stop_event.set()
+        with self._channel_lock:
+            if self._channel is not None:
+                self._channel.close()
+        self.join(timeout)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._watch()
+            except Exception as e:
+                # Keep watching, the appliance could be just rebooting
+                logger.debug('Watching %s failed: %s', self.unit_name, e)
+            self._stop_event.wait(5)
+
+    def _watch(self):
+        tail = ''
+        if self.log_file and self.log_markers:
+            tail = WATCH_TAIL_SCRIPT.format(
+                log_file=quote(self.log_file), pattern=quote(self.log_markers),
+                log_marker=WATCH_LOG_MARKER)
+        client = self.appliance.ssh_client
+        # Wrapped like run_command does, so the unit and the log are read through sudo if needed
+        command, _ = client.wrap_command(WATCH_SCRIPT.format(
+            tail=tail, unit=quote(self.unit_name), state_marker=WATCH_STATE_MARKER,
+            interval=self.interval))
+        channel = client.get_transport().open_session()
+        with self._channel_lock:
+            # Stopped while connecting, stop() could not close the channel
+            if self._stop_event.is_set():
+                channel.close()
+                return
+            self._channel = channel
+        try:
+            # With a pseudo-tty the remote loop is hung up when the channel closes
+            self._channel.get_pty()
+            self._channel.exec_command(command)
+            for line in self._channel.makefile('r'):
+                line = line.rstrip('\r\n')
+                if line.startswith(WATCH_STATE_MARKER):
+                    self._changed(state=line[len(WATCH_STATE_MARKER):])
+                elif line.startswith(WATCH_LOG_MARKER):
+                    self._changed(marker=line[len(WATCH_LOG_MARKER):])
+        finally:
+            with self._channel_lock:
+                self._channel.close()
+                self._channel = None
+            self._changed(state=None)
+
+    def _changed(self, state=None, marker=None):
+        with self._condition:
+            if marker is None:
+                if state != self.state:
+                    logger.debug('%s is %s', self.unit_name, state or 'not watched')
+                self.state = state
+            else:
+                logger.debug('%s log: %s', self.unit_name, marker)
+                self.markers.append(marker)
+            self.changes += 1
+            self._condition.notify_all()
+
+    def wait(self, predicate, timeout):
+        """Waits until ``predicate(watcher)`` is true, returns its last value
+
+        The predicate is checked again after every change.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            result = predicate(self)
+            while not result:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+                result = predicate(self)
+            return result
+
+    def wait_for_change(self, changes, timeout):
+        """Waits until there were more than ``changes`` changes, returns whether there were"""
+        return self.wait(lambda watcher: watcher.changes > changes, timeout)
+
+    def wait_for_state(self, state='active', timeout=600):
+        """Waits until the unit is in the ``state``
+
+        Raises:
+            :py:class:`utils.wait.TimedOutError` if it is not in ``timeout`` seconds.
+        """
+        start = time.time()
+        if not self.wait(lambda watcher: watcher.state == state, timeout):
+            raise TimedOutError('Could not do wait for {} to be {} in time, waited {:.0f} '
+                                'seconds'.format(self.unit_name, state, time.time() - start))
+
+
 @attr.s
 class SystemdService(AppliancePlugin):
     unit_name = attr.ib()
@@ -40,7 +197,19 @@ class SystemdService(AppliancePlugin):
     def running(self):
         return self._run_service_command("status") == 0
 
+    def watch(self, log_file=None, log_markers=None, interval=1):
+        """Returns a :py:class:`SystemdWatcher` of the unit, use it as a context manager"""
+        return SystemdWatcher(
+            self.appliance, self.unit_name, log_file=log_file, log_markers=log_markers,
+            interval=interval)
+
     def wait_for_running(self, timeout=600):
-        result, wait = wait_for(lambda: self.running, num_sec=timeout,
-                                fail_condition=False, delay=10)
-        return result
+        if self.appliance.container:
+            # docker exec does not hang up the watching loop with the channel, it would stay running
+            # in the container until the next change of the unit
+            result, wait = wait_for(lambda: self.running, num_sec=timeout,
+                                    fail_condition=False, delay=10)
+            return result
+        with self.watch() as watcher:
+            watcher.wait_for_state('active', timeout=timeout)
+        return True
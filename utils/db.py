@@ -1,12 +1,20 @@
+import os
 from collections import Mapping
 from contextlib import contextmanager
 from itertools import izip
+from threading import Lock, RLock
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from cached_property import cached_property
 from sqlalchemy import MetaData, create_engine, event, inspect
-from sqlalchemy.exc import ArgumentError, DisconnectionError, InvalidRequestError
+from sqlalchemy.exc import (
+    ArgumentError, DisconnectionError, InvalidRequestError, SQLAlchemyError)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Query, scoped_session, sessionmaker
 from sqlalchemy.pool import Pool
 
 from fixtures.pytest_store import store
@@ -14,6 +22,69 @@ from utils import conf, ports
 from utils.log import logger
 
 
+#: Reflected tables shared by the Db instances in this process, keyed by the schema fingerprint
+_schema_caches = {}
+#: Guards the loading of the schema caches and the reflection, which mutates the shared metadata
+_schema_caches_lock = RLock()
+
+#: Engines shared by the Db instances in this process, keyed by the connection URL
+_engines = {}
+_engines_lock = Lock()
+
+#: Rows fetched from a server-side cursor at once by :py:meth:`Db.stream`
+STREAM_FETCH_SIZE = 1000
+
+#: Default pool settings, overridden by the ``db`` section of env.yaml
+ENGINE_POOL_DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    # Connections older than this are replaced, appliance restarts leave them broken anyway
+    'pool_recycle': 600,
+}
+
+
+def shared_engine(db_url):
+    """Returns the process-wide :py:class:`Engine <sqlalchemy:sqlalchemy.engine.Engine>`
+    for the connection URL, creating it if needed
+
+    The pool is configured by :py:data:`ENGINE_POOL_DEFAULTS` and the ``pool_size``,
+    ``max_overflow``, ``pool_timeout`` and ``pool_recycle`` keys of the ``db`` section of env.yaml.
+    Connections are pinged on checkout, see :py:func:`ping_connection`.
+    """
+    with _engines_lock:
+        if db_url not in _engines:
+            db_conf = conf.env.get('db', {})
+            pool_kwargs = {
+                key: db_conf.get(key, default) for key, default in ENGINE_POOL_DEFAULTS.items()}
+            _engines[db_url] = create_engine(db_url, echo_pool=True, **pool_kwargs)
+        return _engines[db_url]
+
+
+def dispose_engines(hostname=None):
+    """Closes the pooled connections of the shared engines (to the host if specified)
+
+    Useful when the database is known to be gone, e.g. after the appliance was redeployed.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            if hostname is None or engine.url.host == hostname:
+                engine.dispose()
+
+
+def _copy_tables(source, target, table_name):
+    """Copies the table and the tables it references from one metadata to another"""
+    pending = [table_name]
+    while pending:
+        name = pending.pop()
+        if name in target.tables or name not in source.tables:
+            continue
+        table = source.tables[name]
+        table.tometadata(target)
+        # target_fullname is [schema.]table.column
+        pending.extend(fk.target_fullname.rsplit('.', 1)[0] for fk in table.foreign_keys)
+
+
 @event.listens_for(Pool, "checkout")
 def ping_connection(dbapi_connection, connection_record, connection_proxy):
     """ping_connection event hook, used to reconnect db sessions that time out
@@ -68,6 +139,10 @@ class Db(Mapping):
         a latent connection, this can be extremely slow, which will affect methods that return
         tables, like the mapping interface or :py:meth:`values`.
 
+        The reflected tables are cached by the :py:attr:`schema_fingerprint`, in the process and
+        in the py.test cache directory, so a table is reflected only once for every schema
+        version, no matter how many Db instances and test sessions use it.
+
     """
     def __init__(self, hostname=None, credentials=None):
         self._table_cache = {}
@@ -155,8 +230,11 @@ class Db(Mapping):
         It uses pessimistic disconnection handling, checking that the database is still
         connected before executing commands.
 
+        The engine and its connection pool are shared by all the Db instances of this process
+        connecting to the same database, see :py:func:`shared_engine`.
+
         """
-        return create_engine(self.db_url, echo_pool=True)
+        return shared_engine(self.db_url)
 
     @cached_property
     def sessionmaker(self):
@@ -205,6 +283,12 @@ class Db(Mapping):
         return sorted(inspect(self.engine).get_table_names())
 
     @cached_property
+    def scoped_session(self):
+        """A :py:class:`scoped_session <sqlalchemy:sqlalchemy.orm.scoping.scoped_session>`
+        keeping one autocommit session per thread"""
+        return scoped_session(sessionmaker(bind=self.engine, autocommit=True))
+
+    @property
     def session(self):
         """Returns a :py:class:`Session <sqlalchemy:sqlalchemy.orm.session.Session>`
 
@@ -213,11 +297,17 @@ class Db(Mapping):
 
         Note:
 
-            This attribute is cached. In cases where a new session needs to be explicitly created,
+            Every thread gets its own session, the same one on every access. Threads that are
+            done with the database should call :py:meth:`remove_session` to give the connection
+            back. In cases where a new session needs to be explicitly created,
             use :py:meth:`sessionmaker`.
 
         """
-        return self.sessionmaker(autocommit=True)
+        return self.scoped_session()
+
+    def remove_session(self):
+        """Closes the session of the current thread, see :py:attr:`session`"""
+        self.scoped_session.remove()
 
     @property
     @contextmanager
@@ -241,14 +331,121 @@ class Db(Mapping):
         with self.session.begin():
             yield
 
+    @cached_property
+    def schema_fingerprint(self):
+        """Identifies the database schema by the number and the latest of the applied migrations
+
+        ``None`` if it can not be determined, the reflected tables are not cached then.
+        """
+        try:
+            count, latest = self.engine.execute(
+                'SELECT count(*), max(version) FROM schema_migrations').first()
+        except SQLAlchemyError as e:
+            logger.warning('[DB] Could not fingerprint the schema: %s', e)
+            return None
+        return '{}-{}'.format(latest, count)
+
+    @cached_property
+    def _schema_cache_file(self):
+        if store.config is None or self.schema_fingerprint is None:
+            return None
+        return store.config.cache.makedir('db_schema').join(
+            '{}.pickle'.format(self.schema_fingerprint))
+
+    def _load_schema_cache(self):
+        cache_file = self._schema_cache_file
+        if cache_file is None or not cache_file.check():
+            return None
+        try:
+            with cache_file.open('rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning('[DB] Could not load the cached schema %s: %s', cache_file, e)
+            return None
+
+    @cached_property
+    def _schema_cache(self):
+        """:py:class:`MetaData <sqlalchemy:sqlalchemy.schema.MetaData>` of the tables reflected
+        on the same schema before"""
+        fingerprint = self.schema_fingerprint
+        if fingerprint is None:
+            return MetaData()
+        with _schema_caches_lock:
+            if fingerprint not in _schema_caches:
+                _schema_caches[fingerprint] = self._load_schema_cache() or MetaData()
+            return _schema_caches[fingerprint]
+
+    def _save_schema_cache(self):
+        cache_file = self._schema_cache_file
+        if cache_file is None:
+            return
+        # Keep the tables other processes reflected in the meantime
+        stored = self._load_schema_cache()
+        if stored is not None:
+            for table_name in stored.tables:
+                _copy_tables(stored, self._schema_cache, table_name)
+        # Written aside and renamed, so the other processes never read a partial file
+        temp_file = cache_file.new(basename='{}.{}'.format(cache_file.basename, os.getpid()))
+        try:
+            with temp_file.open('wb') as f:
+                pickle.dump(self._schema_cache, f, pickle.HIGHEST_PROTOCOL)
+            temp_file.rename(cache_file)
+        except Exception as e:
+            logger.warning('[DB] Could not save the schema cache %s: %s', cache_file, e)
+
+    def stream(self, query, fetch_size=STREAM_FETCH_SIZE, tuples=False):
+        """Yields the rows of a query without loading the whole result into memory
+
+        The query runs in a PostgreSQL server-side (named) cursor on a connection of its own,
+        ``fetch_size`` rows are transferred at a time. Select only the columns you need, the rows
+        are plain result rows rather than ORM objects.
+
+        Args:
+            query: A :py:class:`Query <sqlalchemy:sqlalchemy.orm.query.Query>` or a core
+                selectable.
+            fetch_size: Number of rows fetched from the cursor at once.
+            tuples: Yield plain tuples instead of the rows with attribute access.
+
+        Usage:
+
+            rollups = db['metric_rollups']
+            query = db.session.query(rollups.resource_name, rollups.cpu_usagemhz_rate_average)
+            for name, cpu in db.stream(query.filter(rollups.capture_interval_name == 'hourly')):
+                ...
+
+        """
+        if isinstance(query, Query):
+            query = query.statement
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+            try:
+                while True:
+                    rows = result.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield tuple(row) if tuples else row
+            finally:
+                result.close()
+
     def reflect_table(self, table_name):
         """Populate :py:attr:`metadata` with information on a table
 
+        The table is taken from the schema cache if it was reflected on the same schema before.
+
         Args:
             table_name: The name of a table to reflect
 
         """
-        self.metadata.reflect(only=[table_name])
+        # The schema cache is shared by the threads, f.e. the ones with their own sessions
+        with _schema_caches_lock:
+            if table_name in self._schema_cache.tables:
+                _copy_tables(self._schema_cache, self.metadata, table_name)
+                return
+            self.metadata.reflect(only=[table_name])
+            if table_name in self.metadata.tables:
+                _copy_tables(self.metadata, self._schema_cache, table_name)
+                self._save_schema_cache()
 
     def _table(self, table_name):
         """Retrieves, reflects, and caches table objects
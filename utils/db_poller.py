@@ -0,0 +1,147 @@
+"""Waiting for the appliance database state, with the conditions of all waiters polled together.
+
+Instead of every waiter running its own ``wait_for`` loop with its own query, the conditions are
+registered with the :py:class:`DbPoller` of the appliance (:py:attr:`IPAppliance.db_poller
+<utils.appliance.IPAppliance.db_poller>`), which evaluates all of them on one connection per tick
+and wakes up the waiters whose conditions became true.
+"""
+import time
+from threading import Event as ThreadEvent, Lock, Thread
+
+from utils.log import logger
+from utils.wait import TimedOutError
+
+
+class DbCondition(object):
+    """A query registered with :py:class:`DbPoller` along with the predicate over its result
+
+    Args:
+        query: A :py:class:`Query <sqlalchemy:sqlalchemy.orm.query.Query>` or a core selectable.
+        predicate: Called with the result, the condition is met once it returns a true value.
+        scalar: Pass the first column of the first row to the predicate instead of all the rows.
+    """
+    def __init__(self, query, predicate=bool, scalar=False):
+        self.statement = getattr(query, 'statement', query)
+        self.predicate = predicate
+        self.scalar = scalar
+        self.result = None
+        self.exception = None
+        self.event = ThreadEvent()
+
+    def evaluate(self, connection):
+        """Runs the query, returns True if the condition is met"""
+        result = connection.execute(self.statement)
+        self.result = result.scalar() if self.scalar else result.fetchall()
+        if self.predicate(self.result):
+            self.event.set()
+        return self.event.is_set()
+
+    @property
+    def met(self):
+        return self.event.is_set()
+
+
+class DbPoller(object):
+    """Evaluates the registered :py:class:`DbCondition` s of one appliance together
+
+    The polling thread runs while there are conditions to evaluate. The delay between the ticks
+    starts at ``min_delay`` and grows by ``backoff`` up to ``max_delay`` while nothing changes,
+    a newly registered condition is evaluated right away and resets the delay.
+
+    Args:
+        appliance: The appliance whose database is polled.
+        min_delay: Seconds between the ticks after a change.
+        max_delay: Maximum seconds between the ticks.
+        backoff: Factor the delay grows by after a tick with no condition met.
+
+    Usage:
+        .. code-block:: python
+
+          queue = appliance.db['miq_queue']
+          appliance.db_poller.wait_for(
+              appliance.db.session.query(func.count(queue.id)).filter(queue.state == 'ready'),
+              predicate=lambda count: count == 0, scalar=True, message='queue drained')
+    """
+    def __init__(self, appliance, min_delay=1, max_delay=30, backoff=1.5):
+        self._appliance = appliance
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self._conditions = []
+        self._lock = Lock()
+        self._wakeup = ThreadEvent()
+        self._thread = None
+
+    def register(self, query, predicate=bool, scalar=False):
+        """Registers a condition, see :py:class:`DbCondition` for the arguments
+
+        Returns: The :py:class:`DbCondition`, its ``event`` is set once the condition is met.
+        """
+        condition = DbCondition(query, predicate=predicate, scalar=scalar)
+        with self._lock:
+            self._conditions.append(condition)
+            if self._thread is None or not self._thread.is_alive():
+                # A Thread can only be started once, the poller stops when it has nothing to do
+                self._thread = Thread(target=self.run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+        return condition
+
+    def unregister(self, condition):
+        with self._lock:
+            if condition in self._conditions:
+                self._conditions.remove(condition)
+
+    def wait_for(self, query, predicate=bool, scalar=False, num_sec=600, message=None):
+        """Waits until the condition is met, like :py:func:`utils.wait.wait_for`
+
+        Returns: The result of the query the predicate accepted.
+
+        Raises:
+            :py:class:`utils.wait.TimedOutError` if the condition is not met in ``num_sec``.
+            Whatever the query raised.
+        """
+        message = message or 'wait for the database condition'
+        condition = self.register(query, predicate=predicate, scalar=scalar)
+        start = time.time()
+        try:
+            condition.event.wait(num_sec)
+        finally:
+            self.unregister(condition)
+        if condition.exception is not None:
+            raise condition.exception
+        if not condition.met:
+            raise TimedOutError('Could not do {} in time, waited {:.0f} seconds'.format(
+                message, time.time() - start))
+        logger.debug('Finished %s in %.1f seconds', message, time.time() - start)
+        return condition.result
+
+    def run(self):
+        delay = self.min_delay
+        while True:
+            # Cleared before the conditions are collected, a condition registered from now on
+            # sets it again and cuts the following wait short
+            self._wakeup.clear()
+            with self._lock:
+                conditions = [c for c in self._conditions if not c.met]
+                if not conditions:
+                    self._thread = None
+                    return
+            changed = False
+            try:
+                with self._appliance.db.engine.connect() as connection:
+                    for condition in conditions:
+                        try:
+                            changed = condition.evaluate(connection) or changed
+                        except Exception as e:
+                            # The waiter raises it, a broken query never becomes true
+                            condition.exception = e
+                            condition.event.set()
+                            changed = True
+            except Exception as e:
+                # Could not connect, the appliance might be restarting
+                logger.exception(e)
+            delay = self.min_delay if changed else min(delay * self.backoff, self.max_delay)
+            if self._wakeup.wait(delay):
+                delay = self.min_delay
@@ -6,11 +6,12 @@
 
 from cached_property import cached_property
 from contextlib import contextmanager
-from collections import Iterable
+from collections import Hashable, Iterable
 from datetime import datetime
 from numbers import Number
+from select import select
 from sqlalchemy.sql.expression import func
-from time import sleep
+from time import sleep, time
 from threading import Thread, Event as ThreadEvent
 
 from utils.log import create_sublogger
@@ -290,13 +291,61 @@ class EventListener(Thread):
     """
      accepts "expected" events, listens to db events and compares showed up events with expected
      events. Runs callback function if expected events have it.
+
+     By default, the new events are polled for every 0.2 seconds. With ``notify=True``, a trigger
+     on ``event_streams`` sends a PostgreSQL notification for every inserted event and the listener
+     waits for them on a dedicated connection, so the database is queried only when there are new
+     events. If the trigger can not be installed, the listener falls back to polling.
+     The trigger is shared by the listeners of all the test sessions, each of them holds a shared
+     advisory lock while listening, and the last one to stop drops the trigger and its function.
     """
-    def __init__(self, appliance):
+    NOTIFY_CHANNEL = 'cfme_qe_event_streams'
+    # Safety poll when no notification came for this long, in seconds
+    NOTIFY_POLL_INTERVAL = 30
+    NOTIFY_SETUP = """
+        SELECT pg_advisory_lock_shared(hashtext('{channel}'));
+        CREATE OR REPLACE FUNCTION {channel}_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{channel}', NEW.id::text);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = '{channel}_notify') THEN
+                CREATE TRIGGER {channel}_notify AFTER INSERT ON event_streams
+                    FOR EACH ROW EXECUTE PROCEDURE {channel}_notify();
+            END IF;
+        END;
+        $$;
+        LISTEN {channel};
+    """
+    NOTIFY_TEARDOWN = """
+        UNLISTEN {channel};
+        SELECT pg_advisory_unlock_shared(hashtext('{channel}'));
+        SELECT pg_try_advisory_lock(hashtext('{channel}'));
+    """
+    # Run only if the exclusive lock was taken, so no other listener is left
+    NOTIFY_DROP = """
+        DROP TRIGGER IF EXISTS {channel}_notify ON event_streams;
+        DROP FUNCTION IF EXISTS {channel}_notify();
+        SELECT pg_advisory_unlock(hashtext('{channel}'));
+    """
+
+    # Expected events are indexed by the exact values of these attributes
+    INDEX_ATTRS = ('event_type', 'target_type', 'source')
+
+    def __init__(self, appliance, notify=False):
         super(EventListener, self).__init__()
         self._appliance = appliance
         self._tool = EventTool(self._appliance)
+        self._notify = notify
+        self._notify_connection = None
 
         self._events_to_listen = []
+        # {(event_type, target_type, source): [(position, expected event)]}, None stands for any
+        # value, see _index_key
+        self._events_index = {}
         # last_id is used to ignore already arrived messages the database
         # When database is "cleared" the id of the last event is placed here. That is then used
         # in queries to prevent events of this id and earlier to get in.
@@ -363,10 +412,13 @@ class EventListener(Thread):
             for evt in evts:
                 if isinstance(evt, Event):
                     logger.info("event {} is added to listening queue".format(evt))
-                    self._events_to_listen.append({'event': evt,
-                                                   'callback': callback,
-                                                   'matched_events': [],
-                                                   'first_event': first_event})
+                    exp_event = {'event': evt,
+                                 'callback': callback,
+                                 'matched_events': [],
+                                 'first_event': first_event}
+                    self._events_index.setdefault(self._index_key(evt), []).append(
+                        (len(self._events_to_listen), exp_event))
+                    self._events_to_listen.append(exp_event)
                 else:
                     raise ValueError("one of events doesn't belong to Event class")
         else:
@@ -374,6 +426,8 @@ class EventListener(Thread):
 
     def start(self):
         logger.info('Event Listener has been started')
+        if self._notify:
+            self._notify_connection = self._listen()
         self.set_last_record()
         self._stop_event.clear()
         super(EventListener, self).start()
@@ -383,7 +437,76 @@ class EventListener(Thread):
         self._stop_event.set()
 
     def run(self):
-        self.process_events()
+        try:
+            if self._notify_connection is not None:
+                self.wait_for_notifications()
+            self.process_events()
+        finally:
+            self._unlisten()
+            # The listener thread has its own database session
+            self._appliance.db.remove_session()
+
+    def _listen(self):
+        """Installs the notification trigger and returns the connection listening to it.
+
+        Returns:
+            The psycopg2 connection, None if the trigger could not be installed.
+        """
+        # Detached from the pool, the connection is used only by this listener
+        connection = self._appliance.db.engine.raw_connection()
+        connection.detach()
+        try:
+            connection.connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(self.NOTIFY_SETUP.format(channel=self.NOTIFY_CHANNEL))
+            cursor.close()
+        except Exception as e:
+            logger.warning('Could not listen to the event notifications, polling instead: %s', e)
+            connection.close()
+            return None
+        logger.info('Listening to the event notifications')
+        return connection.connection
+
+    def _unlisten(self):
+        """Stops listening, the last listener drops the notification trigger."""
+        connection, self._notify_connection = self._notify_connection, None
+        if connection is None:
+            return
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.NOTIFY_TEARDOWN.format(channel=self.NOTIFY_CHANNEL))
+            if cursor.fetchone()[0]:
+                logger.info('Last event notification listener, dropping the trigger')
+                cursor.execute(self.NOTIFY_DROP.format(channel=self.NOTIFY_CHANNEL))
+            cursor.close()
+        except Exception as e:
+            logger.warning('Could not remove the event notification trigger: %s', e)
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning('Could not close the notification connection: %s', e)
+
+    def wait_for_notifications(self):
+        """
+        processes the new db events as the notifications about them come.
+        returns when the listener is stopped or when the notification connection breaks.
+        """
+        connection = self._notify_connection
+        last_poll = time()
+        while not self._stop_event.is_set():
+            try:
+                # Short timeout, so the stop is noticed
+                if select([connection], [], [], 0.5)[0]:
+                    connection.poll()
+                notified = bool(connection.notifies)
+                del connection.notifies[:]
+            except Exception as e:
+                logger.warning('Event notifications broke, polling instead: %s', e)
+                return
+            # Notifications could be lost while the connection was being set up
+            if notified or time() - last_poll > self.NOTIFY_POLL_INTERVAL:
+                self.process_portion(self.get_next_portion())
+                last_poll = time()
 
     @property
     def started(self):
@@ -399,21 +522,58 @@ class EventListener(Thread):
             if len(events) == 0:
                 sleep(0.2)
                 continue
-            for got_event in events:
-                logger.debug("processing event id {}".format(got_event.id))
-                got_event = Event(event_tool=self._tool).build_from_raw_event(got_event)
-                for exp_event in self._events_to_listen:
-                    if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
-                        continue
-
-                    if exp_event['event'].matches(got_event):
-                        if exp_event['callback']:
-                            exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
-                        exp_event['matched_events'].append(got_event)
-                self.set_last_record(got_event)
-
-                if self._stop_event.is_set():
-                    break
+            self.process_portion(events)
+
+    def process_portion(self, events):
+        """
+        compares the given db events with expected events
+        """
+        for got_event in events:
+            logger.debug("processing event id {}".format(got_event.id))
+            got_event = Event(event_tool=self._tool).build_from_raw_event(got_event)
+            for exp_event in self._candidates(got_event):
+                if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
+                    continue
+
+                if exp_event['event'].matches(got_event):
+                    if exp_event['callback']:
+                        exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
+                    exp_event['matched_events'].append(got_event)
+            self.set_last_record(got_event)
+
+            if self._stop_event.is_set():
+                break
+
+    def _index_key(self, evt):
+        """
+        returns the exact values of the expected event's index attributes.
+        attributes which are missing, empty or compared by a function match any value (None)
+        """
+        key = []
+        for name in self.INDEX_ATTRS:
+            attr = evt.event_attrs.get(name)
+            if attr is None or not attr.value or attr.cmp_func or \
+                    not isinstance(attr.value, Hashable):
+                key.append(None)
+            else:
+                key.append(attr.value)
+        return tuple(key)
+
+    def _candidates(self, got_event):
+        """
+        returns the expected events which can match the got event, in the order of registration.
+        looks up every combination of the got event's index attributes and "any value", so the
+        cost does not grow with the number of expected events that can not match
+        """
+        keys = [()]
+        for name in self.INDEX_ATTRS:
+            attr = got_event.event_attrs.get(name)
+            values = (None,) if attr is None or not attr.value else (attr.value, None)
+            keys = [key + (value,) for key in keys for value in values]
+        candidates = []
+        for key in keys:
+            candidates.extend(self._events_index.get(key, []))
+        return [exp_event for _, exp_event in sorted(candidates, key=lambda c: c[0])]
 
     @property
     def got_events(self):
@@ -430,6 +590,7 @@ class EventListener(Thread):
 
     def reset_events(self):
         self._events_to_listen = []
+        self._events_index = {}
 
     def get_next_portion(self):
         logger.debug("obtaining next portion of events")
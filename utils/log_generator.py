@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*
+"""Generators of synthetic appliance logs.
+
+The generated ``evm.log``, ``top_output.log`` and ``production.log`` files follow the formats the
+log processing code (f.e. :py:mod:`utils.perf_message_stats`, :py:mod:`utils.log_validator`)
+expects, so the parsers can be benchmarked offline, without a dump of a real appliance.
+
+Usage:
+    .. code-block:: python
+
+      generator = ApplianceLogGenerator(seed=42)
+      generator.evm_log('/tmp/evm.log', size=50 * 1024 * 1024)
+      generator.top_output_log('/tmp/top_output.log', size=10 * 1024 * 1024)
+      generator.production_log('/tmp/production.log', size=10 * 1024 * 1024)
+"""
+import random
+from collections import deque
+from datetime import datetime, timedelta
+
+# Command: (weight, role, args) of the messages put on the queue, {} in args is a timestamp
+EVM_MESSAGE_MIX = {
+    'Metric::Capture.perf_capture_timer': (5, 'ems_metrics_coordinator', '[]'),
+    'Vm.perf_capture_realtime': (30, 'ems_metrics_collector', '[]'),
+    'Host.perf_capture_realtime': (10, 'ems_metrics_collector', '[]'),
+    'Vm.perf_rollup': (15, 'ems_metrics_processor', '["{}", "hourly"]'),
+    'Host.perf_rollup': (5, 'ems_metrics_processor', '["{}", "daily"]'),
+    'EmsRefresh.refresh': (5, 'ems_inventory', '[[["EmsVmware", 1]]]'),
+    'MiqEvent.raise_evm_event': (15, 'event', '[["Vm", 42], "vm_start", {}]'),
+    'MiqServer.status_update': (5, '', '[]'),
+    'MiqServer.ntp_reload': (1, '', '[]'),
+    'MiqAlert.evaluate_alerts': (9, 'notifier', '[["Vm", 42], "vm_perf_complete"]'),
+}
+
+# Worker type: count
+EVM_WORKERS = {
+    'MiqGenericWorker': 2,
+    'MiqPriorityWorker': 2,
+    'MiqScheduleWorker': 1,
+    'MiqEventHandler': 1,
+    'MiqEmsMetricsProcessorWorker': 2,
+    'MiqEmsRefreshCoreWorker': 1,
+    'MiqUiWorker': 1,
+    'MiqWebServiceWorker': 1,
+}
+
+EVM_NOISE = [
+    ('I', 'INFO', 'MIQ(MiqServer#heartbeat) Heartbeat [2017-06-01 10:00:00 UTC]...Complete'),
+    ('I', 'INFO', 'MIQ(MiqScheduleWorker::Runner#do_work) Number of scheduled items to be processed'
+        ': 1.'),
+    ('D', 'DEBUG', 'MIQ(VmOrTemplate#post_refresh_ems) Processing Vm: [test_vm_1]'),
+    ('W', 'WARN', 'MIQ(MiqQueue#deliver) Message id: [0], Timed Out after 600 seconds'),
+    ('E', 'ERROR', 'MIQ(EmsRefresh.refresh) EMS: [vsphere], id: [1] Refresh failed'),
+]
+
+PRODUCTION_REQUESTS = [
+    ('GET', '/api', 'Api::ApiController#index'),
+    ('GET', '/api/vms', 'Api::VmsController#index'),
+    ('GET', '/dashboard/show', 'DashboardController#show'),
+    ('POST', '/vm_infra/explorer', 'VmInfraController#explorer'),
+    ('GET', '/ems_infra/show_list', 'EmsInfraController#show_list'),
+]
+
+
+class ApplianceLogGenerator(object):
+    """Generates realistic looking appliance logs of a given size.
+
+    The same workers (ids and pids) are used in all the logs of one generator, so f.e. the
+    ``top_output.log`` samples match the workers started in the ``evm.log``.
+
+    Args:
+        seed: Seed of the random generator, same seeds generate same logs.
+        start: Date/time of the first log line.
+        message_mix: Dictionary of command: (weight, role, args), see :py:const:`EVM_MESSAGE_MIX`.
+        noise_ratio: Ratio of the evm.log lines not related to the queue or the workers.
+        worker_restart_ratio: Ratio of the evm.log lines restarting a worker.
+    """
+
+    def __init__(self, seed=0, start=None, message_mix=None, noise_ratio=0.3,
+            worker_restart_ratio=0.0005):
+        self.random = random.Random(seed)
+        self.start = start or datetime(2017, 6, 1, 10, 0, 0)
+        self.message_mix = message_mix or EVM_MESSAGE_MIX
+        self.noise_ratio = noise_ratio
+        self.worker_restart_ratio = worker_restart_ratio
+        self._commands = []
+        for cmd, (weight, role, args) in sorted(self.message_mix.items()):
+            self._commands.extend([cmd] * weight)
+        self._next_worker_id = 1
+        self._next_pid = 3000
+        self.workers = {}
+        for worker_type, count in sorted(EVM_WORKERS.items()):
+            for i in range(count):
+                self._new_worker(worker_type)
+
+    def _new_worker(self, worker_type):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        self._next_pid += self.random.randint(1, 50)
+        self.workers[worker_id] = (worker_type, self._next_pid)
+        return worker_id
+
+    def _evm_line(self, ts, pid, level, message):
+        return '[----] {}, [{} #{}:{:x}]  {} -- : {}\n'.format(
+            level[0], ts.strftime('%Y-%m-%dT%H:%M:%S.%f'), pid, pid * 7919, level[1], message)
+
+    def evm_line_generator(self):
+        """Yields the evm.log lines endlessly."""
+        ts = self.start
+        for worker_id, (worker_type, pid) in sorted(self.workers.items()):
+            yield self._evm_line(ts, 1000, ('I', 'INFO'),
+                'MIQ({}) ID [{}], PID [{}], GUID [{:032x}] Worker started'.format(
+                    worker_type, worker_id, pid, worker_id))
+
+        msg_id = 0
+        queued = deque()
+        dequeued = deque()
+        while True:
+            ts += timedelta(microseconds=self.random.randint(100, 200000))
+            worker_id = self.random.choice(self.workers.keys())
+            worker_type, pid = self.workers[worker_id]
+            roll = self.random.random()
+            if roll < self.worker_restart_ratio:
+                reason = self.random.choice(
+                    ['evm_worker_memory_exceeded', 'evm_worker_uptime_exceeded', 'evm_worker_stop'])
+                yield self._evm_line(ts, 1000, ('I', 'INFO'),
+                    'MIQ(MiqServer#worker_not_responding) "{}" for Worker with ID: [{}]'.format(
+                        reason, worker_id))
+                del self.workers[worker_id]
+                new_id = self._new_worker(worker_type)
+                yield self._evm_line(ts, 1000, ('I', 'INFO'),
+                    'MIQ({}) ID [{}], PID [{}], GUID [{:032x}] Worker started'.format(
+                        worker_type, new_id, self.workers[new_id][1], new_id))
+            elif roll < self.noise_ratio:
+                yield self._evm_noise(ts, pid)
+            elif dequeued and self.random.random() < 0.33:
+                msg_id_, cmd, args = dequeued.popleft()
+                yield self._evm_line(ts, pid, ('I', 'INFO'),
+                    'MIQ(MiqQueue.delivered) Message id: [{}], State: [ok], Delivered in [{}] '
+                    'seconds'.format(msg_id_, round(self.random.expovariate(0.5), 6)))
+            elif queued and self.random.random() < 0.5:
+                msg_id_, cmd, args = queued.popleft()
+                dequeued.append((msg_id_, cmd, args))
+                yield self._evm_line(ts, pid, ('I', 'INFO'),
+                    'MIQ(MiqQueue.get_via_drb) Message id: [{}], MiqWorker id: [{}], Zone: '
+                    '[default], Role: [], Server: [], Ident: [generic], Target id: [], Instance '
+                    'id: [], Task id: [], Command: [{}], Timeout: [600], Priority: [100], State: '
+                    '[dequeue], Deliver On: [], Data: [], Args: {}, Dequeued in: [{}] '
+                    'seconds'.format(msg_id_, worker_id, cmd, args,
+                        round(self.random.expovariate(0.2), 6)))
+            else:
+                msg_id += 1
+                cmd = self.random.choice(self._commands)
+                weight, role, args = self.message_mix[cmd]
+                args = args.format(ts.strftime('%Y-%m-%dT%H:00:00Z'))
+                queued.append((msg_id, cmd, args))
+                yield self._evm_line(ts, pid, ('I', 'INFO'),
+                    'MIQ(MiqQueue.put) Message id: [{}],  id: [], Zone: [default], Role: [{}], '
+                    'Server: [], Ident: [generic], Target id: [], Instance id: [], Task id: [], '
+                    'Command: [{}], Timeout: [600], Priority: [100], State: [ready], Deliver On: '
+                    '[], Data: [], Args: {}'.format(msg_id, role, cmd, args))
+
+    def _evm_noise(self, ts, pid):
+        short_level, level, message = self.random.choice(EVM_NOISE)
+        return self._evm_line(ts, pid, (short_level, level), message)
+
+    def top_output_line_generator(self):
+        """Yields the top_output.log lines endlessly, one top sample per minute."""
+        ts = self.start
+        while True:
+            ts += timedelta(minutes=1)
+            if ts.minute == 0 or ts == self.start + timedelta(minutes=1):
+                # miqtop: .* is-> Mon Jan 26 08:57:39 UTC 2015 +0000
+                yield 'miqtop: timesync: date time is-> {} UTC {} +0000\n'.format(
+                    ts.strftime('%a %b %d %H:%M:%S'), ts.year)
+            idle = round(self.random.uniform(20, 95), 1)
+            user = round((100 - idle) * 0.8, 1)
+            system = round(100 - idle - user, 1)
+            used = self.random.randint(4000000, 5800000)
+            yield 'top - {} up 1 day,  2:03,  0 users,  load average: 0.52, 0.58, 0.59\n'.format(
+                ts.strftime('%H:%M:%S'))
+            yield 'Tasks: 250 total,   1 running, 249 sleeping,   0 stopped,   0 zombie\n'
+            yield ('Cpu(s): {}%us,  {}%sy,  0.0%ni, {}%id,  0.0%wa,  0.0%hi,  0.0%si,  0.0%st\n'
+                .format(user, system, idle))
+            yield 'Mem:   5990952k total,  {}k used,  {}k free,   441444k buffers\n'.format(
+                used, 5990952 - used)
+            yield 'Swap:  9957368k total,        0k used,  9957368k free,  1153156k cached\n'
+            yield '\n'
+            yield '  PID  PPID USER      PR  NI  VIRT  RES  SHR S %CPU %MEM    TIME+  COMMAND\n'
+            for worker_id, (worker_type, pid) in sorted(self.workers.items()):
+                yield '{} 2320 root 30 10 {}m {}m 2444 S {} {} 0:09.38 {}\n'.format(
+                    pid, self.random.randint(300, 900), round(self.random.uniform(150, 400), 1),
+                    round(self.random.uniform(0, 30), 1), round(self.random.uniform(2, 8), 1),
+                    worker_type)
+            yield '\n'
+
+    def production_line_generator(self, api_ratio=0.5):
+        """Yields the production.log lines endlessly.
+
+        Args:
+            api_ratio: Ratio of the requests to the ``/api``, the rest are UI requests.
+        """
+        ts = self.start
+        while True:
+            ts += timedelta(microseconds=self.random.randint(1000, 500000))
+            pid = self.random.choice(self.workers.values())[1]
+            if self.random.random() < api_ratio:
+                method, path, controller = PRODUCTION_REQUESTS[self.random.randint(0, 1)]
+            else:
+                method, path, controller = self.random.choice(PRODUCTION_REQUESTS[2:])
+            yield self._evm_line(ts, pid, ('I', 'INFO'), 'Started {} "{}" for 127.0.0.1 at {}'
+                .format(method, path, ts.strftime('%Y-%m-%d %H:%M:%S +0000')))
+            yield self._evm_line(ts, pid, ('I', 'INFO'), 'Processing by {} as {}'.format(
+                controller, 'JSON' if path.startswith('/api') else 'HTML'))
+            yield self._evm_line(ts, pid, ('I', 'INFO'),
+                'Completed 200 OK in {}ms (Views: {}ms | ActiveRecord: {}ms)'.format(
+                    self.random.randint(5, 3000), round(self.random.uniform(0, 50), 1),
+                    round(self.random.uniform(0, 500), 1)))
+
+    def _write(self, filename, lines, size):
+        written = 0
+        with open(filename, 'w') as f:
+            for line in lines:
+                f.write(line)
+                written += len(line)
+                if written >= size:
+                    break
+        return written
+
+    def evm_log(self, filename, size):
+        """Writes an evm.log of ``size`` bytes (rounded up to the whole line)."""
+        return self._write(filename, self.evm_line_generator(), size)
+
+    def top_output_log(self, filename, size):
+        """Writes a top_output.log of ``size`` bytes (rounded up to the whole line)."""
+        return self._write(filename, self.top_output_line_generator(), size)
+
+    def production_log(self, filename, size, api_ratio=0.5):
+        """Writes a production.log of ``size`` bytes (rounded up to the whole line)."""
+        return self._write(filename, self.production_line_generator(api_ratio), size)
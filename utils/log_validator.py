@@ -1,9 +1,75 @@
 import re
 import pytest
+from threading import Event as ThreadEvent, Lock, Thread
 
 from ssh import SSHTail
 from utils.log import logger
 
+# Numbered back references and references to named groups would point to other groups once the
+# pattern is a part of the combined alternation
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+# Inline flags apply to the whole regular expression, not only to the pattern they are in
+_INLINE_FLAGS = re.compile(r'\(\?[iLmsux]+\)')
+
+
+class _PatternSet(object):
+    """Patterns of one category, compiled into as few regular expressions as possible.
+
+    Every pattern becomes a named group of an alternation, so one ``match`` call per line tells
+    which of the patterns matched at the beginning of the line (the first one in the list order,
+    as with matching the patterns one by one). Patterns with back references or inline flags
+    (f.e. ``(?i)``) are matched separately, a combined alternation holds at most ``chunk_size``
+    patterns as Python 2 limits the number of groups in a regular expression.
+    """
+    chunk_size = 50
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._compile()
+
+    def _compile(self):
+        # [(regex, index of the pattern or None for a combined alternation)] in the list order
+        self._regexes = []
+        chunk = []
+        for index, pattern in enumerate(self.patterns):
+            if _BACKREFERENCE.search(pattern) or _INLINE_FLAGS.search(pattern):
+                self._add_chunk(chunk)
+                chunk = []
+                self._regexes.append((re.compile(pattern), index))
+            else:
+                chunk.append(index)
+                if len(chunk) == self.chunk_size:
+                    self._add_chunk(chunk)
+                    chunk = []
+        self._add_chunk(chunk)
+
+    def _add_chunk(self, indexes):
+        if not indexes:
+            return
+        try:
+            self._regexes.append((re.compile('|'.join(
+                '(?P<_p{}>{})'.format(index, self.patterns[index]) for index in indexes)), None))
+        except (re.error, AssertionError, OverflowError):
+            # Clashing group names or too many groups of the patterns themselves
+            for index in indexes:
+                self._regexes.append((re.compile(self.patterns[index]), index))
+
+    def __nonzero__(self):
+        return bool(self.patterns)
+    __bool__ = __nonzero__
+
+    def match(self, line):
+        """Returns the first of the patterns matching at the beginning of the line, or None."""
+        for regex, index in self._regexes:
+            match = regex.match(line)
+            if match is not None:
+                return self.patterns[int(match.lastgroup[2:]) if index is None else index]
+        return None
+
+    def remove(self, pattern):
+        self.patterns.remove(pattern)
+        self._compile()
+
 
 class LogValidator(object):
     """
@@ -22,6 +88,11 @@ class LogValidator(object):
     to be possible to skip particular ERROR log,
     but fail for wider range of other ERRORs.
 
+    The patterns of each category are compiled into a combined regular expression,
+    so every line is matched once per category regardless of the number of patterns.
+    With :py:meth:`start_background_validation` the lines are validated while the test runs,
+    leaving only the last few lines for :py:meth:`validate_logs`.
+
     Args:
         remote_filename: path to the remote log file
         skip_patterns: array of skip regex patterns
@@ -35,6 +106,7 @@ class LogValidator(object):
                                   failure_patterns=['.*ERROR.*'],
                                   matched_patterns=['PARTICULAR_INFO'])
           evm_tail.fix_before_start()
+          evm_tail.start_background_validation()  # optional
           evm_tail.validate_logs()
     """
 
@@ -45,36 +117,97 @@ class LogValidator(object):
 
         self._remote_file_tail = SSHTail(remote_filename, **kwargs)
         self.matches = {}
+        self._compiled = None
+        self._compiled_patterns = None
+        self._failure = None
+        self._lock = Lock()
+        self._stop_event = ThreadEvent()
+        self._thread = None
 
     def fix_before_start(self):
         self._remote_file_tail.set_initial_file_end()
 
+    def start_background_validation(self, interval=5):
+        """Validates the new lines of the remote file every ``interval`` seconds.
+
+        A matched failure pattern is reported by :py:meth:`validate_logs`, which also stops the
+        background validation.
+        """
+        self._stop_event.clear()
+        self._thread = Thread(target=self._validate_in_background, args=(interval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop_background_validation(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _validate_in_background(self, interval):
+        while not self._stop_event.wait(interval) and self._failure is None:
+            try:
+                self._check_lines(self._remote_file_tail)
+            except Exception as e:
+                # Keep validating, the lines are picked up by the next poll
+                logger.exception(e)
+
     def validate_logs(self):
-        for line in self._remote_file_tail:
-            if self._check_skip_logs(line):
-                continue
-            self._check_fail_logs(line)
-            self._check_match_logs(line)
+        self.stop_background_validation()
+        self.validate_lines(self._remote_file_tail)
+
+    def validate_lines(self, lines):
+        """Validates the given lines instead of the ones tailed from the remote file"""
+        self._check_lines(lines)
+        if self._failure is not None:
+            pytest.fail(self._failure)
         self._verify_match_logs()
 
-    def _check_skip_logs(self, line):
-        for pattern in self.skip_patterns:
-            if re.match(pattern, line):
-                logger.info('Skip pattern {} was matched on line {},\
-                            so skipping this line'.format(pattern, line))
-                return True
-        return False
+    def _compile_patterns(self):
+        # Compiled lazily and again whenever the public pattern lists were changed
+        patterns = (
+            tuple(self.skip_patterns), tuple(self.failure_patterns), tuple(self.matched_patterns))
+        if patterns != self._compiled_patterns:
+            self._compiled_patterns = patterns
+            self._compiled = (
+                _PatternSet(self.skip_patterns),
+                _PatternSet(self.failure_patterns),
+                _PatternSet(p for p in self.matched_patterns if p not in self.matches))
+        return self._compiled
 
-    def _check_fail_logs(self, line):
-        for pattern in self.failure_patterns:
-            if re.match(pattern, line):
-                pytest.fail('Failure pattern {} was matched on line {}'.format(pattern, line))
+    def _check_lines(self, lines):
+        with self._lock:
+            skip, failure, matched = self._compile_patterns()
+            for line in lines:
+                if self._failure is not None:
+                    return
+                if skip and self._check_skip_logs(skip, line):
+                    continue
+                if failure:
+                    self._check_fail_logs(failure, line)
+                if matched:
+                    self._check_match_logs(matched, line)
 
-    def _check_match_logs(self, line):
-        for pattern in self.matched_patterns:
-            if re.match(pattern, line):
-                logger.info('Expected pattern {} was matched on line {}'.format(pattern, line))
-                self.matches[pattern] = True
+    def _check_skip_logs(self, skip, line):
+        pattern = skip.match(line)
+        if pattern is None:
+            return False
+        logger.info('Skip pattern %s was matched on line %s, so skipping this line', pattern, line)
+        return True
+
+    def _check_fail_logs(self, failure, line):
+        pattern = failure.match(line)
+        if pattern is not None:
+            self._failure = 'Failure pattern {} was matched on line {}'.format(pattern, line)
+
+    def _check_match_logs(self, matched, line):
+        # Matched patterns are dropped from the set, only the remaining ones can match the line
+        pattern = matched.match(line)
+        while pattern is not None:
+            logger.info('Expected pattern %s was matched on line %s', pattern, line)
+            self.matches[pattern] = True
+            matched.remove(pattern)
+            pattern = matched.match(line) if matched else None
 
     def _verify_match_logs(self):
         for pattern in self.matched_patterns:
@@ -1,6 +1,10 @@
 """Functions that performance tests use."""
+from copy import deepcopy
+from threading import Event as ThreadEvent, Lock, Thread
+
 from fixtures.pytest_store import store
-from utils.ssh import SSHClient, SSHTail
+from utils.quote import quote
+from utils.ssh import SSHClient, SSHMultiTail, SSHTail
 from utils.log import logger
 import numpy
 import time
@@ -124,3 +128,109 @@ def set_rails_loglevel(level, validate_against_worker='MiqUiWorker'):
         evm_tail.close()
     else:
         logger.info('Log level_rails already set to {}'.format(level))
+
+
+class PerfTelemetryCollector(Thread):
+    """Streams evm.log and top_output.log off the appliance while a workload is running.
+
+    Every ``interval`` seconds the new lines are fed into the incremental parsers of
+    :py:mod:`utils.perf_message_stats`, so the hourly message statistics and the worker CPU/Memory
+    series are available during the run without copying the whole logs back once it is over.
+
+    Args:
+        interval: Seconds to wait between reading the new lines.
+        msg_filters: Message args filters, see
+            :py:class:`utils.perf_message_stats.EvmMessageParser`, defaults to the filters of the
+            post-run report.
+        connect_kwargs: Passed to :py:class:`utils.ssh.SSHMultiTail`.
+
+    Usage:
+        .. code-block:: python
+
+          collector = PerfTelemetryCollector(interval=30)
+          collector.start()
+          # ... run the workload
+          hourly_buckets, top_workers = collector.snapshot()
+          collector.stop()
+    """
+    evm_log = '/var/www/miq/vmdb/log/evm.log'
+    top_log = '/var/www/miq/vmdb/log/top_output.log'
+
+    def __init__(self, interval=15, msg_filters=None, **connect_kwargs):
+        # Imported here as utils.perf_message_stats imports from this module
+        from utils.perf_message_stats import (
+            EvmMessageParser, EvmWorkerParser, TopWorkerParser, msg_filters as report_filters)
+        super(PerfTelemetryCollector, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        # Both logs are followed over one connection, with one remote command per interval
+        self._tail = SSHMultiTail([self.evm_log, self.top_log], **connect_kwargs)
+        if msg_filters is None:
+            msg_filters = report_filters
+        self.message_parser = EvmMessageParser(
+            msg_filters, track_hourly=True, partial=True, keep_delivered=False)
+        self.worker_parser = EvmWorkerParser()
+        self.top_parser = TopWorkerParser(self.worker_parser.workers)
+        self._lock = Lock()
+        self._stop_event = ThreadEvent()
+
+    def start(self):
+        from utils.perf_message_stats import miqwkr_grep
+        logger.info('Starting perf telemetry collection')
+        self._tail.set_initial_file_end()
+        # Workers started before the collection would never be recognized in top_output
+        result = self._tail.run_command(
+            'grep {} {}'.format(quote(miqwkr_grep), self.evm_log))
+        for line in result.output.splitlines():
+            self.worker_parser.feed(line)
+        # top lines only carry the time, the date comes from the last miqtop line
+        result = self._tail.run_command(
+            "grep '^miqtop:' {} | tail -n 1".format(self.top_log))
+        if result.success and result.output.strip():
+            self.top_parser.feed(result.output.strip())
+        self._stop_event.clear()
+        super(PerfTelemetryCollector, self).start()
+
+    def stop(self):
+        logger.info('Stopping perf telemetry collection')
+        self._stop_event.set()
+        self.join()
+        # Pick up whatever was logged since the last interval
+        self.collect()
+        self._tail.close()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.collect()
+            except Exception as e:
+                # Keep collecting, the appliance could be just too busy to answer
+                logger.exception(e)
+            self._stop_event.wait(self.interval)
+
+    def collect(self):
+        """Reads the new log lines and feeds them into the parsers."""
+        with self._lock:
+            for filename, line in self._tail:
+                if filename == self.evm_log:
+                    self.message_parser.feed(line)
+                    self.worker_parser.feed(line)
+                else:
+                    self.top_parser.feed(line)
+
+    @property
+    def workers(self):
+        return self.worker_parser.workers
+
+    def snapshot(self):
+        """Returns copies of the rolling hourly buckets and the worker CPU/Memory series.
+
+        Returns:
+            A tuple of ``hourly_buckets[msg_cmd][date][hour]`` and ``top_workers[worker_id]``, see
+            :py:func:`utils.perf_message_stats.messages_to_hourly_buckets` and
+            :py:func:`utils.perf_message_stats.top_to_workers`.
+        """
+        with self._lock:
+            return (
+                deepcopy(self.message_parser.hourly_buckets),
+                deepcopy(self.top_parser.top_workers))
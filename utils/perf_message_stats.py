@@ -9,6 +9,7 @@ from utils.perf import generate_statistics
 from datetime import datetime
 import dateutil.parser as du_parser
 from datetime import timedelta
+from multiprocessing import Pool
 from time import time
 import csv
 import numpy
@@ -17,6 +18,9 @@ import pygal
 import subprocess
 import re
 
+# Charted series are downsampled to roughly this many points, more just make the pages slow
+CHART_MAX_POINTS = 1000
+
 # Regular Expressions to capture relevant information from each log line:
 
 # [----] I, [2014-03-04T08:11:14.320377 #3450:b15814]  INFO -- : ....
@@ -35,6 +39,16 @@ miqmsg_deq = re.compile(r'Dequeued\sin:\s\[([0-9\.]*)\]\sseconds')
 # Delivered in [ * ] seconds
 miqmsg_del = re.compile(r'Delivered\sin\s\[([0-9\.]*)\]\sseconds')
 
+# Message args filters telling apart f.e. hourly and daily rollups of the same command
+msg_filters = {
+    '-hourly': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"hourly\"'),
+    '-daily': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"daily\"'),
+    '-EmsRedhat': re.compile(r'\[\[\"EmsRedhat\"\,\s[0-9]*\]\]'),
+    '-EmsVmware': re.compile(r'\[\[\"EmsVmware\"\,\s[0-9]*\]\]'),
+    '-EmsAmazon': re.compile(r'\[\[\"EmsAmazon\"\,\s[0-9]*\]\]'),
+    '-EmsOpenstack': re.compile(r'\[\[\"EmsOpenstack\"\,\s[0-9]*\]\]')
+}
+
 # Worker related regular expressions:
 # MIQ(PriorityWorker) ID [15], PID [6461]
 miqwkr = re.compile(r'MIQ\(([A-Za-z]*)\)\sID\s\[([0-9]*)\],\sPID\s\[([0-9]*)\]')
@@ -42,6 +56,9 @@ miqwkr = re.compile(r'MIQ\(([A-Za-z]*)\)\sID\s\[([0-9]*)\],\sPID\s\[([0-9]*)\]')
 miqwkr_id = re.compile(r'with\sID:\s\[([0-9]*)\]')
 # For use with workers exiting, such as authentication failures:
 miqwkr_id_2 = re.compile(r'ID\s\[([0-9]*)\]')
+# grep pattern of the evm.log lines relevant to the worker starts and terminations
+miqwkr_grep = ('Interrupt\\|MIQ([A-Za-z]*) ID\\|"evm_worker_uptime_exceeded\\|'
+    '"evm_worker_memory_exceeded\\|"evm_worker_stop\\|Worker exiting.')
 
 # top regular expressions
 # Cpu(s): 13.7%us,  1.2%sy,  2.1%ni, 80.0%id,  1.7%wa,  0.0%hi,  0.1%si,  1.3%st
@@ -60,95 +77,26 @@ miq_top = re.compile(r'([0-9]+)\s+[0-9]+\s+[A-Za-z0-9]+\s+[0-9]+\s+[0-9\-]+\s+([
 
 
 def evm_to_messages(evm_file, filters):
-    test_start = ''
-    test_end = ''
-    line_count = 0
-    messages = {}
     msg_cmds = {}
 
     runningtime = time()
+    parser = EvmMessageParser(filters)
     evmlogfile = open(evm_file, 'r')
     evm_log_line = evmlogfile.readline()
     while evm_log_line:
-        line_count += 1
-        evm_log_line = evm_log_line.strip()
-
-        miqmsg_result = miqmsg.search(evm_log_line)
-        if miqmsg_result:
-
-            # Obtains the first timestamp in the log file
-            if test_start == '':
-                ts, pid = get_msg_timestamp_pid(evm_log_line)
-                test_start = ts
-
-            # A message was first put on the queue, this starts its queuing time
-            if (miqmsg_result.group(1) == 'MiqQueue.put'):
-
-                msg_cmd = get_msg_cmd(evm_log_line)
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
-                    test_end = ts
-                    messages[msg_id] = MiqMsgStat()
-                    messages[msg_id].msg_id = msg_id
-                    messages[msg_id].msg_id = '\'' + msg_id + '\''
-                    messages[msg_id].msg_cmd = msg_cmd
-                    messages[msg_id].pid_put = pid
-                    messages[msg_id].puttime = ts
-                    msg_args = get_msg_args(evm_log_line)
-                    if msg_args is False:
-                        logger.debug('Could not obtain message args line #: %s', line_count)
-                    else:
-                        messages[msg_id].msg_args = msg_args
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-            elif (miqmsg_result.group(1) == 'MiqQueue.get_via_drb'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    if msg_id in messages:
-                        ts, pid = get_msg_timestamp_pid(evm_log_line)
-                        test_end = ts
-                        messages[msg_id].pid_get = pid
-                        messages[msg_id].gettime = ts
-                        messages[msg_id].deq_time = get_msg_deq(evm_log_line)
-                    else:
-                        logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-            elif (miqmsg_result.group(1) == 'MiqQueue.delivered'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
-                    test_end = ts
-                    if msg_id in messages:
-                        messages[msg_id].del_time = get_msg_del(evm_log_line)
-                        messages[msg_id].total_time = messages[msg_id].deq_time + \
-                            messages[msg_id].del_time
-                    else:
-                        logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
+        parser.feed(evm_log_line)
 
-        if (line_count % 100000) == 0:
+        if (parser.line_count % 100000) == 0:
             timediff = time() - runningtime
             runningtime = time()
-            logger.info('Count {} : Parsed 100000 lines in %s', line_count, timediff)
+            logger.info('Count %s : Parsed 100000 lines in %s', parser.line_count, timediff)
 
         evm_log_line = evmlogfile.readline()
+    messages = parser.messages
 
-    # I tried to avoid two loops but this reduced the complexity of filtering on messages.
-    # By filtering over messages, we can better display what is occuring under the covers, as a
-    # daily rollup is picked up off the queue different than a hourly rollup, etc
+    # Filters are already applied by the parser while the messages are put on the queue, so the
+    # message commands only need to be grouped here.
     for msg in sorted(messages.keys()):
-        msg_args = messages[msg].msg_args
-        # Determine if the pattern matches and append to the command if it does
-        for p_filter in filters:
-            results = filters[p_filter].search(msg_args.strip())
-            if results:
-                messages[msg].msg_cmd = '{}{}'.format(messages[msg].msg_cmd, p_filter)
-                break
         msg_cmd = messages[msg].msg_cmd
         if msg_cmd not in msg_cmds:
             msg_cmds[msg_cmd] = {}
@@ -160,84 +108,26 @@ def evm_to_messages(evm_file, filters):
             msg_cmds[msg_cmd]['queue'].append(round(messages[msg].deq_time, 2))
             msg_cmds[msg_cmd]['execute'].append(round(messages[msg].del_time, 2))
 
-    return messages, msg_cmds, test_start, test_end, line_count
+    return messages, msg_cmds, parser.test_start, parser.test_end, parser.line_count
 
 
 def evm_to_workers(evm_file):
     # Use grep to reduce # of lines to sort through
-    p = subprocess.Popen(['grep', 'Interrupt\\|MIQ([A-Za-z]*) ID\\|"evm_worker_uptime_exceeded\\|'
-            '"evm_worker_memory_exceeded\\|"evm_worker_stop\\|Worker exiting.', evm_file],
-            stdout=subprocess.PIPE)
+    p = subprocess.Popen(['grep', miqwkr_grep, evm_file], stdout=subprocess.PIPE)
     greppedevmlog, err = p.communicate()
     greppedevmlog = greppedevmlog.strip()
 
     evmlines = greppedevmlog.split('\n')
 
-    workers = {}
-    wkr_upt_exc = 0
-    wkr_mem_exc = 0
-    wkr_stp = 0
-    wkr_int = 0
-    wkr_ext = 0
+    parser = EvmWorkerParser()
     for evm_log_line in evmlines:
-        ts, pid = get_msg_timestamp_pid(evm_log_line)
+        parser.feed(evm_log_line)
 
-        miqwkr_result = miqwkr.search(evm_log_line)
-        if miqwkr_result:
-            workerid = int(miqwkr_result.group(2))
-            if workerid not in workers:
-                workers[workerid] = MiqWorker()
-                workers[workerid].worker_type = miqwkr_result.group(1)
-                workers[workerid].pid = miqwkr_result.group(3)
-                workers[workerid].worker_id = int(workerid)
-                workers[workerid].start_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_uptime_exceeded' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_upt_exc += 1
-                        workers[workerid].terminated = 'evm_worker_uptime_exceeded'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_memory_exceeded' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_mem_exc += 1
-                        workers[workerid].terminated = 'evm_worker_memory_exceeded'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_stop' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_stp += 1
-                        workers[workerid].terminated = 'evm_worker_stop'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'Interrupt' in evm_log_line:
-            for workerid in workers:
-                if not workers[workerid].end_ts:
-                    wkr_int += 1
-                    workers[workerid].terminated = 'Interrupted'
-                    workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'Worker exiting.' in evm_log_line:
-            miqwkr_id_2_result = miqwkr_id_2.search(evm_log_line)
-            if miqwkr_id_2_result:
-                workerid = int(miqwkr_id_2_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_ext += 1
-                        workers[workerid].terminated = 'Worker Exited'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+    return (parser.workers, parser.wkr_mem_exc, parser.wkr_upt_exc, parser.wkr_stp,
+        parser.wkr_int, parser.wkr_ext, len(evmlines))
 
-    return workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext, len(evmlines)
 
-
-def split_appliance_charts(top_appliance, charts_dir):
+def split_appliance_charts(top_appliance, charts_dir, chart_jobs=None):
     # Automatically split top_output data roughly per day
     minutes_in_a_day = 24 * 60
     size_data = len(top_appliance['datetimes'])
@@ -247,21 +137,24 @@ def split_appliance_charts(top_appliance, charts_dir):
 
     if size_data > minutes_in_a_day:
         # Greater than one day worth of data, split
-        file_names = [generate_appliance_charts(top_appliance, charts_dir, 0, bracket_end)]
+        file_names = [generate_appliance_charts(top_appliance, charts_dir, 0, bracket_end,
+            chart_jobs)]
         for start_bracket in range(bracket_end, len(top_appliance['datetimes']), minutes_in_a_day):
             if (start_bracket + minutes_in_a_day) > size_data:
                 end_index = size_data - 1
             else:
                 end_index = start_bracket + minutes_in_a_day
             file_names.append(generate_appliance_charts(top_appliance, charts_dir, start_bracket,
-                end_index))
+                end_index, chart_jobs))
         return file_names
     else:
         # Less than one day worth of data, do not split
-        return [generate_appliance_charts(top_appliance, charts_dir, 0, size_data - 1)]
+        return [generate_appliance_charts(top_appliance, charts_dir, 0, size_data - 1,
+            chart_jobs)]
 
 
-def generate_appliance_charts(top_appliance, charts_dir, start_index, end_index):
+def generate_appliance_charts(top_appliance, charts_dir, start_index, end_index,
+        chart_jobs=None):
     cpu_chart_file = '/{}-app-cpu.svg'.format(top_appliance['datetimes'][start_index])
     mem_chart_file = '/{}-app-mem.svg'.format(top_appliance['datetimes'][start_index])
 
@@ -276,7 +169,7 @@ def generate_appliance_charts(top_appliance, charts_dir, start_index, end_index)
     # lines['St'] = top_appliance['cpust'][start_index:end_index]  # Steal CPU %
     line_chart_render('CPU Usage', 'Date Time', 'Percent',
         top_appliance['datetimes'][start_index:end_index], lines, charts_dir.join(cpu_chart_file),
-        True)
+        True, jobs=chart_jobs)
 
     lines = {}
     lines['Memory Total'] = top_appliance['memtot'][start_index:end_index]
@@ -285,11 +178,12 @@ def generate_appliance_charts(top_appliance, charts_dir, start_index, end_index)
     lines['Swap Used'] = top_appliance['swause'][start_index:end_index]
     lines['cached'] = top_appliance['cached'][start_index:end_index]
     line_chart_render('Memory Usage', 'Date Time', 'KiB',
-        top_appliance['datetimes'][start_index:end_index], lines, charts_dir.join(mem_chart_file))
+        top_appliance['datetimes'][start_index:end_index], lines, charts_dir.join(mem_chart_file),
+        jobs=chart_jobs)
     return cpu_chart_file, mem_chart_file
 
 
-def generate_hourly_charts_and_csvs(hourly_buckets, charts_dir):
+def generate_hourly_charts_and_csvs(hourly_buckets, charts_dir, chart_jobs=None):
     for cmd in sorted(hourly_buckets):
         current_csv = 'hourly_' + cmd + '.csv'
         csv_rawdata_path = log_path.join('csv_output', current_csv)
@@ -332,21 +226,23 @@ def generate_hourly_charts_and_csvs(hourly_buckets, charts_dir):
             lines['Get ' + cmd] = cmd_get
             line_chart_render(cmd + ' Command Put/Get Count', 'Hour during ' + dt,
                 '# Count of Commands', linechartxaxis, lines,
-                charts_dir.join('/{}-{}-cmdcnt.svg'.format(cmd, dt)))
+                charts_dir.join('/{}-{}-cmdcnt.svg'.format(cmd, dt)), jobs=chart_jobs)
 
             lines = {}
             lines['Average Dequeue Timing'] = avgdeqtimings
             lines['Min Dequeue Timing'] = mindeqtimings
             lines['Max Dequeue Timing'] = maxdeqtimings
             line_chart_render(cmd + ' Dequeue Timings', 'Hour during ' + dt, 'Time (s)',
-                linechartxaxis, lines, charts_dir.join('/{}-{}-dequeue.svg'.format(cmd, dt)))
+                linechartxaxis, lines, charts_dir.join('/{}-{}-dequeue.svg'.format(cmd, dt)),
+                jobs=chart_jobs)
 
             lines = {}
             lines['Average Deliver Timing'] = avgdeltimings
             lines['Min Deliver Timing'] = mindeltimings
             lines['Max Deliver Timing'] = maxdeltimings
             line_chart_render(cmd + ' Deliver Timings', 'Hour during ' + dt, 'Time (s)',
-                linechartxaxis, lines, charts_dir.join('/{}-{}-deliver.svg'.format(cmd, dt)))
+                linechartxaxis, lines, charts_dir.join('/{}-{}-deliver.svg'.format(cmd, dt)),
+                jobs=chart_jobs)
         output_file.close()
 
 
@@ -361,7 +257,7 @@ def generate_raw_data_csv(rawdata_dict, csv_file_name):
         csvwriter.writerow(dict(rawdata_dict[key]))
 
 
-def generate_total_time_charts(msg_cmds, charts_dir):
+def generate_total_time_charts(msg_cmds, charts_dir, chart_jobs=None):
     for cmd in sorted(msg_cmds):
         logger.info('Generating Total Time Chart for %s', cmd)
         lines = {}
@@ -369,10 +265,10 @@ def generate_total_time_charts(msg_cmds, charts_dir):
         lines['Queue'] = msg_cmds[cmd]['queue']
         lines['Execute'] = msg_cmds[cmd]['execute']
         line_chart_render(cmd + ' Total Time', 'Message #', 'Time (s)', [], lines,
-            charts_dir.join('/{}-total.svg'.format(cmd)))
+            charts_dir.join('/{}-total.svg'.format(cmd)), jobs=chart_jobs)
 
 
-def generate_worker_charts(workers, top_workers, charts_dir):
+def generate_worker_charts(workers, top_workers, charts_dir, chart_jobs=None):
     for worker in top_workers:
         logger.info('Generating Charts for Worker: %s Type: %s',
             worker, workers[worker].worker_type)
@@ -384,12 +280,12 @@ def generate_worker_charts(workers, top_workers, charts_dir):
         lines['Shared Mem'] = top_workers[worker]['share']
         line_chart_render(worker_name, 'Date Time', 'Memory in MiB',
             top_workers[worker]['datetimes'], lines,
-            charts_dir.join('/{}-Memory.svg'.format(worker_name)))
+            charts_dir.join('/{}-Memory.svg'.format(worker_name)), jobs=chart_jobs)
 
         lines = {}
         lines['CPU %'] = top_workers[worker]['cpu_per']
         line_chart_render(worker_name, 'Date Time', 'CPU Usage', top_workers[worker]['datetimes'],
-            lines, charts_dir.join('/{}-CPU.svg'.format(worker_name)))
+            lines, charts_dir.join('/{}-CPU.svg'.format(worker_name)), jobs=chart_jobs)
 
 
 def get_first_miqtop(top_log_file):
@@ -460,7 +356,12 @@ def hour_bucket_init(init):
         return {}
 
 
-def line_chart_render(title, xtitle, ytitle, x_labels, lines, fname, stacked=False):
+def line_chart_render(title, xtitle, ytitle, x_labels, lines, fname, stacked=False, jobs=None):
+    if jobs is not None:
+        # Rendered later on, together with the other charts by render_line_charts
+        jobs.append((title, xtitle, ytitle, x_labels, lines, str(fname), stacked))
+        return
+    x_labels, lines = downsample_lines(x_labels, lines, CHART_MAX_POINTS)
     if stacked:
         line_chart = pygal.StackedLine()
     else:
@@ -472,12 +373,98 @@ def line_chart_render(title, xtitle, ytitle, x_labels, lines, fname, stacked=Fal
     line_chart.legend_font_size = 8
     line_chart.truncate_legend = 26
     line_chart.x_labels = x_labels
+    if len(x_labels) > 25:
+        # Only a subset of the labels fits on the x axis
+        line_chart.x_labels_major_count = 20
+        line_chart.show_minor_x_labels = False
     sortedlines = sorted(lines.keys())
     for line in sortedlines:
         line_chart.add(line, lines[line])
     line_chart.render_to_file(str(fname))
 
 
+def _line_chart_render_job(job):
+    line_chart_render(*job)
+    return job[5]
+
+
+def render_line_charts(jobs, processes=None):
+    """Renders the charts queued by line_chart_render in parallel worker processes
+
+    Args:
+        jobs: List of the queued charts
+        processes: Number of worker processes, defaults to the number of cpus
+    """
+    pool = Pool(processes)
+    try:
+        for fname in pool.imap_unordered(_line_chart_render_job, jobs, chunksize=4):
+            logger.debug('Rendered chart %s', fname)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def lttb_indices(values, threshold):
+    """Picks indices of ``threshold`` points keeping the visual shape of the series
+
+    Uses the Largest-Triangle-Three-Buckets algorithm, the first and the last points are always
+    kept and from every bucket in between the point forming the largest triangle with the point
+    kept in the previous bucket and the average of the next bucket is picked.
+    """
+    size = len(values)
+    if threshold >= size or threshold < 3:
+        return range(size)
+
+    indices = [0]
+    bucket_size = float(size - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, size)
+        avg_x = (end + next_end - 1) / 2.0
+        avg_y = sum(values[end:next_end]) / float(next_end - end)
+
+        max_area = -1
+        picked = start
+        for b in range(start, end):
+            area = abs((a - avg_x) * (values[b] - values[a]) - (a - b) * (avg_y - values[a]))
+            if area > max_area:
+                max_area = area
+                picked = b
+        indices.append(picked)
+        a = picked
+    indices.append(size - 1)
+    return indices
+
+
+def downsample_lines(x_labels, lines, max_points):
+    """Downsamples the lines of a chart sharing the x axis to roughly ``max_points`` points
+
+    Every line keeps its shape (see :py:func:`lttb_indices`) and the union of the picked points is
+    kept for all of them, so the lines stay aligned with the x labels.
+
+    Returns:
+        A tuple of downsampled x labels and lines.
+    """
+    size = max([len(values) for values in lines.values()] or [0])
+    if size <= max_points:
+        return x_labels, lines
+    threshold = max(3, max_points // len(lines))
+    indices = set()
+    for values in lines.values():
+        indices.update(lttb_indices(values, threshold))
+    indices = sorted(indices)
+    if x_labels:
+        x_labels = [x_labels[i] for i in indices if i < len(x_labels)]
+    else:
+        # Keep the original sample numbers as the points are no longer evenly spaced
+        x_labels = [str(i + 1) for i in indices]
+    lines = dict(
+        (line, [values[i] for i in indices if i < len(values)]) for line, values in lines.items())
+    return x_labels, lines
+
+
 def messages_to_hourly_buckets(messages, test_start, test_end):
     hr_bkt = {}
     # Hour buckets look like: hr_bkt[msg_cmd][msg_date][msg_hour] = MiqMsgBucket()
@@ -720,91 +707,22 @@ def top_to_workers(workers, top_file):
     timediff = time() - runningtime
     logger.info('Grepped top_output for pids & time data in %s', timediff)
 
-    # This is very ugly because miqtop does include the date but top does not
-    # Also pids can be duplicated, so careful attention to detail on when a pid starts and ends
     top_lines = greppedtop.strip().split('\n')
     line_count = 0
-    top_workers = {}
-    cur_time = None
-    miqtop_ahead = True
+    parser = TopWorkerParser(workers, miqtop_time, timezone_offset)
     runningtime = time()
     for top_line in top_lines:
         line_count += 1
-        if 'top - ' in top_line:
-            # top - 11:00:43
-            cur_hour = int(top_line[6:8])
-            cur_min = int(top_line[9:11])
-            cur_sec = int(top_line[12:14])
-            if miqtop_ahead:
-                # Have not found miqtop time yet so we must rely on miqtop time "ahead"
-                if cur_hour <= miqtop_time.hour:
-                    cur_time = miqtop_time.replace(hour=cur_hour, minute=cur_min, second=cur_sec) \
-                        - timedelta(hours=timezone_offset)
-                else:
-                    # miqtop_time is ahead by date
-                    logger.info('miqtop_time is ahead by one day')
-                    cur_time = miqtop_time - timedelta(days=1)
-                    cur_time = cur_time.replace(hour=cur_hour, minute=cur_min, second=cur_sec) \
-                        - timedelta(hours=timezone_offset)
-            else:
-                cur_time = miqtop_time.replace(hour=cur_hour, minute=cur_min, second=cur_sec) \
-                    - timedelta(hours=timezone_offset)
-        elif 'miqtop: ' in top_line:
-            miqtop_ahead = False
-            # miqtop: .* is-> Mon Jan 26 08:57:39 EST 2015 -0500
-            str_start = top_line.index('is->')
-            miqtop_time = du_parser.parse(top_line[str_start:], fuzzy=True, ignoretz=True)
-            # Time logged in top is the system's time which is ahead/behind by the timezone offset
-            timezone_offset = int(top_line[str_start + 34:str_start + 37])
-            miqtop_time = miqtop_time - timedelta(hours=timezone_offset)
-        else:
-            top_results = miq_top.search(top_line)
-            if top_results:
-                top_pid = top_results.group(1)
-                top_virt = convert_top_mem_to_mib(top_results.group(2))
-                top_res = convert_top_mem_to_mib(top_results.group(3))
-                top_share = convert_top_mem_to_mib(top_results.group(4))
-                top_cpu_per = float(top_results.group(5))
-                top_mem_per = float(top_results.group(6))
-                for worker in workers:
-                    if workers[worker].pid == top_pid:
-                        if cur_time > workers[worker].start_ts and \
-                                (workers[worker].end_ts == '' or cur_time < workers[worker].end_ts):
-                            w_id = workers[worker].worker_id
-                            if w_id not in top_workers:
-                                top_workers[w_id] = {}
-                                top_workers[w_id]['datetimes'] = []
-                                top_workers[w_id]['virt'] = []
-                                top_workers[w_id]['res'] = []
-                                top_workers[w_id]['share'] = []
-                                top_workers[w_id]['cpu_per'] = []
-                                top_workers[w_id]['mem_per'] = []
-                            top_workers[w_id]['datetimes'].append(str(cur_time))
-                            top_workers[w_id]['virt'].append(top_virt)
-                            top_workers[w_id]['res'].append(top_res)
-                            top_workers[w_id]['share'].append(top_share)
-                            top_workers[w_id]['cpu_per'].append(top_cpu_per)
-                            top_workers[w_id]['mem_per'].append(top_mem_per)
-                            break
-            else:
-                logger.error('Issue with miq_top regex or grepping of top file:%s', top_line)
+        if not parser.feed(top_line):
+            logger.error('Issue with miq_top regex or grepping of top file:%s', top_line)
         if (line_count % 20000) == 0:
             timediff = time() - runningtime
             runningtime = time()
             logger.info('Count %s : Parsed 20000 lines in %s', line_count, timediff)
-    return top_workers, len(top_lines)
+    return parser.top_workers, len(top_lines)
 
 
 def perf_process_evm(evm_file, top_file):
-    msg_filters = {
-        '-hourly': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"hourly\"'),
-        '-daily': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"daily\"'),
-        '-EmsRedhat': re.compile(r'\[\[\"EmsRedhat\"\,\s[0-9]*\]\]'),
-        '-EmsVmware': re.compile(r'\[\[\"EmsVmware\"\,\s[0-9]*\]\]'),
-        '-EmsAmazon': re.compile(r'\[\[\"EmsAmazon\"\,\s[0-9]*\]\]'),
-        '-EmsOpenstack': re.compile(r'\[\[\"EmsOpenstack\"\,\s[0-9]*\]\]')
-    }
-
     starttime = time()
     initialtime = starttime
 
@@ -863,30 +781,39 @@ def perf_process_evm(evm_file, top_file):
     timediff = time() - starttime
     logger.info('Generated Hourly Buckets in: %s', timediff)
 
+    # Charts are only queued while generating and rendered all at once in parallel afterwards
+    chart_jobs = []
+
     logger.info('----------- Generating Hourly Charts and csvs -----------')
     starttime = time()
-    generate_hourly_charts_and_csvs(hr_bkt, charts_dir)
+    generate_hourly_charts_and_csvs(hr_bkt, charts_dir, chart_jobs)
     timediff = time() - starttime
     logger.info('Generated Hourly Charts and csvs in: %s', timediff)
 
     logger.info('----------- Generating Total Time Charts -----------')
     starttime = time()
-    generate_total_time_charts(msg_cmds, charts_dir)
+    generate_total_time_charts(msg_cmds, charts_dir, chart_jobs)
     timediff = time() - starttime
     logger.info('Generated Total Time Charts in: %s', timediff)
 
     logger.info('----------- Generating Appliance Charts -----------')
     starttime = time()
-    app_chart_files = split_appliance_charts(top_appliance, charts_dir)
+    app_chart_files = split_appliance_charts(top_appliance, charts_dir, chart_jobs)
     timediff = time() - starttime
     logger.info('Generated Appliance Charts in: %s', timediff)
 
     logger.info('----------- Generating Worker Charts -----------')
     starttime = time()
-    generate_worker_charts(workers, top_workers, charts_dir)
+    generate_worker_charts(workers, top_workers, charts_dir, chart_jobs)
     timediff = time() - starttime
     logger.info('Generated Worker Charts in: %s', timediff)
 
+    logger.info('----------- Rendering %s Charts -----------', len(chart_jobs))
+    starttime = time()
+    render_line_charts(chart_jobs)
+    timediff = time() - starttime
+    logger.info('Rendered Charts in: %s', timediff)
+
     logger.info('----------- Generating Message Statistics -----------')
     starttime = time()
     messages_to_statistics_csv(messages, 'queue-statistics.csv')
@@ -894,22 +821,35 @@ def perf_process_evm(evm_file, top_file):
     logger.info('Generated Message Statistics in: %s', timediff)
 
     logger.info('----------- Writing html files for report -----------')
-    # Write an index.html file for fast switching between graphs:
-    html_index = log_path.join('index.html').open('w', ensure=True)
+    # Write a single index.html page for fast switching between graphs, charts are only loaded
+    # into the viewer frame once they are picked from the side bar menus
+    html_menu = log_path.join('index.html').open('w', ensure=True)
     cmd = hr_bkt.keys()[0]
-    html_index.write(
+    html_menu.write(
         '<html>\n'
+        '<head>\n'
         '<title>Performance Worker/Message Metrics</title>\n'
-        '<frameset cols="17%,83%">\n'
-        '   <frame src="msg_menu.html" name="menu"/>\n'
-        '   <frame src="charts/{}-{}-dequeue.svg" name="showframe" />\n'
-        '</frameset>\n'
-        '</html>'.format(cmd, sorted(hr_bkt[cmd].keys())[-1]))
-    html_index.close()
-
-    # Write the side bar menu html file
-    html_menu = log_path.join('msg_menu.html').open('w', ensure=True)
-    html_menu.write('<html>\n')
+        '<style>\n'
+        '  body {{ margin: 0; }}\n'
+        '  .menu {{ position: fixed; top: 0; bottom: 0; left: 0; width: 17%; overflow: auto; }}\n'
+        '  iframe {{ position: fixed; top: 0; bottom: 0; right: 0; width: 83%; height: 100%;'
+        ' border: 0; }}\n'
+        '</style>\n'
+        '<script>\n'
+        '  function showMenu(menu) {{\n'
+        '    document.getElementById("msg_menu").style.display = "none";\n'
+        '    document.getElementById("worker_menu").style.display = "none";\n'
+        '    document.getElementById(menu).style.display = "block";\n'
+        '    return false;\n'
+        '  }}\n'
+        '</script>\n'
+        '</head>\n'
+        '<body>\n'
+        '<iframe src="charts/{}-{}-dequeue.svg" name="showframe"></iframe>\n'.format(
+            cmd, sorted(hr_bkt[cmd].keys())[-1]))
+
+    # Side bar menu of message charts
+    html_menu.write('<div class="menu" id="msg_menu">\n')
     html_menu.write('<font size="2">')
 
     html_menu.write('Appliance:<BR>')
@@ -919,7 +859,8 @@ def perf_process_evm(evm_file, top_file):
         html_menu.write('<a href="charts{}" target="showframe">Memory</a><br>'.format(
             cpu_mem_charts[1]))
 
-    html_menu.write('<a href="worker_menu.html" target="menu">Worker CPU/Memory</a><br>')
+    html_menu.write(
+        '<a href="#" onclick="return showMenu(\'worker_menu\')">Worker CPU/Memory</a><br>')
     html_menu.write('Parsed {} lines for messages<br>'.format(msg_lc))
     html_menu.write('Start Time: {}<br>'.format(test_start))
     html_menu.write('End Time: {}<br>'.format(test_end))
@@ -957,11 +898,11 @@ def perf_process_evm(evm_file, top_file):
                 'del</a><br>'.format(cmd, dt))
         html_menu.write('<br>')
     html_menu.write('</font>')
-    html_menu.write('</html>')
-    html_menu.close()
+    html_menu.write('</div>\n')
 
-    html_wkr_menu = log_path.join('worker_menu.html').open('w', ensure=True)
-    html_wkr_menu.write('<html>\n')
+    # Side bar menu of worker charts, hidden until switched to
+    html_wkr_menu = html_menu
+    html_wkr_menu.write('<div class="menu" id="worker_menu" style="display: none">\n')
     html_wkr_menu.write('<font size="2">')
 
     html_wkr_menu.write('Appliance:<BR>')
@@ -971,7 +912,8 @@ def perf_process_evm(evm_file, top_file):
         html_wkr_menu.write('<a href="charts{}" target="showframe">Memory</a><br>'.format(
             cpu_mem_charts[1]))
 
-    html_wkr_menu.write('<a href="msg_menu.html" target="menu">Message Latencies</a><br>')
+    html_wkr_menu.write(
+        '<a href="#" onclick="return showMenu(\'msg_menu\')">Message Latencies</a><br>')
     html_wkr_menu.write('Parsed {} lines for messages<br>'.format(msg_lc))
     html_wkr_menu.write('Start Time: {}<br>'.format(test_start))
     html_wkr_menu.write('End Time: {}<br>'.format(test_end))
@@ -1020,8 +962,10 @@ def perf_process_evm(evm_file, top_file):
                 ''.format(worker_name))
             html_wkr_menu.write('{}<br>'.format(workers[worker_id].terminated))
     html_wkr_menu.write('</font>')
-    html_wkr_menu.write('</html>')
-    html_wkr_menu.close()
+    html_wkr_menu.write('</div>\n')
+    html_menu.write('</body>\n')
+    html_menu.write('</html>')
+    html_menu.close()
 
     timediff = time() - initialtime
     logger.info('----------- Finished -----------')
@@ -1111,3 +1055,289 @@ class MiqWorker(object):
     def __str__(self):
         return self.worker_id + ' : ' + self.worker_type + ' : ' + self.pid + ' : ' + \
             str(self.start_ts) + ' : ' + str(self.end_ts) + ' : ' + self.terminated
+
+
+class EvmMessageParser(object):
+    """Incrementally parses evm.log lines into :py:class:`MiqMsgStat` messages.
+
+    Lines are fed one at a time, so the same parser is used for a whole log file after a test run
+    and for lines streamed off an appliance while the workload is still running.
+
+    Args:
+        filters: Dictionary of command suffix to compiled regex searched in the message args, the
+            suffix of the first matching regex is appended to the message command.
+        track_hourly: Keep ``hourly_buckets`` (``[msg_cmd][date][hour] = MiqMsgBucket()``) up to
+            date as the messages are dequeued and delivered.
+        partial: The log is picked up in the middle, so messages put on the queue before the first
+            line are expected to be missing and are not reported as errors.
+        keep_delivered: Keep the delivered messages in ``messages``, long running streams only
+            interested in ``hourly_buckets`` can drop them to keep the memory usage flat.
+    """
+
+    def __init__(self, filters=None, track_hourly=False, partial=False, keep_delivered=True):
+        self.filters = filters or {}
+        self.track_hourly = track_hourly
+        self.partial = partial
+        self.keep_delivered = keep_delivered
+        self.messages = {}
+        self.hourly_buckets = {}
+        self.test_start = ''
+        self.test_end = ''
+        self.line_count = 0
+
+    def feed(self, evm_log_line):
+        self.line_count += 1
+        evm_log_line = evm_log_line.strip()
+
+        miqmsg_result = miqmsg.search(evm_log_line)
+        if not miqmsg_result:
+            return
+
+        # Obtains the first timestamp in the log file
+        if self.test_start == '':
+            ts, pid = get_msg_timestamp_pid(evm_log_line)
+            self.test_start = ts
+
+        # A message was first put on the queue, this starts its queuing time
+        if miqmsg_result.group(1) == 'MiqQueue.put':
+            msg_id = get_msg_id(evm_log_line)
+            if msg_id:
+                self._put(msg_id, evm_log_line)
+            else:
+                logger.error('Could not obtain message id, line #: %s', self.line_count)
+
+        elif miqmsg_result.group(1) == 'MiqQueue.get_via_drb':
+            msg_id = get_msg_id(evm_log_line)
+            if msg_id:
+                if msg_id in self.messages:
+                    self._get(msg_id, evm_log_line)
+                else:
+                    self._unknown_message(msg_id)
+            else:
+                logger.error('Could not obtain message id, line #: %s', self.line_count)
+
+        elif miqmsg_result.group(1) == 'MiqQueue.delivered':
+            msg_id = get_msg_id(evm_log_line)
+            if msg_id:
+                ts, pid = get_msg_timestamp_pid(evm_log_line)
+                self.test_end = ts
+                if msg_id in self.messages:
+                    self._delivered(msg_id, evm_log_line)
+                else:
+                    self._unknown_message(msg_id)
+            else:
+                logger.error('Could not obtain message id, line #: %s', self.line_count)
+
+    def _put(self, msg_id, evm_log_line):
+        ts, pid = get_msg_timestamp_pid(evm_log_line)
+        self.test_end = ts
+        msg = MiqMsgStat()
+        msg.msg_id = '\'' + msg_id + '\''
+        msg.msg_cmd = get_msg_cmd(evm_log_line)
+        msg.pid_put = pid
+        msg.puttime = ts
+        msg_args = get_msg_args(evm_log_line)
+        if msg_args is False:
+            logger.debug('Could not obtain message args line #: %s', self.line_count)
+        else:
+            msg.msg_args = msg_args
+        # Filtering over message args tells apart f.e. a daily rollup from an hourly rollup
+        for p_filter in self.filters:
+            if self.filters[p_filter].search(msg.msg_args.strip()):
+                msg.msg_cmd = '{}{}'.format(msg.msg_cmd, p_filter)
+                break
+        self.messages[msg_id] = msg
+
+        if self.track_hourly:
+            bucket = self._hour_bucket(msg.msg_cmd, msg.puttime)
+            bucket.total_put += 1
+            bucket.avg_deq = bucket.sum_deq / bucket.total_put
+
+    def _get(self, msg_id, evm_log_line):
+        ts, pid = get_msg_timestamp_pid(evm_log_line)
+        self.test_end = ts
+        msg = self.messages[msg_id]
+        msg.pid_get = pid
+        msg.gettime = ts
+        msg.deq_time = get_msg_deq(evm_log_line)
+
+        if self.track_hourly:
+            # Dequeue timings belong to the hour the message was put on the queue
+            bucket = self._hour_bucket(msg.msg_cmd, msg.puttime)
+            bucket.sum_deq += msg.deq_time
+            if bucket.min_deq == 0 or bucket.min_deq > msg.deq_time:
+                bucket.min_deq = msg.deq_time
+            if bucket.max_deq == 0 or bucket.max_deq < msg.deq_time:
+                bucket.max_deq = msg.deq_time
+            bucket.avg_deq = bucket.sum_deq / bucket.total_put
+
+    def _delivered(self, msg_id, evm_log_line):
+        msg = self.messages[msg_id]
+        msg.del_time = get_msg_del(evm_log_line)
+        msg.total_time = msg.deq_time + msg.del_time
+
+        if self.track_hourly:
+            # Deliver timings belong to the hour the message was taken off the queue
+            bucket = self._hour_bucket(msg.msg_cmd, msg.gettime)
+            bucket.total_get += 1
+            bucket.sum_del += msg.del_time
+            if bucket.min_del == 0 or bucket.min_del > msg.del_time:
+                bucket.min_del = msg.del_time
+            if bucket.max_del == 0 or bucket.max_del < msg.del_time:
+                bucket.max_del = msg.del_time
+            bucket.avg_del = bucket.sum_del / bucket.total_get
+
+        if not self.keep_delivered:
+            del self.messages[msg_id]
+
+    def _hour_bucket(self, msg_cmd, ts):
+        date, hour = ts[:10], ts[11:13]
+        hours = self.hourly_buckets.setdefault(msg_cmd, {}).setdefault(date, {})
+        if hour not in hours:
+            hours[hour] = MiqMsgBucket()
+            hours[hour].date = date
+            hours[hour].hour = hour
+        return hours[hour]
+
+    def _unknown_message(self, msg_id):
+        if self.partial:
+            logger.debug('Message ID put before the log was picked up: %s', msg_id)
+        else:
+            logger.error('Message ID not in dictionary: %s', msg_id)
+
+
+class EvmWorkerParser(object):
+    """Incrementally tracks :py:class:`MiqWorker` starts and terminations from evm.log lines."""
+
+    def __init__(self):
+        self.workers = {}
+        self.wkr_upt_exc = 0
+        self.wkr_mem_exc = 0
+        self.wkr_stp = 0
+        self.wkr_int = 0
+        self.wkr_ext = 0
+
+    def feed(self, evm_log_line):
+        ts, pid = get_msg_timestamp_pid(evm_log_line)
+        if not ts:
+            return
+        ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+
+        miqwkr_result = miqwkr.search(evm_log_line)
+        if miqwkr_result:
+            workerid = int(miqwkr_result.group(2))
+            if workerid not in self.workers:
+                self.workers[workerid] = MiqWorker()
+                self.workers[workerid].worker_type = miqwkr_result.group(1)
+                self.workers[workerid].pid = miqwkr_result.group(3)
+                self.workers[workerid].worker_id = int(workerid)
+                self.workers[workerid].start_ts = ts
+        elif 'evm_worker_uptime_exceeded' in evm_log_line:
+            if self._terminate(miqwkr_id, evm_log_line, 'evm_worker_uptime_exceeded', ts):
+                self.wkr_upt_exc += 1
+        elif 'evm_worker_memory_exceeded' in evm_log_line:
+            if self._terminate(miqwkr_id, evm_log_line, 'evm_worker_memory_exceeded', ts):
+                self.wkr_mem_exc += 1
+        elif 'evm_worker_stop' in evm_log_line:
+            if self._terminate(miqwkr_id, evm_log_line, 'evm_worker_stop', ts):
+                self.wkr_stp += 1
+        elif 'Interrupt' in evm_log_line:
+            for workerid in self.workers:
+                if not self.workers[workerid].end_ts:
+                    self.wkr_int += 1
+                    self.workers[workerid].terminated = 'Interrupted'
+                    self.workers[workerid].end_ts = ts
+        elif 'Worker exiting.' in evm_log_line:
+            if self._terminate(miqwkr_id_2, evm_log_line, 'Worker Exited', ts):
+                self.wkr_ext += 1
+
+    def _terminate(self, id_regex, evm_log_line, reason, ts):
+        miqwkr_id_result = id_regex.search(evm_log_line)
+        if miqwkr_id_result:
+            workerid = int(miqwkr_id_result.group(1))
+            if workerid in self.workers and not self.workers[workerid].terminated:
+                self.workers[workerid].terminated = reason
+                self.workers[workerid].end_ts = ts
+                return True
+        return False
+
+
+class TopWorkerParser(object):
+    """Incrementally builds per worker CPU/Memory series from top_output.log lines.
+
+    Args:
+        workers: Dictionary of :py:class:`MiqWorker` by worker id, may keep growing while parsing.
+        miqtop_time: Date/time of the first ``miqtop:`` line, ``None`` if not known yet in which
+            case lines are skipped until a ``miqtop:`` line is fed.
+        timezone_offset: Timezone offset of ``miqtop_time``
+    """
+
+    def __init__(self, workers, miqtop_time=None, timezone_offset=0):
+        self.workers = workers
+        self.miqtop_time = miqtop_time
+        self.timezone_offset = timezone_offset
+        self.miqtop_ahead = True
+        self.cur_time = None
+        self.top_workers = {}
+
+    def feed(self, top_line):
+        """Returns ``False`` if the line was not recognized."""
+        if 'top - ' in top_line:
+            if self.miqtop_time is not None:
+                self.cur_time = self._top_time(top_line)
+        elif 'miqtop: ' in top_line:
+            self.miqtop_ahead = False
+            # miqtop: .* is-> Mon Jan 26 08:57:39 EST 2015 -0500
+            str_start = top_line.index('is->')
+            miqtop_time = du_parser.parse(top_line[str_start:], fuzzy=True, ignoretz=True)
+            # Time logged in top is the system's time which is ahead/behind by the timezone offset
+            self.timezone_offset = int(top_line[str_start + 34:str_start + 37])
+            self.miqtop_time = miqtop_time - timedelta(hours=self.timezone_offset)
+        else:
+            top_results = miq_top.search(top_line)
+            if not top_results:
+                return False
+            if self.cur_time is not None:
+                self._add_sample(top_results)
+        return True
+
+    def _top_time(self, top_line):
+        # top - 11:00:43
+        cur_hour = int(top_line[6:8])
+        cur_min = int(top_line[9:11])
+        cur_sec = int(top_line[12:14])
+        miqtop_time = self.miqtop_time
+        # This is very ugly because miqtop does include the date but top does not
+        if self.miqtop_ahead and cur_hour > miqtop_time.hour:
+            # Have not found miqtop time yet so we must rely on miqtop time "ahead"
+            logger.info('miqtop_time is ahead by one day')
+            miqtop_time = miqtop_time - timedelta(days=1)
+        return miqtop_time.replace(hour=cur_hour, minute=cur_min, second=cur_sec) \
+            - timedelta(hours=self.timezone_offset)
+
+    def _add_sample(self, top_results):
+        top_pid = top_results.group(1)
+        # Also pids can be duplicated, so careful attention to detail on when a pid starts and ends
+        for worker in self.workers.values():
+            if worker.pid == top_pid:
+                if self.cur_time > worker.start_ts and \
+                        (worker.end_ts == '' or self.cur_time < worker.end_ts):
+                    w_id = worker.worker_id
+                    if w_id not in self.top_workers:
+                        self.top_workers[w_id] = {}
+                        self.top_workers[w_id]['datetimes'] = []
+                        self.top_workers[w_id]['virt'] = []
+                        self.top_workers[w_id]['res'] = []
+                        self.top_workers[w_id]['share'] = []
+                        self.top_workers[w_id]['cpu_per'] = []
+                        self.top_workers[w_id]['mem_per'] = []
+                    self.top_workers[w_id]['datetimes'].append(str(self.cur_time))
+                    self.top_workers[w_id]['virt'].append(
+                        convert_top_mem_to_mib(top_results.group(2)))
+                    self.top_workers[w_id]['res'].append(
+                        convert_top_mem_to_mib(top_results.group(3)))
+                    self.top_workers[w_id]['share'].append(
+                        convert_top_mem_to_mib(top_results.group(4)))
+                    self.top_workers[w_id]['cpu_per'].append(float(top_results.group(5)))
+                    self.top_workers[w_id]['mem_per'].append(float(top_results.group(6)))
+                    break
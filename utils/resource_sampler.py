@@ -0,0 +1,153 @@
+"""Samples the resource usage of an appliance in the background.
+
+One remote shell loop prints a sample line every interval over a single SSH channel, so sampling
+costs neither a new session nor a connection per sample. The samples are kept as a time series
+which can be sliced by the time, e.g. per test (see :py:mod:`fixtures.resource_sampler`).
+
+Counting the ready ``miq_queue`` messages runs ``psql``, which opens a new database connection
+for every sample; turn it off with ``sample_queue=False`` on busy databases. It is off if the
+database of the appliance is external.
+"""
+import time
+from collections import deque, namedtuple
+from threading import Event as ThreadEvent, Lock, Thread
+
+from utils.log import logger
+
+#: A single sample, ``cpu`` and ``memory`` are used percents, ``load`` is the 1 minute load
+#: average, ``workers`` the number of the MIQ worker processes and ``queue`` the number of the
+#: ready miq_queue messages (None if the database is not local or the queue is not sampled)
+ResourceSample = namedtuple(
+    'ResourceSample', ['time', 'cpu', 'memory', 'load', 'workers', 'queue'])
+
+SAMPLE_MARKER = 'resource_sample|'
+
+SAMPLER_SCRIPT = (
+    "while :; do "
+    "printf '{marker}%s|%s|%s|%s|%s\\n' "
+    "\"$(head -n 1 /proc/stat)\" "
+    "\"$(awk '/^MemTotal:|^MemAvailable:/ {{print $2}}' /proc/meminfo | paste -sd ' ')\" "
+    "\"$(cut -d ' ' -f 1 /proc/loadavg)\" "
+    "\"$(pgrep -fc '^MIQ')\" "
+    "\"{queue}\"; "
+    "sleep {interval}; done")
+QUEUE_SCRIPT = (
+    "$(psql -U postgres -t -A -c \"SELECT count(*) FROM miq_queue WHERE state = 'ready'\" "
+    "vmdb_production 2>/dev/null)")
+
+
+class ResourceSampler(Thread):
+    """Collects :py:class:`ResourceSample` s of the appliance every ``interval`` seconds.
+
+    If the channel breaks (f.e. the appliance reboots), the sampling is started again.
+
+    Args:
+        appliance: The appliance to sample.
+        interval: Seconds between the samples.
+        max_samples: Only this many latest samples are kept.
+        sample_queue: Count the ready ``miq_queue`` messages, a new database connection per
+            sample. Only if the database is internal.
+
+    Usage:
+        .. code-block:: python
+
+          sampler = ResourceSampler(appliance, interval=10)
+          sampler.start()
+          start = time.time()
+          # ... run something
+          samples = sampler.samples_between(start, time.time())
+          sampler.stop()
+    """
+    def __init__(self, appliance, interval=15, max_samples=50000, sample_queue=True):
+        super(ResourceSampler, self).__init__()
+        self.daemon = True
+        self.appliance = appliance
+        self.interval = interval
+        self.sample_queue = sample_queue
+        self.samples = deque(maxlen=max_samples)
+        self._lock = Lock()
+        self._stop_event = ThreadEvent()
+        self._channel_lock = Lock()
+        self._channel = None
+        self._last_cpu = None
+
+    def stop(self, timeout=30):
+        self._stop_event.set()
+        with self._channel_lock:
+            if self._channel is not None:
+                self._channel.close()
+        self.join(timeout)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._sample()
+            except Exception as e:
+                # Keep sampling, the appliance could be just rebooting
+                logger.exception(e)
+            self._stop_event.wait(self.interval)
+
+    def _sample(self):
+        sample_queue = self.sample_queue and self.appliance.is_db_internal
+        client = self.appliance.ssh_client
+        # Wrapped like run_command does, so the samples are taken in the container and as root
+        command, _ = client.wrap_command(SAMPLER_SCRIPT.format(
+            marker=SAMPLE_MARKER, interval=self.interval,
+            queue=QUEUE_SCRIPT if sample_queue else ''))
+        channel = client.get_transport().open_session()
+        with self._channel_lock:
+            # Stopped while connecting, stop() could not close the channel
+            if self._stop_event.is_set():
+                channel.close()
+                return
+            self._channel = channel
+        try:
+            # With a pseudo-tty sudo works and the remote loop is hung up when the channel closes,
+            # in a container it dies writing the next sample
+            self._channel.get_pty()
+            self._channel.exec_command(command)
+            self._last_cpu = None
+            for line in self._channel.makefile('r'):
+                if line.startswith(SAMPLE_MARKER):
+                    sample = self._parse(line[len(SAMPLE_MARKER):].rstrip('\r\n'))
+                    if sample is not None:
+                        with self._lock:
+                            self.samples.append(sample)
+        finally:
+            with self._channel_lock:
+                self._channel.close()
+                self._channel = None
+
+    def _parse(self, line):
+        try:
+            stat, memory, load, workers, queue = line.split('|')
+            # The guest times are included in the user times already
+            cpu_times = [int(value) for value in stat.split()[1:9]]
+            mem_total, mem_available = [int(value) for value in memory.split()]
+        except ValueError:
+            logger.warning('Could not parse the resource sample %r', line)
+            return None
+        # /proc/stat has the CPU times since the boot, the usage is the difference of two samples
+        busy, total = sum(cpu_times) - sum(cpu_times[3:5]), sum(cpu_times)
+        last_cpu, self._last_cpu = self._last_cpu, (busy, total)
+        cpu = None
+        if last_cpu is not None and total > last_cpu[1]:
+            cpu = 100.0 * (busy - last_cpu[0]) / (total - last_cpu[1])
+        return ResourceSample(
+            time.time(), cpu, 100.0 * (mem_total - mem_available) / mem_total, float(load),
+            int(workers or 0), int(queue) if queue.isdigit() else None)
+
+    def samples_between(self, start, end):
+        """Returns the samples taken between the two timestamps (as in :py:func:`time.time`)"""
+        with self._lock:
+            return [sample for sample in self.samples if start <= sample.time <= end]
+
+    @staticmethod
+    def to_csv(samples):
+        lines = ['time,cpu_percent,memory_percent,load,workers,queue']
+        for sample in samples:
+            lines.append(','.join('' if value is None else str(value) for value in (
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sample.time)),
+                None if sample.cpu is None else round(sample.cpu, 1),
+                round(sample.memory, 1), sample.load, sample.workers, sample.queue)))
+        return '\n'.join(lines) + '\n'
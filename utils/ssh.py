@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 import fauxfactory
+import hashlib
 import iso8601
+import json
+import os
 import re
+import select
+import shutil
 import socket
 import sys
-from collections import namedtuple
-from os import path as os_path
+import tempfile
+import zlib
+from collections import deque, namedtuple
+from os import makedirs, path as os_path
 from subprocess import check_call
+from threading import RLock, Thread
+from time import time
 from urlparse import urlparse
 
 import paramiko
+from concurrent import futures
 from scp import SCPClient
 import diaper
 
@@ -17,7 +27,7 @@ from utils import conf, ports, version
 from utils.log import logger
 from utils.net import net_check
 from fixtures.pytest_store import store
-from utils.path import project_path
+from utils.path import data_path, project_path
 from utils.quote import quote
 from utils.timeutil import parsetime
 
@@ -25,6 +35,44 @@ from utils.timeutil import parsetime
 # Default blocking time before giving up on an ssh command execution,
 # in seconds (float)
 RUNCMD_TIMEOUT = 1200.0
+# Size of a single read from the command's channel, in bytes
+RUNCMD_CHUNK = 32768
+# Seconds to wait for the rest of the output once the command exited
+RUNCMD_DRAIN_TIMEOUT = 10
+# Pooled transports not used by any client for this long are closed, in seconds
+POOL_IDLE_TIMEOUT = 300.0
+# Pooled transports idle for longer than this are probed before being handed out, in seconds
+POOL_CHECK_INTERVAL = 30.0
+# Files transferred by put_file/get_file are split among the channels by pieces of this size
+TRANSFER_CHUNK_SIZE = 64 * 1024 * 1024
+TRANSFER_MAX_CHANNELS = 4
+# Smaller files are just sent over scp, checking and chunking them costs more than sending them
+TRANSFER_DIRECT_MIN_SIZE = 8 * 1024 * 1024
+# Size of a single read/write of the transferred data, in bytes
+TRANSFER_BLOCK_SIZE = 1024 * 1024
+# Maximum bytes read from a single file by one poll of SSHMultiTail
+TAIL_MAX_READ = 8 * 1024 * 1024
+# Files with these extensions are already compressed, gzipping them on the wire is a waste of CPU
+TRANSFER_COMPRESSED_EXTENSIONS = {'.gz', '.tgz', '.bz2', '.xz', '.zip', '.rpm', '.jar', '.qcow2'}
+# Downloaded files bigger than this are not kept in the file cache, in bytes
+FILE_CACHE_MAX_SIZE = 64 * 1024 * 1024
+# Local port of the rails runner daemon on the appliance, see IPAppliance.deploy_rails_runner
+RAILS_RUNNER_PORT = 8193
+# The response of a one-off rails runner evaluation follows this marker
+RAILS_RUNNER_MARKER = 'RAILS_RUNNER_RESPONSE:'
+# Written by the rails runner daemon when it starts, only the requests carrying it are evaluated
+RAILS_RUNNER_TOKEN_FILE = '/root/rails_runner/token'
+
+
+class RubyResult(namedtuple('RubyResult', ['rc', 'output', 'value'])):
+    """Result of :py:meth:`SSHClient.run_ruby`, truthy if the code did not raise.
+
+    ``output`` holds what the code printed (and the error with the backtrace if it raised),
+    ``value`` is the JSON representation of the value of the code.
+    """
+    def __nonzero__(self):
+        return self.rc == 0
+    __bool__ = __nonzero__
 
 
 class SSHResult(namedtuple("SSHResult", ["rc", "output"])):
@@ -90,6 +138,379 @@ _ssh_pubkey_file = project_path.join('.generated_ssh_key.pub')
 _client_session = []
 
 
+class _OutputBuffer(object):
+    """Collects the command output, keeping only its last ``limit`` bytes if a limit is set."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.truncated = False
+        self._chunks = deque()
+        self._size = 0
+
+    def append(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        if self.limit:
+            while self._size - len(self._chunks[0]) >= self.limit:
+                self._size -= len(self._chunks.popleft())
+                self.truncated = True
+
+    def getvalue(self):
+        value = ''.join(self._chunks)
+        if self.limit and len(value) > self.limit:
+            self.truncated = True
+            return value[-self.limit:]
+        return value
+
+
+class _LineSplitter(object):
+    """Echoes the received data to the stream and hands it line by line to the callback."""
+
+    def __init__(self, callback=None, stream=None):
+        self.callback = callback
+        self.stream = stream
+        self._partial = ''
+
+    def feed(self, data):
+        if self.stream is not None:
+            self.stream.write(data)
+        if self.callback is None:
+            return
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.callback(line + '\n')
+
+    def flush(self):
+        if self.callback is not None and self._partial:
+            self.callback(self._partial)
+        self._partial = ''
+
+
+def _read_channel(channel, output, stdout, stderr, timeout=None):
+    """Reads the non-blocking channel until the remote command exits.
+
+    While there is nothing to read, the channel is waited on with ``select``, or on its exit status
+    once the remote side has sent EOF.
+
+    Raises:
+        :py:class:`socket.timeout` if nothing is received for ``timeout`` seconds.
+    """
+    deadline = time() + timeout if timeout else None
+    while True:
+        received = False
+        if channel.recv_ready():
+            data = channel.recv(RUNCMD_CHUNK)
+            output.append(data)
+            stdout.feed(data)
+            received = True
+        if channel.recv_stderr_ready():
+            data = channel.recv_stderr(RUNCMD_CHUNK)
+            output.append(data)
+            stderr.feed(data)
+            received = True
+        if received:
+            if deadline is not None:
+                deadline = time() + timeout
+            continue
+        if channel.exit_status_ready():
+            _drain_channel(channel, output, stdout, stderr)
+            return
+        remaining = None if deadline is None else deadline - time()
+        if remaining is not None and remaining <= 0:
+            raise socket.timeout('No output received in {} seconds'.format(timeout))
+        if channel.eof_received:
+            # The channel's fileno stays readable after EOF, select would return immediately
+            channel.status_event.wait(remaining)
+        else:
+            select.select([channel], [], [], remaining)
+
+
+def _drain_channel(channel, output, stdout, stderr):
+    """Reads what is left in the channel of a command that exited, until the remote side's EOF.
+
+    The exit status can arrive before the last of the output was checked for.
+    """
+    channel.settimeout(RUNCMD_DRAIN_TIMEOUT)
+    for recv, stream in ((channel.recv, stdout), (channel.recv_stderr, stderr)):
+        try:
+            for data in iter(lambda: recv(RUNCMD_CHUNK), b''):
+                output.append(data)
+                stream.feed(data)
+        except socket.timeout:
+            logger.warning('No EOF received in %s seconds after the command exited',
+                           RUNCMD_DRAIN_TIMEOUT)
+
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(TRANSFER_BLOCK_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _chunk_ranges(size, channels=None):
+    """Splits ``size`` bytes into (start, end) ranges, one per channel."""
+    if not size:
+        return [(0, 0)]
+    if channels is None:
+        channels = min(TRANSFER_MAX_CHANNELS, max(1, size // TRANSFER_CHUNK_SIZE))
+    step = -(-size // max(1, min(channels, size)))
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def _should_compress(path, compress):
+    if compress is not None:
+        return compress
+    return os_path.splitext(path)[1].lower() not in TRANSFER_COMPRESSED_EXTENSIONS
+
+
+def _run_threads(targets):
+    """Runs the callables in parallel threads, re-raises the first exception any of them raised."""
+    errors = []
+
+    def _wrap(target):
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+    threads = [Thread(target=_wrap, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+class _PooledTransport(object):
+    def __init__(self):
+        # The plain paramiko client performed the handshake and authentication, it is kept so it
+        # can be closed together with its transport
+        self.client = None
+        self.transport = None
+        self.borrowers = 0
+        self.last_used = time()
+        self.lock = RLock()
+
+    def connect(self, connect_kwargs):
+        self.close()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(**connect_kwargs)
+        self.client = client
+        self.transport = client.get_transport()
+        self.borrowers = 0
+
+    def close(self):
+        if self.client is not None:
+            with diaper:
+                self.client.close()
+        self.client = None
+        self.transport = None
+
+
+class SSHTransportPool(object):
+    """Process-wide pool of SSH transports shared by the :py:class:`SSHClient` instances.
+
+    The transports are keyed by ``(hostname, port, username)`` and a hash of the credentials, so a
+    client never gets a transport authenticated with credentials other than its own. paramiko
+    multiplexes the channels (commands, sftp, scp) of all the borrowing clients over the single
+    transport, so only the first client connecting to a host pays for the TCP and key exchange
+    handshakes.
+
+    Transports are checked before being handed out and closed once they are not borrowed by any
+    client for ``idle_timeout`` seconds. A dead transport is reconnected, unless other clients
+    still borrow it, then a new one replaces it in the pool and the old one is closed once given
+    back.
+
+    Args:
+        idle_timeout: Seconds after which an unused transport is closed.
+        check_interval: Transports idle for longer than this are probed with an ignore message.
+    """
+
+    def __init__(self, idle_timeout=POOL_IDLE_TIMEOUT, check_interval=POOL_CHECK_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._lock = RLock()
+        self._entries = {}
+
+    @staticmethod
+    def key(connect_kwargs):
+        pkey = connect_kwargs.get('pkey')
+        credentials = hashlib.sha1(repr((
+            connect_kwargs.get('password'), connect_kwargs.get('key_filename'),
+            pkey.get_fingerprint() if pkey is not None else None))).hexdigest()
+        return (
+            connect_kwargs['hostname'], connect_kwargs.get('port', 22),
+            connect_kwargs.get('username'), credentials)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _healthy(self, entry):
+        if not entry.transport.is_active():
+            return False
+        if time() - entry.last_used < self.check_interval:
+            return True
+        # Opening a session would count against the MaxSessions of sshd shared by the borrowers
+        try:
+            entry.transport.send_ignore()
+        except (paramiko.SSHException, socket.error, EOFError):
+            return False
+        return entry.transport.is_active()
+
+    def _entry(self, key):
+        with self._lock:
+            self._evict_idle()
+            if key not in self._entries:
+                self._entries[key] = _PooledTransport()
+            return self._entries[key]
+
+    def acquire(self, connect_kwargs, check_port=None):
+        """Returns an active transport for the connect kwargs, connecting if needed.
+
+        Every :py:meth:`acquire` must be paired with a :py:meth:`release` of the transport.
+        """
+        key = self.key(connect_kwargs)
+        while True:
+            entry = self._entry(key)
+            # Only the connections to the same host wait for each other's handshake
+            with entry.lock:
+                if self._entries.get(key) is not entry:
+                    # Evicted or replaced in the meantime
+                    continue
+                if entry.transport is not None and not self._healthy(entry):
+                    logger.info(
+                        'Pooled SSH transport to %s:%s as %s is dead, reconnecting', *key[:3])
+                    if entry.borrowers:
+                        # Leave the transport to its borrowers, release() closes it
+                        self._detach(key, entry)
+                        continue
+                    entry.close()
+                if entry.transport is None:
+                    if check_port is not None:
+                        check_port()
+                    entry.connect(connect_kwargs)
+                entry.borrowers += 1
+                entry.last_used = time()
+                return entry.transport
+
+    def _detach(self, key, entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def release(self, connect_kwargs, transport):
+        """Gives back the transport acquired by :py:meth:`acquire`."""
+        with self._lock:
+            entry = self._entries.get(self.key(connect_kwargs))
+        if entry is not None:
+            with entry.lock:
+                if entry.transport is transport:
+                    entry.borrowers = max(entry.borrowers - 1, 0)
+                    entry.last_used = time()
+                    return
+        # Replaced in the meantime, the transport is not pooled anymore
+        with diaper:
+            transport.close()
+
+    def _evict_idle(self):
+        now = time()
+        for key, entry in self._entries.items():
+            # Entries being acquired are busy, not idle
+            if not entry.lock.acquire(False):
+                continue
+            try:
+                if entry.transport is None or entry.borrowers:
+                    continue
+                if now - entry.last_used > self.idle_timeout or not entry.transport.is_active():
+                    logger.debug('Closing idle pooled SSH transport to %s:%s as %s', *key[:3])
+                    del self._entries[key]
+                    entry.close()
+            finally:
+                entry.lock.release()
+
+    def close(self, hostname=None):
+        """Closes the pooled transports (to the host if specified), borrowed ones included."""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if hostname is not None and key[0] != hostname:
+                    continue
+                del self._entries[key]
+                entry.close()
+
+
+ssh_pool = SSHTransportPool()
+
+
+class RemoteFileCache(object):
+    """Process-wide cache of the files downloaded by :py:meth:`SSHClient.get_file`.
+
+    The copies are keyed by the host and the remote path and they are valid as long as the inode,
+    size and mtime of the remote file stay the same, so a repeated download of an unchanged file
+    costs a single ``stat`` round trip and a local copy. Uploads and patches made through
+    :py:class:`SSHClient` invalidate the copies of the files they write.
+
+    Args:
+        max_size: Bigger files are not cached, in bytes.
+    """
+
+    def __init__(self, max_size=FILE_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._lock = RLock()
+        self._entries = {}
+        self._directory = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, stat, local_file):
+        """Copies the cached file to ``local_file`` if the remote one did not change.
+
+        Returns:
+            True if the file was copied from the cache.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or stat is None or entry[0] != stat:
+                return False
+            shutil.copyfile(entry[1], local_file)
+            return True
+
+    def store(self, key, stat, local_file):
+        """Keeps a copy of the just downloaded file, ``stat`` was taken before the download."""
+        if stat is None or not os_path.isfile(local_file) or \
+                os_path.getsize(local_file) > self.max_size:
+            self.invalidate(*key)
+            return
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='ssh_file_cache_')
+            cached_file = os_path.join(self._directory, hashlib.md5(repr(key)).hexdigest())
+            shutil.copyfile(local_file, cached_file)
+            self._entries[key] = (stat, cached_file)
+
+    def invalidate(self, host, remote_file=None):
+        """Drops the cached copies of the remote file, or of all the host's files."""
+        with self._lock:
+            for key in self._entries.keys():
+                if key[0] == host and remote_file in (None, key[1]):
+                    with diaper:
+                        os.remove(self._entries.pop(key)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+
+
+file_cache = RemoteFileCache()
+
+
 class SSHClient(paramiko.SSHClient):
     """paramiko.SSHClient wrapper
 
@@ -103,10 +524,16 @@ class SSHClient(paramiko.SSHClient):
             app and ``container`` then specifies the name of the pod to interact with.
         stdout: If specified, overrides the system stdout file for streaming output.
         stderr: If specified, overrides the system stderr file for streaming output.
+        pooled: Share the transport with the other clients connected to the same host, port, user
+            and credentials through :py:data:`ssh_pool` (default). Set to False to get a private
+            connection.
     """
     def __init__(self, stream_output=False, **connect_kwargs):
         super(SSHClient, self).__init__()
         self._streaming = stream_output
+        self._pooled = connect_kwargs.pop('pooled', True)
+        self._pooled_kwargs = None
+        self._rails_runner_token = None
         # deprecated/useless karg, included for backward-compat
         self._keystate = connect_kwargs.pop('keystate', None)
         # Container is used to store both docker VM's container name and Openshift pod name.
@@ -155,6 +582,7 @@ class SSHClient(paramiko.SSHClient):
         # Update a copy of this instance's connect kwargs with passed in kwargs,
         # then return a new instance with the updated kwargs
         new_connect_kwargs = dict(self._connect_kwargs)
+        new_connect_kwargs.setdefault('pooled', self._pooled)
         new_connect_kwargs.update(connect_kwargs)
         # pass the key state if the hostname is the same, under the assumption that the same
         # host will still have keys installed if they have already been
@@ -186,6 +614,15 @@ class SSHClient(paramiko.SSHClient):
     def close(self):
         with diaper:
             _client_session.remove(self)
+        self._disconnect()
+
+    def _disconnect(self):
+        """Drops the connection, the client stays tracked in the session to be reconnected"""
+        if self._pooled_kwargs is not None:
+            # The transport is shared, give it back to the pool instead of closing it
+            transport, self._transport = self._transport, None
+            ssh_pool.release(self._pooled_kwargs, transport)
+            self._pooled_kwargs = None
         super(SSHClient, self).close()
 
     @property
@@ -196,10 +633,20 @@ class SSHClient(paramiko.SSHClient):
         """See paramiko.SSHClient.connect"""
         if hostname and hostname != self._connect_kwargs['hostname']:
             self._connect_kwargs['hostname'] = hostname
-            self.close()
+            self._disconnect()
 
         if not self.connected:
             self._connect_kwargs.update(kwargs)
+            if self not in _client_session:
+                # Closed before, closed again at the end of the session once reconnected
+                _client_session.append(self)
+            if self._pooled:
+                if self._pooled_kwargs is not None:
+                    # The borrowed transport died, return it before borrowing a healthy one
+                    self._disconnect()
+                self._transport = ssh_pool.acquire(self._connect_kwargs, self._check_port)
+                self._pooled_kwargs = dict(self._connect_kwargs)
+                return
             self._check_port()
             # Only install ssh keys if they aren't installed (or currently being installed)
             return super(SSHClient, self).connect(**self._connect_kwargs)
@@ -218,17 +665,26 @@ class SSHClient(paramiko.SSHClient):
 
     def run_command(
             self, command, timeout=RUNCMD_TIMEOUT, reraise=False, ensure_host=False,
-            ensure_user=False):
+            ensure_user=False, output_limit=None, stdout_callback=None, stderr_callback=None):
         """Run a command over SSH.
 
+        The command's channel is waited on with ``select``, so long running commands do not keep
+        the CPU busy while they are not producing any output.
+
         Args:
             command: The command. Supports taking dicts as version picking.
-            timeout: Timeout after which the command execution fails.
+            timeout: Timeout after which the command execution fails if it does not produce any
+                output or exit.
             reraise: Does not muffle the paramiko exceptions in the log.
             ensure_host: Ensure that the command is run on the machine with the IP given, not any
                 container or such that we might be using by default.
             ensure_user: Ensure that the command is run as the user we logged in, so in case we are
                 not root, setting this to True will prevent from running sudo.
+            output_limit: If set, only the last ``output_limit`` bytes of the output are kept in
+                the result. Use with commands producing a lot of output, like log dumps.
+            stdout_callback: Called with every line (including the newline) of the stdout as soon
+                as it is received.
+            stderr_callback: Same as ``stdout_callback``, for the stderr.
 
         Returns:
             A :py:class:`SSHResult` instance.
@@ -236,54 +692,26 @@ class SSHClient(paramiko.SSHClient):
         if isinstance(command, dict):
             command = version.pick(command)
         original_command = command
-        uses_sudo = False
         logger.info("Running command %r", command)
-        if self.is_pod and not ensure_host:
-            # This command will be executed in the context of the host provider
-            command = 'oc rsh {} bash -c {}'.format(self._container, quote(
-                'source /etc/default/evm; ' + command))
-            ensure_host = True
-        elif self.is_container and not ensure_host:
-            command = 'docker exec {} bash -c {}'.format(self._container, quote(
-                'source /etc/default/evm; ' + command))
-
-        if self.username != 'root' and not ensure_user:
-            # We need sudo
-            command = 'sudo -i bash -c {command}'.format(command=quote(command))
-            uses_sudo = True
-
+        command, uses_sudo = self.wrap_command(
+            command, ensure_host=ensure_host, ensure_user=ensure_user)
         if command != original_command:
             logger.info("> Actually running command %r", command)
         command += '\n'
 
-        output = []
+        output = _OutputBuffer(output_limit)
+        stdout = _LineSplitter(stdout_callback, self.f_stdout if self._streaming else None)
+        stderr = _LineSplitter(stderr_callback, self.f_stderr if self._streaming else None)
         try:
             session = self.get_transport().open_session()
             if uses_sudo:
                 # We need a pseudo-tty for sudo
                 session.get_pty()
-            if timeout:
-                session.settimeout(float(timeout))
             session.exec_command(command)
-            stdout = session.makefile()
-            stderr = session.makefile_stderr()
-            while True:
-                if session.recv_ready:
-                    for line in stdout:
-                        output.append(line)
-                        if self._streaming:
-                            self.f_stdout.write(line)
-
-                if session.recv_stderr_ready:
-                    for line in stderr:
-                        output.append(line)
-                        if self._streaming:
-                            self.f_stderr.write(line)
-
-                if session.exit_status_ready():
-                    break
+            session.setblocking(0)
+            _read_channel(session, output, stdout, stderr, float(timeout) if timeout else None)
             exit_status = session.recv_exit_status()
-            return SSHResult(exit_status, ''.join(output))
+            return SSHResult(exit_status, output.getvalue())
         except paramiko.SSHException:
             if reraise:
                 raise
@@ -293,12 +721,88 @@ class SSHClient(paramiko.SSHClient):
             logger.exception(
                 "Command %r timed out. Output before it failed was:\n%r",
                 command,
-                ''.join(output))
+                output.getvalue())
             raise
+        finally:
+            stdout.flush()
+            stderr.flush()
+            if output.truncated:
+                logger.warning(
+                    'Output of command %r exceeded %s bytes, only its end was kept',
+                    original_command, output_limit)
 
         # Returning two things so tuple unpacking the return works even if the ssh client fails
         # Return whatever we have in the output
-        return SSHResult(1, ''.join(output))
+        return SSHResult(1, output.getvalue())
+
+    def wrap_command(self, command, ensure_host=False, ensure_user=False):
+        """Returns the command as :py:meth:`run_command` actually runs it.
+
+        The command is run in the container or the pod of the appliance (unless ``ensure_host``)
+        and through sudo if the user is not root (unless ``ensure_user``).
+
+        Returns:
+            A tuple of the command and whether it uses sudo, which needs a pseudo-tty.
+        """
+        uses_sudo = False
+        if self.is_pod and not ensure_host:
+            # This command will be executed in the context of the host provider
+            command = 'oc rsh {} bash -c {}'.format(self._container, quote(
+                'source /etc/default/evm; ' + command))
+        elif self.is_container and not ensure_host:
+            command = 'docker exec {} bash -c {}'.format(self._container, quote(
+                'source /etc/default/evm; ' + command))
+
+        if self.username != 'root' and not ensure_user:
+            # We need sudo
+            command = 'sudo -i bash -c {command}'.format(command=quote(command))
+            uses_sudo = True
+        return command, uses_sudo
+
+    def run_commands(self, commands, **kwargs):
+        """Run several commands in one remote shell invocation.
+
+        The commands run one after another in their own subshells (so an ``exit`` in one does not
+        stop the rest), their outputs (stderr merged into stdout) and return codes are separated
+        again using unique marker lines. This saves a session round trip per command.
+
+        Args:
+            commands: List of the commands, each supports taking dicts as version picking.
+            **kwargs: Passed to :py:meth:`run_command`.
+
+        Returns:
+            A list of :py:class:`SSHResult` instances, one per command. Commands that did not finish
+            (f.e. the batch timed out) get return code ``1`` and the output received so far.
+        """
+        commands = [
+            version.pick(command) if isinstance(command, dict) else command
+            for command in commands]
+        marker = 'SSHBATCH{}'.format(fauxfactory.gen_alphanumeric(16))
+        script = []
+        for i, command in enumerate(commands):
+            script.append("echo '{0}:start:{1}'; ( {2}\n) 2>&1; printf '\\n{0}:end:{1}:%s\\n' $?"
+                .format(marker, i, command))
+        batch = self.run_command('\n'.join(script), **kwargs)
+
+        results = [SSHResult(1, '') for command in commands]
+        current, lines = None, []
+        for line in batch.output.splitlines(True):
+            stripped = line.rstrip('\r\n')
+            if stripped.startswith(marker):
+                fields = stripped.split(':')
+                if fields[1] == 'start':
+                    current, lines = int(fields[2]), []
+                elif fields[1] == 'end' and current is not None:
+                    # Drop the newline printed in front of the end marker
+                    output = ''.join(lines)
+                    output = output[:-2] if output.endswith('\r\n') else output[:-1]
+                    results[current] = SSHResult(int(fields[3]), output)
+                    current = None
+            elif current is not None:
+                lines.append(line)
+        if current is not None:
+            results[current] = SSHResult(1, ''.join(lines))
+        return results
 
     def cpu_spike(self, seconds=60, cpus=2, **kwargs):
         """Creates a CPU spike of specific length and processes.
@@ -320,14 +824,250 @@ class SSHClient(paramiko.SSHClient):
         return self.run_command('cd /var/www/miq/vmdb; bin/rails runner {command}'.format(
             command=command), timeout=timeout, **kwargs)
 
+    def run_ruby(self, code, args=None, timeout=RUNCMD_TIMEOUT):
+        """Evaluates Ruby code in the Rails environment of the appliance.
+
+        If the rails runner daemon (see :py:meth:`utils.appliance.IPAppliance.deploy_rails_runner`)
+        listens on the appliance, the code is evaluated by a forked process of its already booted
+        Rails, which takes a fraction of a second. The requests carry the token the daemon wrote to
+        :py:data:`RAILS_RUNNER_TOKEN_FILE`, it is read over SSH once per client. Otherwise Rails is
+        booted for it by ``bin/rails runner``, the result is the same.
+
+        Args:
+            code: The Ruby code, ``args`` is available to it as a Hash.
+            args: A JSON serializable dictionary passed to the code.
+            timeout: Seconds to wait for the result.
+
+        Returns: A :py:class:`RubyResult`.
+        """
+        logger.info("Running ruby code %r", code)
+        request = {'code': code, 'args': args or {}}
+        response = self._rails_runner_request(request, timeout)
+        if response is not None and response.get('denied'):
+            # The daemon restarted with a new token
+            response = self._rails_runner_request(request, timeout, refresh_token=True)
+        if response is None or response.get('denied'):
+            response = self._rails_runner_once(json.dumps(request), timeout)
+        return RubyResult(response['rc'], response['output'], response['value'])
+
+    def _rails_runner_request(self, request, timeout, refresh_token=False):
+        """Sends the request to the rails runner daemon, returns None if it is not listening."""
+        if self.is_container or self.is_pod:
+            return None
+        try:
+            channel = self.get_transport().open_channel(
+                'direct-tcpip', ('127.0.0.1', RAILS_RUNNER_PORT), ('127.0.0.1', 0))
+        except paramiko.ChannelException:
+            return None
+        try:
+            if self._rails_runner_token is None or refresh_token:
+                result = self.run_command('cat {}'.format(RAILS_RUNNER_TOKEN_FILE))
+                self._rails_runner_token = result.output.strip() if result.success else None
+            if self._rails_runner_token is None:
+                return None
+            channel.settimeout(timeout)
+            channel.sendall(json.dumps(dict(request, token=self._rails_runner_token)) + '\n')
+            response = ''.join(iter(lambda: channel.recv(RUNCMD_CHUNK), ''))
+        finally:
+            channel.close()
+        if not response:
+            return {'rc': 1, 'output': 'The rails runner did not respond', 'value': None}
+        return json.loads(response)
+
+    def _rails_runner_once(self, request, timeout):
+        """Evaluates the request by the rails runner script in a newly booted Rails."""
+        script = '/tmp/rails_runner.rb'
+        self.put_file(data_path.join('bundles', 'rails_runner', 'rails_runner.rb').strpath, script)
+        # The request goes in a file, on the command line a big one (f.e. the whole settings)
+        # would hit the argument size limit, and anyone could read it in ps
+        request_file = '/tmp/rails_runner_request_{}.json'.format(
+            fauxfactory.gen_alphanumeric(16))
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            f.write(request)
+            f.flush()
+            self.put_file(f.name, request_file, skip_unchanged=False)
+        result = self.run_command(
+            'cd /var/www/miq/vmdb; bin/rails runner {script} --once {request}; rc=$?; '
+            'rm -f {request}; exit $rc'.format(script=script, request=quote(request_file)),
+            timeout=timeout)
+        for line in reversed(result.output.splitlines()):
+            if line.startswith(RAILS_RUNNER_MARKER):
+                return json.loads(line[len(RAILS_RUNNER_MARKER):])
+        return {'rc': result.rc or 1, 'output': result.output, 'value': None}
+
     def run_rake_command(self, command, timeout=RUNCMD_TIMEOUT, **kwargs):
         logger.info("Running rake command %r", command)
         return self.run_command(
             'cd /var/www/miq/vmdb; bin/rake -f /var/www/miq/vmdb/Rakefile {command}'.format(
                 command=command), timeout=timeout, **kwargs)
 
-    def put_file(self, local_file, remote_file='.', **kwargs):
+    def _direct_transfer(self, kwargs):
+        # The chunked transfers run plain commands on the host, so they can not go through sudo,
+        # containers or pods, and they handle single files only
+        plain_host = not (self.is_container or self.is_pod or kwargs.get('recursive'))
+        return self.username == 'root' and plain_host
+
+    def _remote_file_info(self, remote_file, base_name=None):
+        """Returns (path, size, md5) of the remote file, size and md5 are None if it is missing.
+
+        If ``remote_file`` is a directory, the file ``base_name`` in it is looked at. Only the
+        first ``size`` bytes are hashed, so the md5 matches what is downloaded of a growing file
+        (f.e. a log). The md5 of the files smaller than :py:const:`TRANSFER_DIRECT_MIN_SIZE` is
+        not computed (None).
+        """
+        script = 'f={}; '.format(quote(remote_file))
+        if base_name:
+            script += '[ -d "$f" ] && f="${{f%/}}"/{}; '.format(quote(base_name))
+        script += (
+            'echo "$f"; s=$(stat -L -c %s "$f") && echo "$s" && '
+            'if [ "$s" -ge {} ]; then head -c "$s" "$f" | md5sum; fi'.format(
+                TRANSFER_DIRECT_MIN_SIZE))
+        res = self.run_command(script)
+        lines = res.output.splitlines()
+        if res.rc != 0 or len(lines) < 2:
+            return (lines[0] if lines else remote_file), None, None
+        return lines[0], int(lines[1]), lines[2].split()[0] if len(lines) > 2 else None
+
+    def _put_range(self, local_file, remote_part, start, end, compress):
+        """Appends the ``start:end`` range of the local file to the remote part file."""
+        channel = self.get_transport().open_session()
+        try:
+            channel.exec_command('{} >> {}'.format(
+                'gunzip -c' if compress else 'cat', quote(remote_part)))
+            compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            with open(local_file, 'rb') as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    data = f.read(min(TRANSFER_BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    channel.sendall(compressor.compress(data) if compress else data)
+            if compress:
+                channel.sendall(compressor.flush())
+            channel.shutdown_write()
+            if channel.recv_exit_status() != 0:
+                raise Exception('Upload of {} failed: {}'.format(
+                    remote_part, channel.recv_stderr(RUNCMD_CHUNK)))
+        finally:
+            channel.close()
+
+    def _get_range(self, remote_file, local_part, start, end, compress):
+        """Appends the ``start:end`` range of the remote file to the local part file."""
+        command = 'tail -c +{} {} | head -c {}'.format(start + 1, quote(remote_file), end - start)
+        if compress:
+            command += ' | gzip -1 -c'
+        channel = self.get_transport().open_session()
+        try:
+            channel.exec_command(command)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            with open(local_part, 'ab') as f:
+                for data in iter(lambda: channel.recv(TRANSFER_BLOCK_SIZE), b''):
+                    f.write(decompressor.decompress(data) if compress else data)
+                if compress:
+                    f.write(decompressor.flush())
+            if channel.recv_exit_status() != 0:
+                raise Exception('Download of {} failed: {}'.format(
+                    remote_file, channel.recv_stderr(RUNCMD_CHUNK)))
+        finally:
+            channel.close()
+
+    def _put_chunked(self, local_file, remote_path, md5, compress, channels=None):
+        ranges = _chunk_ranges(os_path.getsize(local_file), channels)
+        parts = ['{}.part{}'.format(remote_path, i) for i in range(len(ranges))]
+        quoted_parts = ' '.join(quote(part) for part in parts)
+        # Parts left behind by an interrupted upload are resumed
+        res = self.run_command('for f in {}; do stat -c %s "$f" 2>/dev/null || echo 0; done'
+            .format(quoted_parts))
+        done = [int(size) for size in res.output.split()]
+        targets = []
+        for (start, end), part, part_done in zip(ranges, parts, done):
+            if part_done > end - start:
+                self.run_command('rm -f {}'.format(quote(part)))
+                part_done = 0
+            elif part_done:
+                logger.info('Resuming upload of %r from %s bytes', part, part_done)
+            if part_done < end - start or not end:
+                targets.append(
+                    lambda args=(local_file, part, start + part_done, end, compress):
+                    self._put_range(*args))
+        _run_threads(targets)
+        # The file is created with the default mode, scp used to keep the local one (f.e. +x)
+        res = self.run_command(
+            'cat {parts} > {f} && chmod {mode:o} {f} && rm -f {parts} && md5sum {f}'.format(
+                parts=quoted_parts, f=quote(remote_path),
+                mode=os.stat(local_file).st_mode & 0o7777))
+        if res.rc != 0 or res.output.split()[0] != md5:
+            self.run_command('rm -f {}'.format(quoted_parts))
+            raise Exception('Upload of {} to {} failed: {}'.format(
+                local_file, remote_path, res.output))
+
+    def _get_chunked(self, remote_path, local_file, size, md5, compress, channels=None):
+        ranges = _chunk_ranges(size, channels)
+        parts = ['{}.part{}'.format(local_file, i) for i in range(len(ranges))]
+        targets = []
+        for (start, end), part in zip(ranges, parts):
+            part_done = os_path.getsize(part) if os_path.isfile(part) else 0
+            if part_done > end - start:
+                os.remove(part)
+                part_done = 0
+            elif part_done:
+                logger.info('Resuming download of %r from %s bytes', part, part_done)
+            if part_done < end - start or not end:
+                targets.append(
+                    lambda args=(remote_path, part, start + part_done, end, compress):
+                    self._get_range(*args))
+        _run_threads(targets)
+        with open(local_file, 'wb') as f:
+            for part in parts:
+                with open(part, 'rb') as part_file:
+                    for block in iter(lambda: part_file.read(TRANSFER_BLOCK_SIZE), b''):
+                        f.write(block)
+                os.remove(part)
+        if _file_md5(local_file) != md5:
+            os.remove(local_file)
+            raise Exception('Download of {} to {} failed, checksum mismatch'.format(
+                remote_path, local_file))
+
+    def put_file(self, local_file, remote_file='.', skip_unchanged=True, compress=None,
+            channels=None, **kwargs):
+        """Uploads the local file.
+
+        Uploads of single files of at least :py:const:`TRANSFER_DIRECT_MIN_SIZE` by root to the
+        host itself go over ``channels`` parallel channels and resume the ``.part`` files left
+        behind by an interrupted upload, the rest use scp.
+
+        Args:
+            local_file: Path to the local file.
+            remote_file: Remote path (or directory) to upload the file to.
+            skip_unchanged: Do not upload the file if the remote one has the same size and md5.
+                Only checked for the files of at least :py:const:`TRANSFER_DIRECT_MIN_SIZE`, the
+                smaller ones are uploaded right away.
+            compress: Gzip the data on the wire. By default, unless the file is already compressed.
+            channels: Number of channels the file is split among. By default one per
+                :py:const:`TRANSFER_CHUNK_SIZE`, at most :py:const:`TRANSFER_MAX_CHANNELS`.
+            **kwargs: Passed to :py:meth:`scp.SCPClient.put`.
+        """
         logger.info("Transferring local file %r to remote %r", local_file, remote_file)
+        # The remote file can be a directory, drop the cached file of the same name in it as well
+        self.invalidate_file_cache(remote_file)
+        self.invalidate_file_cache(os_path.join(remote_file, os_path.basename(local_file)))
+        direct = self._direct_transfer(kwargs)
+        large = not kwargs.get('recursive') and \
+            os_path.getsize(local_file) >= TRANSFER_DIRECT_MIN_SIZE
+        if large and (skip_unchanged or direct):
+            remote_path, remote_size, remote_md5 = self._remote_file_info(
+                remote_file, os_path.basename(local_file))
+            md5 = _file_md5(local_file)
+            if skip_unchanged and remote_md5 == md5 and \
+                    remote_size == os_path.getsize(local_file):
+                logger.info('Remote file %r is up to date, not transferring it', remote_path)
+                return
+            if direct:
+                return self._put_chunked(
+                    local_file, remote_path, md5, _should_compress(local_file, compress),
+                    channels)
         if self.is_container:
             tempfilename = '/share/temp_{}'.format(fauxfactory.gen_alpha())
             logger.info('For this purpose, temporary file name is %r', tempfilename)
@@ -369,9 +1109,90 @@ class SSHClient(paramiko.SSHClient):
                                                                    remote_file=remote_file))
             return scp
 
-    def get_file(self, remote_file, local_path='', **kwargs):
+    def _file_cache_key(self, remote_file):
+        return (
+            (self._connect_kwargs['hostname'], self._connect_kwargs.get('port', 22),
+                self._container),
+            None if remote_file is None else os_path.normpath(remote_file))
+
+    def _remote_file_stat(self, remote_file):
+        """Returns the inode, size and mtime of the remote file, None if it is missing.
+
+        The mtime is in nanoseconds, so the rewrites within the same second are told apart.
+        """
+        res = self.run_command('stat -L -c "%i %s %y" {}'.format(quote(remote_file)))
+        stat = res.output.strip()
+        if res.rc != 0 or not stat or '\n' in stat:
+            return None
+        return stat
+
+    def invalidate_file_cache(self, remote_file=None):
+        """Drops the cached downloads of the remote file, or of all the files of this host.
+
+        Needed only when the file is changed in a way that keeps its inode, size and mtime.
+        """
+        file_cache.invalidate(*self._file_cache_key(remote_file))
+
+    def get_file(self, remote_file, local_path='', skip_unchanged=True, compress=None,
+            channels=None, use_cache=True, **kwargs):
+        """Downloads the remote file.
+
+        The same as :py:meth:`put_file` applies, the downloads by root from the host itself are
+        parallel and resumable, the rest use scp. Single files are kept in :py:data:`file_cache`,
+        repeated downloads of an unchanged file are served from it.
+
+        Args:
+            remote_file: Path to the remote file.
+            local_path: Local path (or directory) to download the file to.
+            skip_unchanged: Do not download the file if the local one has the same size and md5.
+            compress: Gzip the data on the wire. By default, unless the file is already compressed.
+            channels: Number of channels the file is split among, see :py:meth:`put_file`.
+            use_cache: Serve the file from the cache if it did not change since the last download.
+            **kwargs: Passed to :py:meth:`scp.SCPClient.get`.
+        """
+        if not use_cache or kwargs.get('recursive'):
+            return self._get_file(
+                remote_file, local_path, skip_unchanged, compress, channels, **kwargs)
+        if not local_path or os_path.isdir(local_path):
+            local_file = os_path.join(local_path, os_path.basename(remote_file))
+        else:
+            local_file = local_path
+        key = self._file_cache_key(remote_file)
+        stat = self._remote_file_stat(remote_file)
+        if file_cache.get(key, stat, local_file):
+            logger.info('Remote file %r did not change, copied it from the cache to %r',
+                remote_file, local_file)
+            return
+        result = self._get_file(
+            remote_file, local_path, skip_unchanged, compress, channels,
+            remote_size=int(stat.split()[1]) if stat else None, **kwargs)
+        file_cache.store(key, stat, local_file)
+        return result
+
+    def _get_file(self, remote_file, local_path, skip_unchanged, compress, channels,
+                  remote_size=None, **kwargs):
         logger.info("Transferring remote file %r to local %r", remote_file, local_path)
         base_name = os_path.basename(remote_file)
+        direct = self._direct_transfer(kwargs)
+        # Small files are just downloaded, the size is known already when the cache was checked
+        large = remote_size is None or remote_size >= TRANSFER_DIRECT_MIN_SIZE
+        if (skip_unchanged or direct) and large and not kwargs.get('recursive'):
+            if not local_path or os_path.isdir(local_path):
+                local_file = os_path.join(local_path, base_name)
+            else:
+                local_file = local_path
+            remote_path, remote_size, remote_md5 = self._remote_file_info(remote_file)
+            # Missing remote files are left to scp to fail on, small ones are not hashed
+            if remote_md5 is not None:
+                if skip_unchanged and os_path.isfile(local_file) and \
+                        os_path.getsize(local_file) == remote_size and \
+                        _file_md5(local_file) == remote_md5:
+                    logger.info('Local file %r is up to date, not transferring it', local_file)
+                    return
+                if direct:
+                    return self._get_chunked(
+                        remote_path, local_file, remote_size, remote_md5,
+                        _should_compress(remote_path, compress), channels)
         if self.is_container:
             tmp_file_name = 'temp_{}'.format(fauxfactory.gen_alpha())
             tempfilename = '/share/{}'.format(tmp_file_name)
@@ -465,6 +1286,7 @@ class SSHClient(paramiko.SSHClient):
                 logger.warning('MD5 sum check result: file has been changed!')
 
         # Create the backup and patch
+        self.invalidate_file_cache(remote_path)
         rc, out = self.run_command(
             'patch {} {} -f -b -z .bak'.format(remote_path, diff_remote_path))
         if rc != 0:
@@ -572,51 +1394,339 @@ class SSHClient(paramiko.SSHClient):
         return {"servers": servers, "workers": workers}
 
 
-class SSHTail(SSHClient):
+# Shell snippet sending the new data of one file followed by SSHMultiTail
+_TAIL_SCRIPT = """\
+set -- $(stat -L -c '%i %s' {file} 2>/dev/null || echo 0 -1)
+o={offset}
+if [ -n "{inode}" ] && [ "$1" != "{inode}" ]; then
+  r=$(find {dir} -maxdepth 1 -inum {inode} -print -quit 2>/dev/null)
+  if [ -n "$r" ]; then
+    n=$(( $(stat -c %s "$r") - o )); [ $n -lt 0 ] && n=0
+    printf '\\n{marker} {index} rotated\\n'; tail -c +$((o + 1)) "$r" | head -c $n
+  fi
+  o=0
+fi
+[ "$2" -lt "$o" ] && o=0
+n=$(( $2 - o )); [ $n -gt {limit} ] && n={limit}; [ $n -lt 0 ] && n=0
+printf '\\n{marker} {index} file %s %s %s %s\\n' "$1" "$2" "$o" "$n"
+tail -c +$((o + 1)) {file} | head -c $n
+"""
+
+
+class SSHMultiTail(SSHClient):
+    """Follows several remote files over one connection.
+
+    Each :py:meth:`poll` is a single command that stats all the files and sends the data appended
+    to them since the last poll. The files are tracked by their inode and offset:
+
+    * The rest of a rotated file is read under its new name (found by the inode in the same
+      directory) before the new file is followed from its start.
+    * Truncated files are followed from their start.
+
+    At most ``max_read`` bytes of each file are read per poll and the tail polls only when all the
+    lines read so far were consumed, so a slow consumer does not make it buffer whole logs.
+
+    The files are followed from their end at the time of the first poll (or
+    :py:meth:`set_initial_file_end`).
+
+    Usage:
+        .. code-block:: python
+
+          tail = SSHMultiTail(['/var/www/miq/vmdb/log/evm.log', '/var/log/messages'])
+          tail.set_initial_file_end()
+          # ...
+          for filename, line in tail:
+              print(filename, line)
+    """
+
+    def __init__(self, remote_filenames, max_read=TAIL_MAX_READ, **connect_kwargs):
+        super(SSHMultiTail, self).__init__(stream_output=False, **connect_kwargs)
+        self._remote_filenames = list(remote_filenames)
+        self.max_read = max_read
+        # filename: [inode, offset], inode None until the first poll
+        self._positions = {filename: [None, 0] for filename in self._remote_filenames}
+        self._partial = {filename: '' for filename in self._remote_filenames}
+        self._lines = deque()
+
+    def __iter__(self):
+        for filename, line in self.raw_lines():
+            yield filename, line.rstrip()
+
+    def _run_poll(self, script):
+        if self.username != 'root':
+            script = 'sudo -n bash -c {}'.format(quote(script))
+        channel = self.get_transport().open_session()
+        try:
+            channel.settimeout(RUNCMD_TIMEOUT)
+            channel.exec_command(script)
+            output = ''.join(iter(lambda: channel.recv(TRANSFER_BLOCK_SIZE), ''))
+            if channel.recv_exit_status() != 0:
+                raise Exception('Polling of {} failed: {}'.format(
+                    ', '.join(self._remote_filenames), channel.recv_stderr(RUNCMD_CHUNK)))
+            return output
+        finally:
+            channel.close()
+
+    def _add_data(self, filename, data, flush=False):
+        lines = (self._partial[filename] + data).split('\n')
+        self._partial[filename] = lines.pop()
+        if flush and self._partial[filename]:
+            # The unterminated last line of a rotated file is not going to be continued
+            lines.append(self._partial[filename])
+            self._partial[filename] = ''
+        self._lines.extend((filename, line + '\n') for line in lines)
+
+    def poll(self):
+        """Reads the new data of all the files and queues their complete lines.
+
+        Returns:
+            ``True`` if there may be more data to read right away (some file hit ``max_read``).
+        """
+        marker = 'SSHTAIL{}'.format(fauxfactory.gen_alphanumeric(16))
+        script = []
+        for index, filename in enumerate(self._remote_filenames):
+            inode, offset = self._positions[filename]
+            script.append(_TAIL_SCRIPT.format(
+                file=quote(filename), dir=quote(os_path.dirname(filename) or '.'),
+                inode='' if inode is None else inode, offset=offset, marker=marker, index=index,
+                limit=0 if inode is None else self.max_read))
+        output = self._run_poll('\n'.join(script))
+
+        more = False
+        # Every header is preceded by a newline, so the data of a file ends right before it
+        segments = output.split('\n{} '.format(marker))
+        for segment in segments[1:]:
+            header, _, data = segment.partition('\n')
+            fields = header.split()
+            filename = self._remote_filenames[int(fields[0])]
+            if fields[1] == 'rotated':
+                logger.info('Remote file %r was rotated', filename)
+                self._add_data(filename, data, flush=True)
+                continue
+            inode, size, offset, length = [int(field) for field in fields[2:]]
+            if self._positions[filename][0] is None:
+                # First poll, start at the end of the file
+                self._positions[filename] = [inode, max(size, 0)]
+                continue
+            if inode != self._positions[filename][0]:
+                # Replaced, whatever was left unterminated in the old file belongs to it
+                self._add_data(filename, '', flush=True)
+            elif offset < self._positions[filename][1]:
+                logger.info('Remote file %r was truncated', filename)
+                self._partial[filename] = ''
+            self._positions[filename] = [inode, offset + len(data)]
+            self._add_data(filename, data)
+            more = more or length >= self.max_read
+        return more
+
+    def raw_lines(self):
+        """Yields (filename, line) of the new complete lines, including the newlines."""
+        more = True
+        while True:
+            if not self._lines:
+                if not more:
+                    return
+                more = self.poll()
+                continue
+            yield self._lines.popleft()
+
+    def set_initial_file_end(self):
+        """Skips everything written to the files so far."""
+        for filename in self._remote_filenames:
+            self._positions[filename] = [None, 0]
+            self._partial[filename] = ''
+        self._lines.clear()
+        self.poll()
+
+
+class SSHTail(SSHMultiTail):
+    """Follows a single remote file, see :py:class:`SSHMultiTail`."""
 
     def __init__(self, remote_filename, **connect_kwargs):
-        super(SSHTail, self).__init__(stream_output=False, **connect_kwargs)
+        super(SSHTail, self).__init__([remote_filename], **connect_kwargs)
         self._remote_filename = remote_filename
-        self._sftp_client = None
-        self._remote_file_size = None
 
     def __iter__(self):
         for line in self.raw_lines():
             yield line.rstrip()
 
     def raw_lines(self):
-        with self as sshtail:
-            fstat = sshtail._sftp_client.stat(self._remote_filename)
-            if self._remote_file_size is not None:
-                if self._remote_file_size < fstat.st_size:
-                    remote_file = self._sftp_client.open(self._remote_filename, 'r')
-                    remote_file.seek(self._remote_file_size, 0)
-                    while (remote_file.tell() < fstat.st_size):
-                        line = remote_file.readline()  # Note the  missing rstrip() here!
-                        yield line
-            self._remote_file_size = fstat.st_size
+        for filename, line in super(SSHTail, self).raw_lines():
+            yield line
 
     def raw_string(self):
         return ''.join(self)
 
-    def __enter__(self):
-        self.connect(**self._connect_kwargs)
-        self._sftp_client = self.open_sftp()
-        return self
-
-    def __exit__(self, *args, **kwargs):
-        self._sftp_client.close()
-
-    def set_initial_file_end(self):
-        with self as sshtail:
-            fstat = sshtail._sftp_client.stat(self._remote_filename)
-            self._remote_file_size = fstat.st_size  # Seed initial size of file
-
     def lines_as_list(self):
         """Return lines as list"""
         return list(self)
 
 
+class SSHFanoutResult(namedtuple('SSHFanoutResult', ['host', 'result', 'error', 'elapsed'])):
+    """Outcome of an :py:class:`SSHFanout` operation on one host.
+
+    ``result`` is the return value of the operation (f.e. :py:class:`SSHResult`), ``error`` the
+    exception it raised (``None`` if it did not) and ``elapsed`` the time it took in seconds.
+    """
+    @property
+    def success(self):
+        if self.error is not None:
+            return False
+        return not isinstance(self.result, SSHResult) or self.result.success
+
+
+class _ChannelRecorder(object):
+    """Hands out proxies of a client's transport which remember the channels opened through them"""
+
+    def __init__(self, get_transport):
+        self._get_transport = get_transport
+        self.channels = []
+
+    def get_transport(self, *args, **kwargs):
+        return _RecordingTransport(self._get_transport(*args, **kwargs), self.channels)
+
+
+class _RecordingTransport(object):
+    def __init__(self, transport, channels):
+        self._transport = transport
+        self._channels = channels
+
+    def open_session(self, *args, **kwargs):
+        channel = self._transport.open_session(*args, **kwargs)
+        self._channels.append(channel)
+        return channel
+
+    def open_channel(self, *args, **kwargs):
+        channel = self._transport.open_channel(*args, **kwargs)
+        self._channels.append(channel)
+        return channel
+
+    def __getattr__(self, name):
+        return getattr(self._transport, name)
+
+
+class SSHFanout(object):
+    """Runs an operation on many hosts in parallel.
+
+    At most ``max_workers`` hosts are worked on at a time and each of them gets at most
+    ``host_timeout`` seconds from the moment its operation starts. The results are yielded in the
+    order the hosts finish; failures and timeouts are reported in the results instead of aborting
+    the rest of the batch.
+
+    Usage:
+        .. code-block:: python
+
+          fanout = SSHFanout(['10.0.0.1', '10.0.0.2'], username='root', password='secret')
+          for host_result in fanout.run_command('systemctl restart evmserverd'):
+              if not host_result.success:
+                  print('{} failed: {}'.format(host_result.host, host_result.error))
+
+    Args:
+        hosts: Hostnames, or dictionaries of connect kwargs overriding the common ones per host.
+        max_workers: Number of hosts worked on concurrently.
+        host_timeout: Seconds after which the operation on a host is aborted (by closing the
+            channels it opened) and reported as timed out. ``None`` means no limit.
+        **connect_kwargs: Common :py:class:`SSHClient` kwargs.
+    """
+
+    def __init__(self, hosts, max_workers=10, host_timeout=RUNCMD_TIMEOUT, **connect_kwargs):
+        self.hosts = [host if isinstance(host, dict) else {'hostname': host} for host in hosts]
+        self.max_workers = max_workers
+        self.host_timeout = host_timeout
+        self.connect_kwargs = connect_kwargs
+
+    def _call(self, func, index, started, channels):
+        kwargs = dict(self.connect_kwargs)
+        kwargs.update(self.hosts[index])
+        started[index] = time()
+        client = SSHClient(**kwargs)
+        recorder = _ChannelRecorder(client.get_transport)
+        channels[index] = recorder.channels
+        # The channels of the host's operation can be closed without touching the transport,
+        # which might be a pooled one shared with the other users of the host
+        client.get_transport = recorder.get_transport
+        try:
+            return func(client)
+        finally:
+            client.close()
+
+    def map(self, func):
+        """Calls ``func`` with an :py:class:`SSHClient` of each host.
+
+        Yields:
+            :py:class:`SSHFanoutResult` of each host as soon as the host is finished.
+        """
+        started, channels = {}, {}
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        # Keyed by the index, the same host can be listed more than once (f.e. as other users)
+        pending = {
+            executor.submit(self._call, func, index, started, channels): index
+            for index in range(len(self.hosts))}
+        try:
+            while pending:
+                wait_time = None
+                if self.host_timeout:
+                    deadlines = [
+                        started[index] + self.host_timeout
+                        for index in pending.values() if index in started]
+                    if len(deadlines) < len(pending):
+                        # Hosts starting in the meantime need their deadlines watched too
+                        deadlines.append(time() + 1)
+                    wait_time = max(min(deadlines) - time(), 0)
+                done, not_done = futures.wait(
+                    pending, timeout=wait_time, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    host = self.hosts[index]['hostname']
+                    elapsed = time() - started.get(index, time())
+                    try:
+                        yield SSHFanoutResult(host, future.result(), None, elapsed)
+                    except Exception as e:
+                        logger.error('Operation on %s failed: %s: %s', host, type(e).__name__, e)
+                        yield SSHFanoutResult(host, None, e, elapsed)
+                if not self.host_timeout:
+                    continue
+                for future, index in list(pending.items()):
+                    if index not in started or time() - started[index] < self.host_timeout:
+                        continue
+                    host = self.hosts[index]['hostname']
+                    logger.error('Operation on %s timed out after %s seconds', host,
+                        self.host_timeout)
+                    del pending[future]
+                    # Unblocks the worker thread stuck on the host
+                    for channel in channels.get(index, []):
+                        with diaper:
+                            channel.close()
+                    yield SSHFanoutResult(
+                        host, None,
+                        socket.timeout('Timed out after {} seconds'.format(self.host_timeout)),
+                        time() - started[index])
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def run_command(self, command, **kwargs):
+        """Runs the command on all the hosts, see :py:meth:`SSHClient.run_command`."""
+        return self.map(lambda client: client.run_command(command, **kwargs))
+
+    def put_file(self, local_file, remote_file='.', **kwargs):
+        """Uploads the file to all the hosts, see :py:meth:`SSHClient.put_file`."""
+        return self.map(lambda client: client.put_file(local_file, remote_file, **kwargs))
+
+    def get_file(self, remote_file, local_path='', **kwargs):
+        """Downloads the file from all the hosts into ``local_path/<hostname>/``.
+
+        See :py:meth:`SSHClient.get_file`.
+        """
+        def _get_file(client):
+            host_path = os_path.join(local_path, client._connect_kwargs['hostname'])
+            if not os_path.isdir(host_path):
+                makedirs(host_path)
+            return client.get_file(remote_file, host_path, **kwargs)
+        return self.map(_get_file)
+
+
 def keygen():
     """Generate temporary ssh keypair for appliance SSH auth
 
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from utils.appliance import IPAppliance
+from utils.appliance.group import ApplianceGroup, ApplianceGroupException, ApplianceSkipped
+
+
+@pytest.fixture
+def appliances():
+    return [IPAppliance(address) for address in ('10.0.0.1', '10.0.0.2', '10.0.0.3')]
+
+
+def test_appliance_group_respects_ordering(appliances):
+    primary, replica1, replica2 = appliances
+    started, finished = {}, {}
+
+    def operation(appliance, log_callback):
+        started[appliance] = time.time()
+        log_callback('working')
+        time.sleep(0.2)
+        finished[appliance] = time.time()
+        return appliance.address
+    group = ApplianceGroup(appliances, requires={replica1: [primary], replica2: [primary]})
+    results = group.map(operation)
+    assert [r.result for r in results.values()] == [a.address for a in appliances]
+    assert all(r.log == ['working'] for r in results.values())
+    assert started[replica1] >= finished[primary]
+    assert started[replica2] >= finished[primary]
+    # The replicas ran concurrently
+    assert started[replica2] < finished[replica1]
+
+
+def test_appliance_group_skips_dependents_of_failures(appliances):
+    primary, replica1, replica2 = appliances
+    ran = []
+
+    def operation(appliance, log_callback):
+        if appliance is primary:
+            raise ValueError('database setup failed')
+        ran.append(appliance)
+    group = ApplianceGroup(appliances, requires={replica1: [primary]})
+    with pytest.raises(ApplianceGroupException) as excinfo:
+        group.map(operation)
+    results = excinfo.value.results
+    assert isinstance(results[primary].error, ValueError)
+    assert isinstance(results[replica1].error, ApplianceSkipped)
+    assert results[replica2].success
+    assert ran == [replica2]
+
+
+def test_appliance_group_run_passes_kwargs(appliances, monkeypatch):
+    calls = {}
+
+    def fake_wait(self, timeout=900, log_callback=None):
+        calls[self] = timeout
+        log_callback('waited')
+    monkeypatch.setattr(IPAppliance, 'wait_for_web_ui', fake_wait)
+    results = ApplianceGroup(appliances).run(
+        'wait_for_web_ui', timeout=10, appliance_kwargs={appliances[0]: {'timeout': 20}})
+    assert calls == {appliances[0]: 20, appliances[1]: 10, appliances[2]: 10}
+    assert results[appliances[1]].log == ['waited']
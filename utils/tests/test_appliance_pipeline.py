@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from utils.appliance.pipeline import ConfigurationPipeline, PipelineException
+
+
+def test_pipeline_coalesces_restarts():
+    ran = []
+    pipeline = ConfigurationPipeline()
+    pipeline.add('ssh', lambda: ran.append('ssh'))
+    pipeline.add('pgssl', lambda: ran.append('pgssl'), requires=['ssh'], restart=True)
+    pipeline.add('cert', lambda: ran.append('cert'), requires=['ssh'], restart=True)
+    pipeline.add_restart('restart', lambda: ran.append('restart'))
+    pipeline.add('web_ui', lambda: ran.append('web_ui'), requires=['restart'])
+    pipeline.run()
+    assert ran[0] == 'ssh'
+    assert ran[-2:] == ['restart', 'web_ui']
+    assert ran.count('restart') == 1
+    assert set(pipeline.timings) == {'ssh', 'pgssl', 'cert', 'restart', 'web_ui'}
+
+
+def test_pipeline_skips_unneeded_restart():
+    ran = []
+    pipeline = ConfigurationPipeline()
+    pipeline.add('cert', lambda: False, restart=True)
+    pipeline.add_restart('restart', lambda: ran.append('restart'))
+    pipeline.run()
+    assert not ran
+
+
+def test_pipeline_stops_on_failure():
+    ran = []
+
+    def fail():
+        raise ValueError('step failed')
+    pipeline = ConfigurationPipeline()
+    pipeline.add('database', fail)
+    pipeline.add('web_ui', lambda: ran.append('web_ui'), requires=['database'])
+    with pytest.raises(ValueError):
+        pipeline.run()
+    assert not ran
+
+
+def test_pipeline_detects_cycles():
+    pipeline = ConfigurationPipeline()
+    pipeline.add('a', lambda: None, requires=['b'])
+    pipeline.add('b', lambda: None, requires=['a'])
+    with pytest.raises(PipelineException):
+        pipeline.run()
+
+
+def test_pipeline_rejects_unknown_requirements():
+    pipeline = ConfigurationPipeline()
+    pipeline.add('database', lambda: None, requires=['ssh', 'ntp'])
+    pipeline.add('ssh', lambda: None)
+    with pytest.raises(PipelineException):
+        pipeline.run()
+
+
+def test_pipeline_runs_steps_in_context():
+    entered = []
+
+    class Context(object):
+        def __enter__(self):
+            entered.append(threading.current_thread())
+
+        def __exit__(self, *args):
+            pass
+    pipeline = ConfigurationPipeline(context=Context())
+    pipeline.add('ssh', lambda: threading.current_thread())
+    pipeline.add('ntp', lambda: None, requires=['ssh'])
+    pipeline.run()
+    assert len(entered) == 2
+    assert threading.current_thread() not in entered
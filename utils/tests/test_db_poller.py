@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import func
+
+from utils.wait import TimedOutError
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+def test_db_poller_wakes_up_waiters(appliance):
+    servers = appliance.db['miq_servers']
+    count = appliance.db.session.query(func.count(servers.id))
+    assert appliance.db_poller.wait_for(count, scalar=True, num_sec=30) > 0
+    rows = appliance.db_poller.wait_for(
+        appliance.db.session.query(servers.guid).filter(servers.guid == appliance.guid),
+        num_sec=30)
+    assert rows[0][0] == appliance.guid
+
+
+def test_db_poller_times_out(appliance):
+    servers = appliance.db['miq_servers']
+    with pytest.raises(TimedOutError):
+        appliance.db_poller.wait_for(
+            appliance.db.session.query(servers.id).filter(servers.guid == 'no such guid'),
+            num_sec=3)
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
+from threading import Timer
 from urlparse import urlparse
 import pytest
 
 from fixtures.pytest_store import store
-from utils.appliance import IPAppliance
+from utils import ssh
+from utils.appliance import ApplianceException, IPAppliance
+from utils.appliance.services import SystemdWatcher
+from utils.wait import TimedOutError
 
 
 def test_ipappliance_from_address():
@@ -45,3 +49,88 @@ def test_context_hack(monkeypatch):
     with pytest.raises(ValueError):
         with ip_a:
             raise ValueError("test")
+
+
+def test_ipappliance_ssh_facts_cached_on_disk(monkeypatch):
+    address = '127.0.0.3'
+    monkeypatch.setattr(IPAppliance, '_ssh_host_key', 'hostkey1')
+    ip_a = IPAppliance(address)
+    ip_a._save_ssh_facts(
+        {name: ssh.SSHResult(0, name) for name in IPAppliance.SSH_FACT_COMMANDS})
+    # Another instance of the same appliance gets the facts without running the commands
+    assert IPAppliance(address).guid == 'guid'
+    # Redeployed on the same address
+    monkeypatch.setattr(IPAppliance, '_ssh_host_key', 'hostkey2')
+    assert IPAppliance(address)._load_ssh_facts() is None
+    monkeypatch.setattr(IPAppliance, '_ssh_host_key', 'hostkey1')
+    ip_a.invalidate_ssh_facts()
+    assert IPAppliance(address)._load_ssh_facts() is None
+
+
+def test_ipappliance_failed_ssh_facts_not_cached(monkeypatch):
+    class FakeSSHClient(object):
+        def run_commands(self, commands):
+            # Not configured yet, there is no VERSION
+            return [ssh.SSHResult(1, '') for command in commands]
+    monkeypatch.setattr(IPAppliance, '_ssh_host_key', 'hostkey')
+    ip_a = IPAppliance('127.0.0.4')
+    ip_a.ssh_client = FakeSSHClient()
+    assert ip_a.ssh_facts['version'].rc == 1
+    assert IPAppliance('127.0.0.4')._load_ssh_facts() is None
+
+
+def test_ipappliance_evmserverd_watcher(appliance):
+    with appliance.evmserverd.watch() as watcher:
+        watcher.wait_for_state('active', timeout=60)
+        assert appliance.wait_for_web_ui(timeout=60)
+    # Not known once the watcher is stopped
+    assert watcher.state is None
+
+
+def test_systemd_watcher_waits_for_changes():
+    watcher = SystemdWatcher(None, 'evmserverd')
+    Timer(0.2, watcher._changed, kwargs={'state': 'activating'}).start()
+    Timer(0.4, watcher._changed, kwargs={'marker': 'Server EVM started'}).start()
+    Timer(0.6, watcher._changed, kwargs={'state': 'active'}).start()
+    assert watcher.wait_for_change(0, timeout=5)
+    watcher.wait_for_state('active', timeout=5)
+    assert watcher.changes == 3
+    assert watcher.markers == ['Server EVM started']
+    assert not watcher.wait_for_change(3, timeout=0.1)
+    with pytest.raises(TimedOutError):
+        watcher.wait_for_state('failed', timeout=0.1)
+
+
+class FakeDbSSHClient(object):
+    def __init__(self, *results):
+        self.results = list(results)
+        self.commands = []
+
+    def run_command(self, command, **kwargs):
+        self.commands.append(command)
+        return self.results.pop(0)
+
+
+def test_ipappliance_database_snapshots(monkeypatch):
+    client = FakeDbSSHClient(
+        ssh.SSHResult(0, 'vmdb_snapshot_clean\nvmdb_snapshot_before_upgrade\n'))
+    monkeypatch.setattr(IPAppliance, 'db_ssh_client', client)
+    ip_a = IPAppliance('127.0.0.5', db_host='127.0.0.5')
+    assert ip_a.database_snapshots == {
+        'clean': 'vmdb_snapshot_clean', 'before_upgrade': 'vmdb_snapshot_before_upgrade'}
+    with pytest.raises(ValueError):
+        ip_a.delete_database_snapshot('Clean; DROP DATABASE vmdb_production')
+    assert len(client.commands) == 1
+
+
+def test_ipappliance_clone_database_retries_only_busy_databases(monkeypatch):
+    busy = ssh.SSHResult(
+        1, 'ERROR:  source database "vmdb_production" is being accessed by other users')
+    client = FakeDbSSHClient(busy, ssh.SSHResult(0, ''), ssh.SSHResult(1, 'ERROR:  disk full'))
+    monkeypatch.setattr(IPAppliance, 'db_ssh_client', client)
+    ip_a = IPAppliance('127.0.0.5', db_host='127.0.0.5')
+    ip_a._clone_database('vmdb_production', 'vmdb_snapshot_clean', lambda msg: None)
+    assert len(client.commands) == 2
+    with pytest.raises(ApplianceException):
+        ip_a._clone_database('vmdb_production', 'vmdb_snapshot_clean', lambda msg: None)
+    assert len(client.commands) == 3
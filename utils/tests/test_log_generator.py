@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from utils.log_generator import EVM_MESSAGE_MIX, EVM_WORKERS, ApplianceLogGenerator
+from utils.perf_message_stats import evm_to_messages, evm_to_workers, msg_filters, top_to_workers
+
+
+def test_log_generator_logs_are_parsed(tmpdir):
+    generator = ApplianceLogGenerator(seed=1, worker_restart_ratio=0.01)
+    evm_log = tmpdir.join('evm.log').strpath
+    top_log = tmpdir.join('top_output.log').strpath
+    generator.evm_log(evm_log, 256 * 1024)
+    generator.top_output_log(top_log, 64 * 1024)
+    with open(evm_log) as f:
+        lines = f.readlines()
+
+    messages, msg_cmds, test_start, test_end, line_count = evm_to_messages(evm_log, msg_filters)
+    assert line_count == len(lines)
+    assert len(messages) == sum('MIQ(MiqQueue.put)' in line for line in lines)
+    # The filters add suffixes like -hourly to the commands
+    assert {cmd.split('-')[0] for cmd in msg_cmds} <= set(EVM_MESSAGE_MIX)
+    assert any(times['total'] for times in msg_cmds.values())
+
+    workers, wkr_mem_exc, wkr_upt_exc, wkr_stp = evm_to_workers(evm_log)[:4]
+    restarts = wkr_mem_exc + wkr_upt_exc + wkr_stp
+    assert restarts > 0
+    assert len(workers) == sum(EVM_WORKERS.values()) + restarts
+    for worker_id, (worker_type, pid) in generator.workers.items():
+        assert workers[worker_id].worker_type == worker_type
+        assert workers[worker_id].pid == str(pid)
+
+    top_workers = top_to_workers(workers, top_log)[0]
+    assert top_workers
+    assert set(top_workers) <= set(generator.workers)
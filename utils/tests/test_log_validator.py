@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.log_validator import LogValidator
+
+pytestmark = [
+    pytest.mark.nondestructive,
+    pytest.mark.skip_selenium,
+]
+
+
+def validator(**patterns):
+    return LogValidator('/var/www/miq/vmdb/log/evm.log', hostname='localhost', **patterns)
+
+
+def test_log_validator_skip_beats_failure():
+    evm_tail = validator(
+        skip_patterns=['.*ERROR.*api_error.*'], failure_patterns=['.*ERROR.*'])
+    evm_tail.validate_lines(['INFO started', 'ERROR in api_error', 'INFO done'])
+    with pytest.raises(pytest.fail.Exception):
+        evm_tail.validate_lines(['ERROR something else'])
+
+
+def test_log_validator_matches_all_patterns_on_one_line():
+    evm_tail = validator(matched_patterns=['.*sso_enabled.*', '.*to true.*', r'(\w+) \1'])
+    evm_tail.validate_lines(['set sso_enabled to true', 'true true'])
+    assert sorted(evm_tail.matches) == sorted(evm_tail.matched_patterns)
+
+
+def test_log_validator_reports_missing_match():
+    evm_tail = validator(matched_patterns=['.*first.*', '.*second.*'])
+    with pytest.raises(pytest.fail.Exception):
+        evm_tail.validate_lines(['first line'])
+
+
+def test_log_validator_inline_flags_stay_in_their_pattern():
+    evm_tail = validator(failure_patterns=['(?i).*fatal.*', '.*ERROR.*'])
+    # (?i) would make the ERROR pattern case insensitive too in a combined alternation
+    evm_tail.validate_lines(['an error was logged'])
+    with pytest.raises(pytest.fail.Exception):
+        evm_tail.validate_lines(['FATAL crash'])
+
+
+def test_log_validator_picks_up_changed_patterns():
+    evm_tail = validator(failure_patterns=['.*ERROR.*'])
+    evm_tail.validate_lines(['WARN something'])
+    evm_tail.failure_patterns.append('.*WARN.*')
+    with pytest.raises(pytest.fail.Exception):
+        evm_tail.validate_lines(['WARN something'])
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.perf_message_stats import downsample_lines, lttb_indices
+
+
+@pytest.mark.parametrize('threshold', [0, 2, 10, 100])
+def test_lttb_keeps_short_series(threshold):
+    values = range(10)
+    assert list(lttb_indices(values, threshold)) == range(10)
+
+
+def test_lttb_keeps_peaks():
+    values = [0] * 1000
+    values[333] = 50
+    values[777] = -50
+    indices = lttb_indices(values, 50)
+    assert len(indices) == 50
+    assert indices[0] == 0
+    assert indices[-1] == 999
+    assert 333 in indices
+    assert 777 in indices
+    assert indices == sorted(indices)
+
+
+def test_downsample_lines_stay_aligned():
+    x_labels = [str(i) for i in range(5000)]
+    lines = {'up': range(5000), 'down': range(5000, 0, -1)}
+    new_x_labels, new_lines = downsample_lines(x_labels, lines, 1000)
+    assert len(new_x_labels) <= 1000
+    for line, values in new_lines.items():
+        assert len(values) == len(new_x_labels)
+        for label, value in zip(new_x_labels, values):
+            assert lines[line][int(label)] == value
+
+
+def test_downsample_lines_labels_samples():
+    x_labels, lines = downsample_lines([], {'total': [1.0] * 3000}, 100)
+    assert x_labels[0] == '1'
+    assert x_labels[-1] == '3000'
+    assert len(lines['total']) == len(x_labels)
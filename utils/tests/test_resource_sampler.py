@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from utils.resource_sampler import ResourceSampler
+
+
+def test_resource_sampler_parses_samples():
+    sampler = ResourceSampler(None)
+    first = sampler._parse('cpu  100 0 100 700 100 0 0 0 0 0|8000000 2000000|1.50|12|')
+    second = sampler._parse('cpu  150 0 150 750 150 0 0 0 0 0|8000000 4000000|1.25|14|42')
+    assert first.cpu is None
+    assert first.memory == 75.0
+    assert first.queue is None
+    assert second.cpu == 50.0
+    assert (second.load, second.workers, second.queue) == (1.25, 14, 42)
+    assert sampler._parse('garbage') is None
+    assert ResourceSampler.to_csv([second]).splitlines()[1].endswith(',50.0,50.0,1.25,14,42')
+
+
+def test_resource_sampler_stopped_while_connecting():
+    class FakeChannel(object):
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+        def exec_command(self, command):
+            raise AssertionError('The stopped sampler executed {}'.format(command))
+
+    class FakeAppliance(object):
+        channel = FakeChannel()
+        is_db_internal = False
+
+        def wrap_command(self, command):
+            # The database is external, the queue is not sampled
+            assert 'psql' not in command
+            return command, False
+
+        @property
+        def ssh_client(self):
+            return self
+
+        def get_transport(self):
+            return self
+
+        def open_session(self):
+            # Stopped while the session is being opened
+            sampler._stop_event.set()
+            return self.channel
+    appliance = FakeAppliance()
+    sampler = ResourceSampler(appliance)
+    sampler._sample()
+    assert appliance.channel.closed
+    assert sampler._channel is None
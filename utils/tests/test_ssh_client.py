@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import pytest
 
+from utils import ssh
+
 pytestmark = [
     pytest.mark.nondestructive,
     pytest.mark.skip_selenium,
@@ -26,3 +28,130 @@ def test_scp_client_can_put_a_file(appliance, tmpdir):
     assert "content" in tmpfile.read()
     # Clean up the server
     appliance.ssh_client.run_command("rm -f /tmp/{}".format(tmpfile.basename))
+
+
+def test_ssh_client_run_command_line_callbacks(appliance):
+    stdout_lines, stderr_lines = [], []
+    result = appliance.ssh_client.run_command(
+        'echo out1; echo err1 >&2; echo out2', ensure_user=True,
+        stdout_callback=stdout_lines.append, stderr_callback=stderr_lines.append)
+    assert result.success
+    assert stdout_lines == ['out1\n', 'out2\n']
+    assert stderr_lines == ['err1\n']
+    assert 'err1' in result
+
+
+def test_ssh_client_run_command_output_limit(appliance):
+    result = appliance.ssh_client.run_command('seq 1 100000; echo last', output_limit=1000)
+    assert result.success
+    assert len(result.output) == 1000
+    assert result.output.endswith('last\n')
+
+
+def test_ssh_clients_share_pooled_transport(appliance):
+    client = appliance.ssh_client()
+    private_client = appliance.ssh_client(pooled=False)
+    try:
+        assert client.get_transport() is appliance.ssh_client.get_transport()
+        assert private_client.get_transport() is not client.get_transport()
+        assert client.run_command('true').success
+    finally:
+        client.close()
+        private_client.close()
+    # Closing a pooled client only gives the transport back
+    assert appliance.ssh_client.run_command('true').success
+
+
+def test_ssh_client_run_commands(appliance):
+    results = appliance.ssh_client.run_commands(
+        ['echo first', 'printf second; exit 3', 'echo third >&2'])
+    assert [result.rc for result in results] == [0, 3, 0]
+    assert [result.output for result in results] == ['first\n', 'second', 'third\n']
+
+
+def test_ssh_fanout_run_command(appliance):
+    connect_kwargs = dict(appliance.ssh_client._connect_kwargs)
+    connect_kwargs.pop('hostname')
+    fanout = ssh.SSHFanout([appliance.hostname], host_timeout=60, **connect_kwargs)
+    results = list(fanout.run_command('echo Testing!'))
+    assert len(results) == 1
+    assert results[0].host == appliance.hostname
+    assert results[0].success
+    assert 'Testing!' in results[0].result
+
+
+def test_ssh_fanout_collects_failures(appliance):
+    # Pooled separately, the pooled transport to the appliance is authenticated by the right one
+    connect_kwargs = dict(appliance.ssh_client._connect_kwargs, password='wrong password')
+    connect_kwargs.pop('hostname')
+    results = list(ssh.SSHFanout([appliance.hostname], **connect_kwargs).run_command('true'))
+    # run_command reports the authentication failure as a failed command, it does not raise
+    assert not results[0].success
+    assert results[0].error is None
+    assert results[0].result.rc != 0
+
+
+def test_ssh_fanout_same_host_twice(appliance):
+    connect_kwargs = dict(appliance.ssh_client._connect_kwargs)
+    connect_kwargs.pop('hostname')
+    fanout = ssh.SSHFanout([appliance.hostname, appliance.hostname], **connect_kwargs)
+    results = list(fanout.run_command('echo Testing!'))
+    assert len(results) == 2
+    assert all(result.success for result in results)
+
+
+def test_scp_client_chunked_transfer(appliance, tmpdir):
+    tmpfile = tmpdir.join('chunked.txt')
+    # Big enough not to be sent over scp
+    tmpfile.write('content\n' * (ssh.TRANSFER_DIRECT_MIN_SIZE // 8 + 1000))
+    tmpfile.chmod(0o750)
+    appliance.ssh_client.put_file(str(tmpfile), '/tmp/chunked.txt', channels=3)
+    result = appliance.ssh_client.run_command('md5sum /tmp/chunked.txt')
+    assert result.output.split()[0] == tmpfile.computehash('md5')
+    assert appliance.ssh_client.run_command('stat -c %a /tmp/chunked.txt').output.strip() == '750'
+    download_dir = tmpdir.mkdir('download')
+    appliance.ssh_client.get_file('/tmp/chunked.txt', str(download_dir), channels=2)
+    assert download_dir.join('chunked.txt').read() == tmpfile.read()
+    # A file grown since the last download is downloaded whole again
+    appliance.ssh_client.run_command('echo appended >> /tmp/chunked.txt')
+    appliance.ssh_client.get_file(
+        '/tmp/chunked.txt', str(download_dir), channels=2, skip_unchanged=False, use_cache=False)
+    assert download_dir.join('chunked.txt').read() == tmpfile.read() + 'appended\n'
+    appliance.ssh_client.run_command('rm -f /tmp/chunked.txt')
+
+
+def test_ssh_multi_tail_follows_rotation(appliance):
+    files = ['/tmp/multitail_a.log', '/tmp/multitail_b.log']
+    appliance.ssh_client.run_command('echo old > {}; echo old > {}'.format(*files))
+    tail = ssh.SSHMultiTail(files, **appliance.ssh_client._connect_kwargs)
+    tail.set_initial_file_end()
+    appliance.ssh_client.run_command(
+        'echo a1 >> {0}; echo b1 >> {1}; mv {0} {0}.1; echo a2 > {0}'.format(*files))
+    assert list(tail) == [(files[0], 'a1'), (files[0], 'a2'), (files[1], 'b1')]
+    assert list(tail) == []
+    tail.close()
+    appliance.ssh_client.run_command('rm -f /tmp/multitail_*')
+
+
+def test_ssh_client_get_file_cache(appliance, tmpdir):
+    client = appliance.ssh_client
+    client.run_command('echo first > /tmp/cached.txt')
+    client.get_file('/tmp/cached.txt', str(tmpdir.join('first.txt')))
+    assert len(ssh.file_cache)
+    # Served from the cache, the local file is not compared with the remote one
+    client.get_file('/tmp/cached.txt', str(tmpdir.join('second.txt')), skip_unchanged=False)
+    assert tmpdir.join('second.txt').read() == 'first\n'
+    upload = tmpdir.join('cached.txt')
+    upload.write('uploaded\n')
+    client.put_file(str(upload), '/tmp/')
+    client.get_file('/tmp/cached.txt', str(tmpdir.join('third.txt')))
+    assert tmpdir.join('third.txt').read() == 'uploaded\n'
+    client.run_command('rm -f /tmp/cached.txt')
+
+
+def test_ssh_client_run_ruby(appliance):
+    result = appliance.ssh_client.run_ruby('puts "printed"; args["a"] * 2', args={'a': 21})
+    assert result
+    assert result.value == 42
+    assert 'printed' in result.output
+    assert not appliance.ssh_client.run_ruby('raise "broken"')
@@ -84,6 +84,10 @@ class variable(object):
             return method(obj, *args, **kwargs)
         return caller
 
+    def is_default(self, name):
+        """Whether the variant registered under the name is the default one."""
+        return name in self._mapping and self._mapping[name] is self._mapping.get(_default)
+
     def variant(self, *names):
         """Register a new variant of a method under a name."""
         def g(f):